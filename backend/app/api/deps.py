@@ -1,33 +1,64 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
-from app.database import get_db
+from app.database import AsyncSessionLocal, get_async_db
+from app.core.auth_cache import Principal, token_cache
 from app.core.config import settings
 from app.models.user import User
 from app.schemas.user import TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def authenticate_token(token: str) -> Optional[Principal]:
+    """Resolve a JWT to its principal, from the token cache when possible"""
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
+    
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            return None
         token_data = TokenData(username=username)
     except JWTError:
-        raise credentials_exception
+        return None
+    
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(User.id, User.username).where(User.username == token_data.username)
+        )
+        row = result.first()
+    if row is None:
+        return None
     
-    user = db.query(User).filter(User.username == token_data.username).first()
+    principal = Principal(row.id, row.username)
+    token_cache.set(token, principal, payload)
+    return principal
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    principal = await authenticate_token(token)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+async def get_current_user(
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(get_current_principal)
+) -> User:
+    """Load the full ORM User; prefer get_current_principal when id/username suffice"""
+    user = await db.get(User, principal.id)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
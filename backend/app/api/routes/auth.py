@@ -1,27 +1,37 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.schemas.user import UserCreate, User as UserSchema, Token
-from app.services.user_service import UserService
+from app.services.user_service import AsyncUserService
+from app.core.rate_limit import rate_limiter
 from app.core.security import create_access_token
 from app.core.config import settings
 
 router = APIRouter()
 
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
 @router.post("/register", response_model=UserSchema, status_code=status.HTTP_201_CREATED)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(request: Request, user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
-    return UserService.create_user(db=db, user=user)
+    await rate_limiter.enforce(("register_ip", client_ip(request)))
+    return await AsyncUserService.create_user(db=db, user=user)
 
 @router.post("/login", response_model=Token)
-def login(
-    db: Session = Depends(get_db),
+async def login(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
     """Login and get access token"""
-    user = UserService.authenticate_user(db, form_data.username, form_data.password)
+    await rate_limiter.enforce(
+        ("login_ip", client_ip(request)),
+        ("login_username", form_data.username.lower()),
+    )
+    user = await AsyncUserService.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,54 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.database import get_db
-from app.api.deps import get_current_user
-from app.models.user import User
-from app.schemas.channel import Channel, ChannelCreate, ChannelWithMembers
-from app.services.channel_service import ChannelService
+from app.database import get_async_db
+from app.api.deps import get_current_principal
+from app.core.auth_cache import Principal
+from app.schemas.channel import (
+    Channel, ChannelCreate, ChannelPresence, ChannelRetention, ChannelRetentionUpdate, ChannelSummary,
+    ChannelUnread, ReadMarkerUpdate
+)
+from app.services.channel_service import AsyncChannelService
+from app.services.membership import membership_index
+from app.services.read_markers import read_markers
+from app.websocket.connection_manager import manager
+from app.websocket.presence import presence
 
 router = APIRouter()
 
 @router.post("/", response_model=Channel, status_code=status.HTTP_201_CREATED)
-def create_channel(
+async def create_channel(
     channel: ChannelCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Create a new channel"""
-    return ChannelService.create_channel(db, channel, current_user.id)
+    return await AsyncChannelService.create_channel(db, channel, current_user.id)
 
-@router.get("/", response_model=List[Channel])
-def get_my_channels(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.get("/", response_model=List[ChannelSummary])
+async def get_my_channels(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Get all channels where current user is a member"""
-    return ChannelService.get_channels(db, current_user.id)
+    """Get all channels where current user is a member, with member counts and last messages"""
+    return await AsyncChannelService.get_channels(db, current_user.id)
 
-@router.get("/{channel_id}", response_model=Channel)
-def get_channel(
+@router.get("/presence", response_model=List[ChannelPresence])
+async def get_presence(
+    channel_ids: List[int] = Query(..., description="Channels to report, repeat for several"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Who is online in each of several channels the user belongs to"""
+    member_of = await membership_index.channel_ids(current_user.id, db)
+    online = presence.online_in_channels(c for c in channel_ids if c in member_of)
+    return [
+        {
+            "channel_id": channel_id,
+            "users": [{"user_id": user_id, "status": status} for user_id, status in users.items()],
+        }
+        for channel_id, users in online.items()
+    ]
+
+@router.get("/unread", response_model=List[ChannelUnread])
+async def get_unread(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Unread message counts for all of the user's channels"""
+    return await read_markers.unread(db, current_user.id)
+
+@router.get("/{channel_id}", response_model=ChannelSummary)
+async def get_channel(
     channel_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get a specific channel"""
-    return ChannelService.get_channel(db, channel_id)
+    return await AsyncChannelService.get_channel(db, channel_id)
 
-@router.post("/{channel_id}/join", response_model=Channel)
-def join_channel(
+@router.post("/{channel_id}/join", response_model=ChannelSummary)
+async def join_channel(
     channel_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Join a channel"""
-    return ChannelService.join_channel(db, channel_id, current_user.id)
+    return await AsyncChannelService.join_channel(db, channel_id, current_user.id)
 
 @router.post("/{channel_id}/leave")
-def leave_channel(
+async def leave_channel(
     channel_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Leave a channel"""
-    return ChannelService.leave_channel(db, channel_id, current_user.id)
+    result = await AsyncChannelService.leave_channel(db, channel_id, current_user.id)
+    await manager.remove_from_channel(channel_id, current_user.id)
+    return result
+
+@router.post("/{channel_id}/read", status_code=status.HTTP_204_NO_CONTENT)
+async def mark_read(
+    channel_id: int,
+    marker: ReadMarkerUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Mark a channel read up to a message (by default, its newest)"""
+    if not await membership_index.is_member(current_user.id, channel_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a member of this channel"
+        )
+    message_id = marker.message_id
+    if message_id is None:
+        channel = await AsyncChannelService.get_channel(db, channel_id)
+        message_id = channel.last_message.id if channel.last_message else 0
+    elif not await read_markers.accepts(channel_id, message_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="message_id is not a message in this channel"
+        )
+    read_markers.mark(current_user.id, channel_id, message_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.get("/{channel_id}/retention", response_model=ChannelRetention)
+async def get_retention(
+    channel_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """The channel's retention policy and archived history"""
+    if not await membership_index.is_member(current_user.id, channel_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a member of this channel"
+        )
+    return await AsyncChannelService.get_retention(db, channel_id)
+
+@router.put("/{channel_id}/retention", response_model=ChannelRetention)
+async def set_retention(
+    channel_id: int,
+    policy: ChannelRetentionUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Set how long messages stay in the channel's live history (creator only)"""
+    return await AsyncChannelService.set_retention(db, channel_id, current_user.id, policy)
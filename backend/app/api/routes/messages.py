@@ -1,36 +1,146 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
-from app.api.deps import get_current_user
-from app.models.user import User
-from app.schemas.message import Message
-from app.services.message_service import MessageService
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from app.database import get_async_db
+from app.api.deps import get_current_principal
+from app.core.auth_cache import Principal
+from app.schemas.message import Message, MessagePage, MessageSearchPage
+from app.schemas.transfer import TransferStatus
+from app.services.channel_cache import channel_cache
+from app.services.membership import membership_index
+from app.services.message_service import AsyncMessageService
+from app.services.search_service import AsyncSearchService
+from app.services.transfer_service import MEDIA_TYPES, AsyncTransferService, transfers
 
 router = APIRouter()
 
 @router.get("/channels/{channel_id}/messages", response_model=List[Message])
-def get_channel_messages(
+async def get_channel_messages(
     channel_id: int,
     limit: int = Query(50, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get messages for a specific channel"""
-    messages = MessageService.get_channel_messages(db, channel_id, limit, offset)
-    
-    # Add username to each message
-    result = []
-    for msg in messages:
-        message_dict = {
-            "id": msg.id,
-            "content": msg.content,
-            "user_id": msg.user_id,
-            "username": msg.user.username,
-            "channel_id": msg.channel_id,
-            "created_at": msg.created_at
-        }
-        result.append(message_dict)
-    
-    return result
+    messages = await AsyncMessageService.get_channel_messages(db, channel_id, limit, offset)
+    return [to_message_dict(msg) for msg in messages]
+
+@router.get("/channels/{channel_id}/messages/history", response_model=MessagePage)
+async def get_channel_history(
+    channel_id: int,
+    limit: int = Query(50, ge=1, le=100),
+    before: Optional[str] = Query(None, description="Cursor: return older messages"),
+    after: Optional[str] = Query(None, description="Cursor: return newer messages"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Get channel history with cursor pagination (stable under new messages)"""
+    messages, next_cursor = await AsyncMessageService.get_channel_messages_page(
+        db, channel_id, limit, before=before, after=after
+    )
+    return {"items": [to_message_dict(msg) for msg in messages], "next_cursor": next_cursor}
+
+@router.get("/channels/{channel_id}/messages/search", response_model=MessageSearchPage)
+async def search_channel_messages(
+    channel_id: int,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Search a channel's messages, best matches first"""
+    if not await membership_index.is_member(current_user.id, channel_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a member of this channel"
+        )
+    messages, next_cursor = await AsyncSearchService.search(db, q, [channel_id], limit, cursor)
+    return {"items": [to_message_dict(msg) for msg in messages], "next_cursor": next_cursor}
+
+@router.get("/messages/search", response_model=MessageSearchPage)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    channel_ids: Optional[List[int]] = Query(None, description="Only these channels; default all of yours"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Search messages across the channels the user belongs to"""
+    member_of = await membership_index.channel_ids(current_user.id, db)
+    if channel_ids:
+        member_of = member_of.intersection(channel_ids)
+    messages, next_cursor = await AsyncSearchService.search(db, q, sorted(member_of), limit, cursor)
+    return {"items": [to_message_dict(msg) for msg in messages], "next_cursor": next_cursor}
+
+@router.get("/channels/{channel_id}/messages/export")
+async def export_channel_messages(
+    channel_id: int,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Stream a channel's whole history, oldest first; progress at /transfers/{X-Transfer-Id}"""
+    # No request-scoped session: the export opens its own for as long as it streams
+    if not await membership_index.is_member(current_user.id, channel_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a member of this channel"
+        )
+    transfer = transfers.start("export", current_user.id, channel_id, format)
+    return StreamingResponse(
+        AsyncTransferService.export_messages(channel_id, format, transfer),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="channel-{channel_id}.{format}"',
+            "X-Transfer-Id": transfer.id,
+        },
+    )
+
+@router.post("/channels/{channel_id}/messages/import", response_model=TransferStatus)
+async def import_channel_messages(
+    channel_id: int,
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Bulk-load messages (NDJSON or CSV, e.g. an export) into a channel you created"""
+    channel = await channel_cache.get(channel_id)
+    if channel is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Channel not found"
+        )
+    if channel.created_by != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the channel creator can import messages"
+        )
+    length = request.headers.get("content-length")
+    transfer = transfers.start(
+        "import", current_user.id, channel_id, format, int(length) if length and length.isdigit() else None
+    )
+    await AsyncTransferService.import_messages(channel_id, format, request.stream(), transfer)
+    return transfer.to_dict()
+
+@router.get("/transfers", response_model=List[TransferStatus])
+async def list_transfers(current_user: Principal = Depends(get_current_principal)):
+    """The user's running and recent exports and imports on this worker"""
+    return [transfer.to_dict() for transfer in transfers.for_user(current_user.id)]
+
+@router.get("/transfers/{transfer_id}", response_model=TransferStatus)
+async def get_transfer(transfer_id: str, current_user: Principal = Depends(get_current_principal)):
+    """Progress of an export or import"""
+    transfer = transfers.get(transfer_id, current_user.id)
+    if transfer is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Transfer not found"
+        )
+    return transfer.to_dict()
+
+def to_message_dict(row) -> dict:
+    """Turn a history row (message columns plus username) into a response dict"""
+    return dict(row._mapping)
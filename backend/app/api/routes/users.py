@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.schemas.user import User as UserSchema
 from app.api.deps import get_current_user
 from app.models.user import User
@@ -8,6 +8,6 @@ from app.models.user import User
 router = APIRouter()
 
 @router.get("/me", response_model=UserSchema)
-def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: User = Depends(get_current_user)):
     """Get current user"""
     return current_user
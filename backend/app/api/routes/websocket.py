@@ -1,97 +1,322 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from typing import List, Optional
+from app.api.deps import authenticate_token
+from app.core.auth_cache import Principal
+from app.core.rate_limit import rate_limiter
+from app.database import AsyncSessionLocal
 from app.websocket.connection_manager import manager
-from app.models.user import User
-from app.services.message_service import MessageService
+from app.websocket.presence import CLIENT_STATUSES, presence
+from app.websocket.wire import Codec, negotiate
+from app.services.membership import membership_index
+from app.services.message_service import AsyncMessageService
+from app.services.message_writer import message_writer
+from app.services.read_markers import read_markers
+from app.services.user_service import username_cache
 from app.schemas.message import MessageCreate
-from jose import JWTError, jwt
 from app.core.config import settings
 from datetime import datetime
-import json
+import asyncio
+import logging
+import time
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-async def get_user_from_token(token: str, db: Session) -> User:
+# Broadcasts waiting for their write-behind batch to commit
+pending_broadcasts = set()
+
+async def get_user_from_token(token: str) -> Optional[Principal]:
     """Get user from JWT token"""
+    return await authenticate_token(token)
+
+def message_event(message_id: int, content: str, user_id: int, username: str, channel_id: int, created_at: datetime) -> dict:
+    """The frame broadcast for a chat message"""
+    return {
+        "type": "message",
+        "id": message_id,
+        "content": content,
+        "username": username,
+        "user_id": user_id,
+        "channel_id": channel_id,
+        "timestamp": created_at.isoformat()
+    }
+
+async def load_missed_messages(channel_id: int, after_message_id: int, limit: int) -> List[dict]:
+    """Replay fallback for gaps older than the in-memory buffer"""
+    async with AsyncSessionLocal() as db:
+        rows = await AsyncMessageService.get_messages_after(db, channel_id, after_message_id, limit)
+    return [
+        message_event(row.id, row.content, row.user_id, row.username, row.channel_id, row.created_at)
+        for row in rows
+    ]
+
+manager.replay.fallback = load_missed_messages
+
+async def broadcast_when_saved(saved: asyncio.Future, content: str, user: Principal, channel_id: int):
+    """Broadcast a chat message once its batch has been committed"""
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-    except JWTError:
-        return None
+        db_message = await saved
+    except Exception:
+        logger.exception("Error saving message from user %s", user.id)
+        return
+    
+    broadcast_message = message_event(
+        db_message.id, content, user.id, user.username, channel_id, db_message.created_at
+    )
+    await manager.broadcast_to_channel(broadcast_message, channel_id)
+    # Everything up to your own message counts as read
+    read_markers.mark(user.id, channel_id, db_message.id)
+
+async def receive_frame(websocket: WebSocket, codec: Codec) -> dict:
+    """Read and decode the next inbound frame (text or binary)"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    data = message.get("text")
+    return codec.decode(data if data is not None else message.get("bytes"))
+
+def presence_event(event_type: str, username: str, channel_id: int) -> dict:
+    """The system frame broadcast when a user joins or leaves a channel"""
+    action = "joined" if event_type == "user_joined" else "left"
+    return {
+        "type": event_type,
+        "content": f"{username} {action} the channel",
+        "username": "System",
+        "channel_id": channel_id,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+async def handle_chat_message(websocket: WebSocket, user: Principal, channel_id: int, content: str):
+    """Save a chat message, batched with other sockets' messages, and broadcast it"""
+    retry_after = await rate_limiter.check(
+        ("message_user", user.id),
+        ("message_channel", channel_id),
+        ("message_ip", websocket.client.host if websocket.client else "unknown"),
+    )
+    if retry_after:
+        # Over the limit: drop this message but keep the socket open
+        manager.send_frame(websocket, {
+            "type": "error",
+            "code": "rate_limited",
+            "channel_id": channel_id,
+            "retry_after": round(retry_after, 3),
+            "detail": "Sending too fast, message not delivered",
+        })
+        return
+    
+    message_create = MessageCreate(content=content, channel_id=channel_id)
+    saved = await message_writer.submit(message_create, user.id)
+    
+    broadcast = broadcast_when_saved(saved, message_create.content, user, channel_id)
+    if settings.MESSAGE_WRITE_MODE == "write_behind":
+        # Keep reading; the broadcast goes out when the batch commits
+        task = asyncio.create_task(broadcast)
+        pending_broadcasts.add(task)
+        task.add_done_callback(pending_broadcasts.discard)
+    else:
+        await broadcast
+
+async def release_socket(websocket: WebSocket, user: Principal, channel_ids: List[int]):
+    """Forget a socket that is gone, however its handler ended.
     
-    user = db.query(User).filter(User.username == username).first()
-    return user
+    Tells each of its channels the user left, unless another of their
+    devices is still there.
+    """
+    manager.disconnect_socket(websocket)
+    presence.disconnected(user.id, channel_ids)
+    for channel_id in channel_ids:
+        if not manager.is_user_online(user.id, channel_id):
+            await manager.broadcast_to_channel(presence_event("user_left", user.username, channel_id), channel_id)
 
 @router.websocket("/ws/{channel_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
     channel_id: int,
     token: str = Query(...),
+    last_id: Optional[int] = Query(None, description="Last message id seen, to replay what was missed"),
 ):
-    # Get database session
-    db = next(get_db())
+    started = time.perf_counter()
+    # Authenticate user
+    user = await get_user_from_token(token)
+    if not user:
+        await websocket.close(code=1008)  # Policy violation
+        return
+    
+    # Only members may join a channel's socket
+    if not await membership_index.is_member(user.id, channel_id):
+        await websocket.close(code=1008)
+        return
     
+    connected = False
     try:
-        # Authenticate user
-        user = await get_user_from_token(token, db)
-        if not user:
-            await websocket.close(code=1008)  # Policy violation
-            return
-        
-        # Connect to channel
-        await manager.connect(websocket, channel_id, user.id)
+        # Connect to channel; the user may already be here on another device
+        codec = negotiate(websocket.scope.get("subprotocols", []))
+        already_here = manager.is_user_online(user.id, channel_id)
+        await manager.connect(websocket, channel_id, user.id, last_message_id=last_id, codec=codec)
+        manager.record_connect(time.perf_counter() - started)
+        username_cache.set(user.id, user.username)
+        presence.connected(user.id, user.username)
+        presence.subscribed(user.id, channel_id)
+        connected = True
         
         # Broadcast user joined
-        join_message = {
-            "type": "user_joined",
-            "content": f"{user.username} joined the channel",
-            "username": "System",
-            "channel_id": channel_id,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        await manager.broadcast_to_channel(join_message, channel_id)
+        if not already_here:
+            await manager.broadcast_to_channel(presence_event("user_joined", user.username, channel_id), channel_id)
         
         # Listen for messages
         while True:
             # Receive message from client
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            try:
+                message_data = await receive_frame(websocket, codec)
+            except ValueError:
+                manager.send_frame(websocket, {"type": "error", "detail": "Malformed frame"})
+                continue
+            presence.seen(user.id)
             
-            # Save message to database
-            message_create = MessageCreate(
-                content=message_data["content"],
-                channel_id=channel_id
-            )
-            db_message = MessageService.create_message(db, message_create, user.id)
-            
-            # Broadcast to all users in channel
-            broadcast_message = {
-                "type": "message",
-                "id": db_message.id,
-                "content": db_message.content,
-                "username": user.username,
-                "user_id": user.id,
-                "channel_id": channel_id,
-                "timestamp": db_message.created_at.isoformat()
-            }
-            await manager.broadcast_to_channel(broadcast_message, channel_id)
+            frame_type = message_data.get("type", "message")
+            if frame_type == "typing":
+                presence.typing(user.id, channel_id, message_data.get("active", True))
+            elif frame_type == "presence":
+                if message_data.get("status") in CLIENT_STATUSES:
+                    presence.set_status(user.id, message_data["status"], manager.user_channels(user.id))
+            elif frame_type == "read":
+                message_id = message_data.get("message_id")
+                if isinstance(message_id, int) and await read_markers.accepts(channel_id, message_id):
+                    read_markers.mark(user.id, channel_id, message_id)
+                else:
+                    manager.send_frame(websocket, {
+                        "type": "error", "channel_id": channel_id, "detail": "message_id is not a message in this channel"
+                    })
+            elif isinstance(message_data.get("content"), str):
+                await handle_chat_message(websocket, user, channel_id, message_data["content"])
+            else:
+                manager.send_frame(websocket, {"type": "error", "channel_id": channel_id, "detail": "content is required"})
     
     except WebSocketDisconnect:
         # User disconnected
-        manager.disconnect(channel_id, user.id)
+        pass
+    finally:
+        # Also on any other error, so the socket never stays registered
+        if connected:
+            await release_socket(websocket, user, [channel_id])
+        else:
+            manager.disconnect_socket(websocket)
+
+@router.websocket("/ws")
+async def multiplexed_endpoint(websocket: WebSocket, token: str = Query(...)):
+    """One socket for all of a user's channels.
+    
+    Clients send ``subscribe`` / ``unsubscribe`` frames carrying a
+    ``channel_id`` (plus an optional ``last_id`` to replay what was missed)
+    and ``message`` frames with a ``channel_id`` and ``content``; ``typing``
+    frames name a channel, ``presence`` frames carry a ``status``. Every
+    outbound frame already names its channel. Frames are JSON unless the
+    client negotiated a compact format (see app/websocket/wire.py).
+    """
+    started = time.perf_counter()
+    user = await get_user_from_token(token)
+    if not user:
+        await websocket.close(code=1008)  # Policy violation
+        return
+    
+    connected = False
+    try:
+        codec = negotiate(websocket.scope.get("subprotocols", []))
+        await manager.accept(websocket, user.id, codec=codec)
+        manager.record_connect(time.perf_counter() - started)
+        username_cache.set(user.id, user.username)
+        presence.connected(user.id, user.username)
+        connected = True
         
-        # Broadcast user left
-        leave_message = {
-            "type": "user_left",
-            "content": f"{user.username} left the channel",
-            "username": "System",
-            "channel_id": channel_id,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        await manager.broadcast_to_channel(leave_message, channel_id)
+        while True:
+            try:
+                frame = await receive_frame(websocket, codec)
+            except ValueError:
+                manager.send_frame(websocket, {"type": "error", "detail": "Malformed frame"})
+                continue
+            presence.seen(user.id)
+            
+            frame_type = frame.get("type", "message")
+            if frame_type == "presence":
+                if frame.get("status") not in CLIENT_STATUSES:
+                    manager.send_frame(websocket, {"type": "error", "detail": "Unknown status"})
+                    continue
+                presence.set_status(user.id, frame["status"], manager.user_channels(user.id))
+                continue
+            
+            channel_id = frame.get("channel_id")
+            if not isinstance(channel_id, int):
+                manager.send_frame(websocket, {"type": "error", "detail": "channel_id is required"})
+                continue
+            
+            if frame_type == "subscribe":
+                last_id = frame.get("last_id")
+                if last_id is not None and not isinstance(last_id, int):
+                    manager.send_frame(websocket, {
+                        "type": "error", "channel_id": channel_id, "detail": "last_id must be a message id"
+                    })
+                    continue
+                if not await membership_index.is_member(user.id, channel_id):
+                    manager.send_frame(websocket, {
+                        "type": "error", "channel_id": channel_id, "detail": "Not a member of this channel"
+                    })
+                    continue
+                already_here = manager.is_user_online(user.id, channel_id)
+                await manager.subscribe(websocket, channel_id, last_id)
+                manager.send_frame(websocket, {"type": "subscribed", "channel_id": channel_id})
+                presence.subscribed(user.id, channel_id)
+                if not already_here:
+                    await manager.broadcast_to_channel(
+                        presence_event("user_joined", user.username, channel_id), channel_id
+                    )
+            
+            elif frame_type == "unsubscribe":
+                if channel_id in manager.subscriptions(websocket):
+                    manager.unsubscribe(websocket, channel_id)
+                    if not manager.is_user_online(user.id, channel_id):
+                        presence.typing(user.id, channel_id, active=False)
+                        await manager.broadcast_to_channel(
+                            presence_event("user_left", user.username, channel_id), channel_id
+                        )
+                manager.send_frame(websocket, {"type": "unsubscribed", "channel_id": channel_id})
+            
+            elif frame_type in ("message", "typing", "read"):
+                if channel_id not in manager.subscriptions(websocket):
+                    manager.send_frame(websocket, {
+                        "type": "error", "channel_id": channel_id, "detail": "Not subscribed to this channel"
+                    })
+                    continue
+                if frame_type == "typing":
+                    presence.typing(user.id, channel_id, frame.get("active", True))
+                elif frame_type == "read":
+                    message_id = frame.get("message_id")
+                    if not isinstance(message_id, int):
+                        manager.send_frame(websocket, {
+                            "type": "error", "channel_id": channel_id, "detail": "message_id is required"
+                        })
+                        continue
+                    if not await read_markers.accepts(channel_id, message_id):
+                        manager.send_frame(websocket, {
+                            "type": "error", "channel_id": channel_id,
+                            "detail": "message_id is not a message in this channel"
+                        })
+                        continue
+                    read_markers.mark(user.id, channel_id, message_id)
+                elif isinstance(frame.get("content"), str):
+                    await handle_chat_message(websocket, user, channel_id, frame["content"])
+                else:
+                    manager.send_frame(websocket, {
+                        "type": "error", "channel_id": channel_id, "detail": "content is required"
+                    })
+            
+            else:
+                manager.send_frame(websocket, {"type": "error", "detail": f"Unknown frame type: {frame_type}"})
     
+    except WebSocketDisconnect:
+        pass
     finally:
-        db.close()
+        # Also on any other error, so the socket never stays registered
+        if connected:
+            await release_socket(websocket, user, list(manager.subscriptions(websocket)))
+        else:
+            manager.disconnect_socket(websocket)
@@ -0,0 +1,55 @@
+import time
+from typing import Any, Dict, NamedTuple, Optional, Set
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+class Principal(NamedTuple):
+    """The authenticated caller, without loading the ORM User"""
+    id: int
+    username: str
+
+class _Entry(NamedTuple):
+    principal: Principal
+    claims: Dict[str, Any]
+    expires_at: float
+
+class TokenCache:
+    """Verified JWTs mapped to their principal, kept until the token expires"""
+
+    def __init__(self, maxsize: int = 10000):
+        self._entries = LRUCache(maxsize, on_evict=self._forget)
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[Principal]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._entries.pop(token)
+            self._forget(token, entry)
+            return None
+        return entry.principal
+
+    def set(self, token: str, principal: Principal, claims: Dict[str, Any]):
+        expires_at = claims.get("exp")
+        if expires_at is None:
+            return
+        self._entries.set(token, _Entry(principal, claims, float(expires_at)))
+        self._tokens_by_user.setdefault(principal.id, set()).add(token)
+
+    def invalidate_user(self, user_id: int):
+        """Forget every cached token of a user"""
+        for token in self._tokens_by_user.pop(user_id, ()):
+            self._entries.pop(token)
+
+    def _forget(self, token: str, entry: _Entry):
+        tokens = self._tokens_by_user.get(entry.principal.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry.principal.id]
+
+    def get_stats(self) -> dict:
+        return self._entries.get_stats()
+
+token_cache = TokenCache(settings.AUTH_CACHE_SIZE)
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry.
+
+    Not thread-safe; meant to be shared by coroutines on one event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            evicted_key, evicted = self._data.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[Any]:
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+    
+    def values(self) -> List[Any]:
+        """Entries from least to most recently used, without touching their order"""
+        return list(self._data.values())
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,81 @@
+import time
+from contextvars import ContextVar
+from typing import List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.core.metrics import COUNT_BUCKETS, registry
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status")
+)
+REQUEST_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "Database queries issued per HTTP request", ("route",), COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = registry.histogram(
+    "http_request_db_seconds", "Time spent in database queries per HTTP request", ("route",)
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_duration_seconds", "Database statement execution time", ("engine",)
+)
+
+# [queries, seconds] for the HTTP request being handled, None elsewhere.
+# SQLAlchemy runs async sessions in greenlets that share the caller's
+# context, so the cursor events below see the request's value.
+_request_db: ContextVar[Optional[List[float]]] = ContextVar("request_db", default=None)
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Time every statement on an engine and attribute it to the current request"""
+
+    labels = (name,)
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        DB_QUERY_SECONDS.observe(elapsed, labels)
+        request = _request_db.get()
+        if request is not None:
+            request[0] += 1
+            request[1] += elapsed
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware timing HTTP requests by their route template.
+
+    Labels use the matched route's path ("/api/v1/channels/{channel_id}")
+    rather than the raw URL so the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        db = [0, 0.0]
+        token = _request_db.set(db)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(elapsed, (scope["method"], path, str(status)))
+            REQUEST_DB_QUERIES.observe(db[0], (path,))
+            REQUEST_DB_SECONDS.observe(db[1], (path,))
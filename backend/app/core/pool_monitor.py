@@ -0,0 +1,112 @@
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from app.core.metrics import registry
+
+WAIT_SECONDS = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for or opening a pooled database connection", ("pool",)
+)
+
+
+class PoolMonitor:
+    """Connection pool utilization: checkouts in use, waiters and wait time.
+
+    Wait time is measured around the pool's own ``_do_get``, which is where
+    a checkout blocks once every connection (including overflow) is in use
+    and also where the pool opens a new connection, so it covers the time
+    spent queueing or connecting.
+    """
+
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self.engine: Engine = None
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.connects = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def pool_class(self, base: type) -> type:
+        """A subclass of ``base`` that reports to this monitor.
+
+        SQLAlchemy recreates pools from their class on dispose, so the
+        monitor rides along on the class rather than the instance.
+        """
+        monitor = self
+
+        class InstrumentedPool(base):
+            def _do_get(self):
+                monitor._wait_started()
+                started = time.perf_counter()
+                try:
+                    return super()._do_get()
+                except exc.TimeoutError:
+                    monitor.timeouts += 1
+                    raise
+                finally:
+                    monitor._wait_finished(time.perf_counter() - started)
+
+        InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+        return InstrumentedPool
+
+    def attach(self, engine: Engine):
+        """Count checkouts, checkins and new connections on an engine's pool"""
+        self.engine = engine
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _wait_started(self):
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def _wait_finished(self, seconds: float):
+        with self._lock:
+            self.waiting -= 1
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            WAIT_SECONDS.observe(seconds, (self.name,))
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations += 1
+
+    def get_stats(self) -> dict:
+        stats = {
+            "checked_out": self.checked_out,
+            "max_checked_out": self.max_checked_out,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms_mean": self.wait_seconds_total / self.waits * 1000 if self.waits else 0.0,
+            "wait_ms_max": self.wait_seconds_max * 1000,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+        }
+        if self.engine is not None:
+            stats["pool"] = self.engine.pool.status()
+        return stats
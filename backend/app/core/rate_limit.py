@@ -0,0 +1,154 @@
+import importlib
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple
+from fastapi import HTTPException, status
+from app.core.config import settings
+
+
+class Rule(NamedTuple):
+    """Token bucket: ``capacity`` requests, refilled over ``period`` seconds"""
+    capacity: float
+    period: float
+    refill_per_second: float
+
+    @classmethod
+    def parse(cls, spec: str) -> Optional["Rule"]:
+        """Parse "30/10" (30 requests per 10 seconds); empty disables the rule"""
+        if not spec:
+            return None
+        count, _, seconds = spec.partition("/")
+        capacity, period = float(count), float(seconds or 1)
+        if capacity <= 0 or period <= 0:
+            raise ValueError(f"Invalid rate limit: {spec}")
+        return cls(capacity, period, capacity / period)
+
+
+class RateLimitBackend(ABC):
+    """Where bucket state lives.
+
+    The in-memory backend is per worker. A shared backend (Redis, ...)
+    subclasses this, implements ``acquire`` and ``release`` atomically on
+    its store and can be selected with ``RATE_LIMIT_BACKEND=package.module:ClassName``.
+    """
+
+    @abstractmethod
+    async def acquire(self, key: Hashable, rule: Rule, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens; returns 0 if allowed, else seconds until they are available"""
+
+    @abstractmethod
+    async def release(self, key: Hashable, rule: Rule, cost: float = 1.0):
+        """Give back ``cost`` tokens taken by an acquire that was not used after all"""
+
+    def get_stats(self) -> dict:
+        return {"backend": type(self).__name__}
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Buckets in a bounded LRU map; an evicted bucket simply starts full again"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # {key: [tokens, updated_at]}, least recently used first
+        self._buckets: "OrderedDict[Hashable, list]" = OrderedDict()
+
+    async def acquire(self, key: Hashable, rule: Rule, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        buckets = self._buckets
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = [rule.capacity, now]
+            if len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+            tokens = bucket[0] + (now - bucket[1]) * rule.refill_per_second
+            bucket[0] = tokens if tokens < rule.capacity else rule.capacity
+            bucket[1] = now
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / rule.refill_per_second
+
+    async def release(self, key: Hashable, rule: Rule, cost: float = 1.0):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            tokens = bucket[0] + cost
+            bucket[0] = tokens if tokens < rule.capacity else rule.capacity
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats["keys"] = len(self._buckets)
+        return stats
+
+
+class RateLimiter:
+    """Named token-bucket rules applied to keys such as user ids or IPs"""
+
+    def __init__(self, backend: RateLimitBackend, rules: Dict[str, Optional[Rule]], enabled: bool = True):
+        self.backend = backend
+        self.rules = {name: rule for name, rule in rules.items() if rule is not None}
+        self.enabled = enabled
+        self.allowed = 0
+        self.limited: Dict[str, int] = {}
+
+    async def check(self, *limits: Tuple[str, Hashable]) -> float:
+        """Apply each (rule name, key) in turn; returns 0 or the retry-after of the first denial.
+
+        A denied request costs nothing: tokens already taken from the
+        earlier buckets are given back.
+        """
+        if not self.enabled:
+            return 0.0
+        taken = []
+        for name, key in limits:
+            rule = self.rules.get(name)
+            if rule is None:
+                continue
+            retry_after = await self.backend.acquire((name, key), rule)
+            if retry_after:
+                self.limited[name] = self.limited.get(name, 0) + 1
+                for bucket, taken_rule in reversed(taken):
+                    await self.backend.release(bucket, taken_rule)
+                return retry_after
+            taken.append(((name, key), rule))
+        self.allowed += 1
+        return 0.0
+
+    async def enforce(self, *limits: Tuple[str, Hashable]):
+        """check() for HTTP routes: raise 429 with Retry-After when limited"""
+        retry_after = await self.check(*limits)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": str(max(1, round(retry_after)))},
+            )
+
+    def get_stats(self) -> dict:
+        return {"allowed": self.allowed, "limited": dict(self.limited), **self.backend.get_stats()}
+
+
+def create_backend(backend: str, max_keys: int) -> RateLimitBackend:
+    """Build the backend named by the RATE_LIMIT_BACKEND setting"""
+    if backend == "memory":
+        return MemoryRateLimitBackend(max_keys)
+    if ":" in backend:
+        module_name, class_name = backend.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+rate_limiter = RateLimiter(
+    create_backend(settings.RATE_LIMIT_BACKEND, settings.RATE_LIMIT_MAX_KEYS),
+    {
+        "message_user": Rule.parse(settings.RATE_LIMIT_MESSAGE_USER),
+        "message_channel": Rule.parse(settings.RATE_LIMIT_MESSAGE_CHANNEL),
+        "message_ip": Rule.parse(settings.RATE_LIMIT_MESSAGE_IP),
+        "login_ip": Rule.parse(settings.RATE_LIMIT_LOGIN_IP),
+        "login_username": Rule.parse(settings.RATE_LIMIT_LOGIN_USERNAME),
+        "register_ip": Rule.parse(settings.RATE_LIMIT_REGISTER_IP),
+    },
+    enabled=settings.RATE_LIMIT_ENABLED,
+)
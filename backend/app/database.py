@@ -1,13 +1,87 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.core.config import settings
+from app.core.instrumentation import instrument_engine
+from app.core.metrics import registry
+from app.core.pool_monitor import PoolMonitor
 
-# Convert asyncpg URL to psycopg2 URL
+# The async engine uses the driver from DATABASE_URL (asyncpg); the sync
+# engine, kept for scripts, uses the default DBAPI driver
 db_url = settings.DATABASE_URL.replace('postgresql+asyncpg://', 'postgresql://')
+db_url = db_url.replace('sqlite+aiosqlite://', 'sqlite://')
 
-engine = create_engine(db_url, echo=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def pool_options(url: str, pool_class: type, monitor: PoolMonitor) -> dict:
+    """Engine arguments for the configured, instrumented connection pool"""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite keeps its default single-connection pool
+        return {}
+    return {
+        "poolclass": monitor.pool_class(pool_class),
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    }
+
+# Pool utilization for operators, see the /stats endpoint
+sync_pool_monitor = PoolMonitor("sync")
+pool_monitor = PoolMonitor("async")
+
+# Created on first use, see get_sync_engine()
+engine = None
+sync_session_factory = sessionmaker(autocommit=False, autoflush=False)
+
+def get_sync_engine():
+    """The sync engine, created on first use.
+
+    The app itself only talks to the database through the async engine, so
+    importing it neither loads the sync DBAPI driver nor connects anywhere.
+    """
+    global engine
+    if engine is None:
+        engine = create_engine(db_url, echo=settings.DB_ECHO, **pool_options(db_url, QueuePool, sync_pool_monitor))
+        sync_pool_monitor.attach(engine)
+        instrument_engine(engine, "sync")
+        sync_session_factory.configure(bind=engine)
+    return engine
+
+def SessionLocal() -> Session:
+    """A sync session, for scripts; the first one creates the sync engine"""
+    get_sync_engine()
+    return sync_session_factory()
+
+async_engine = create_async_engine(
+    settings.DATABASE_URL,
+    echo=settings.DB_ECHO,
+    **pool_options(settings.DATABASE_URL, AsyncAdaptedQueuePool, pool_monitor)
+)
+pool_monitor.attach(async_engine.sync_engine)
+instrument_engine(async_engine.sync_engine, "async")
+monitors = {("async",): pool_monitor, ("sync",): sync_pool_monitor}
+registry.gauge_callback(
+    "db_pool_checked_out", "Pooled connections in use",
+    lambda: {labels: monitor.checked_out for labels, monitor in monitors.items()}, ("pool",)
+)
+registry.gauge_callback(
+    "db_pool_waiting", "Checkouts waiting for a connection",
+    lambda: {labels: monitor.waiting for labels, monitor in monitors.items()}, ("pool",)
+)
+registry.counter_callback(
+    "db_pool_timeouts_total", "Checkouts that gave up waiting",
+    lambda: {labels: monitor.timeouts for labels, monitor in monitors.items()}, ("pool",)
+)
+
+# expire_on_commit=False keeps loaded attributes usable after commit, since
+# an AsyncSession cannot lazily reload them
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 Base = declarative_base()
 
@@ -17,3 +91,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
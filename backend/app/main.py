@@ -1,19 +1,57 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.core.config import settings
-from app.database import engine, Base
+from app.core.instrumentation import MetricsMiddleware
+from app.core.metrics import registry
+from app.core.rate_limit import rate_limiter
+from app.core.security import password_hasher
+from app.database import pool_monitor, sync_pool_monitor
 from app.api.routes import auth, users, channels, messages, websocket
+from app.services.archiver import archiver
+from app.services.channel_cache import channel_cache
+from app.services.message_writer import message_writer
+from app.services.read_markers import read_markers
+from app.services.transfer_service import transfers
+from app.startup import boot_timings, check_encoders, phase, run_migrations, warm_up
+from app.websocket.connection_manager import manager
+from app.websocket.presence import presence
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 # Import all models to ensure they're registered
-from app.models import user, channel, message
+from app.models import user, channel, message, read_marker, archive_segment
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Worker startup and shutdown; the schema is managed by Alembic, see alembic.ini"""
+    with phase("startup_ms"):
+        check_encoders()
+        if settings.DB_MIGRATE_ON_STARTUP:
+            with phase("migrations_ms"):
+                await run_migrations()
+        await warm_up()
+        with phase("background_tasks_ms"):
+            await manager.start()
+            await message_writer.start()
+            await presence.start()
+            await read_markers.start()
+            if settings.ARCHIVE_ENABLED:
+                await archiver.start()
+    yield
+    await archiver.stop()
+    await read_markers.stop()
+    await presence.stop()
+    await message_writer.stop()
+    await manager.stop()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
 # CORS
@@ -25,6 +63,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 app.include_router(users.router, prefix=f"{settings.API_V1_STR}/users", tags=["users"])
@@ -39,3 +80,26 @@ def root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/stats")
+def stats():
+    """Operational counters: database pools, sockets and background writers"""
+    return {
+        "db_pool": pool_monitor.get_stats(),
+        "db_pool_sync": sync_pool_monitor.get_stats(),
+        "websocket": manager.get_stats(),
+        "message_writer": message_writer.get_stats(),
+        "presence": presence.get_stats(),
+        "read_markers": read_markers.get_stats(),
+        "password_hasher": password_hasher.get_stats(),
+        "rate_limits": rate_limiter.get_stats(),
+        "channel_cache": channel_cache.get_stats(),
+        "transfers": transfers.get_stats(),
+        "archiver": archiver.get_stats(),
+        "startup": boot_timings,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint (rendered on the event loop, where the metrics are updated)"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Index
+from datetime import datetime
+from app.database import Base
+
+class ArchiveSegment(Base):
+    """One archived batch of a channel's messages: a gzipped NDJSON file
+    under ARCHIVE_DIR (``path`` is relative to it) holding ``message_count``
+    messages with ids first_message_id..last_message_id, created between
+    oldest_at and newest_at.
+    """
+    __tablename__ = "archive_segments"
+    
+    id = Column(Integer, primary_key=True)
+    channel_id = Column(Integer, ForeignKey('channels.id'), nullable=False)
+    path = Column(String, nullable=False, unique=True)
+    first_message_id = Column(Integer, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    oldest_at = Column(DateTime, nullable=False)
+    newest_at = Column(DateTime, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    bytes = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Finding the segments around a history cursor
+        Index("ix_archive_segments_channel_newest", "channel_id", "newest_at"),
+    )
@@ -19,6 +19,20 @@ class Channel(Base):
     description = Column(String, nullable=True)
     created_by = Column(Integer, ForeignKey('users.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Maintained incrementally rather than aggregated per request: joins and
+    # leaves adjust member_count, the message writer counts messages and
+    # records the latest one
+    member_count = Column(Integer, nullable=False, default=0, server_default="0")
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_id = Column(Integer, nullable=True)
+    last_message_user_id = Column(Integer, nullable=True)
+    last_message_preview = Column(String, nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    # Retention policy: messages older than retention_days leave the
+    # messages table, into archive segments ("archive") or for good
+    # ("delete"); NULL falls back to RETENTION_DEFAULT_DAYS
+    retention_days = Column(Integer, nullable=True)
+    retention_mode = Column(String, nullable=False, default="archive", server_default="archive")
     
     # Relationships
     creator = relationship("User", foreign_keys=[created_by])
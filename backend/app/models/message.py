@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -12,6 +12,13 @@ class Message(Base):
     channel_id = Column(Integer, ForeignKey('channels.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
+    __table_args__ = (
+        # Serves keyset pagination of a channel's history
+        Index("ix_messages_channel_created_id", "channel_id", "created_at", "id"),
+        # Serves "messages after id X in a channel" (replay, unread counts)
+        Index("ix_messages_channel_id_id", "channel_id", "id"),
+    )
+    
     # Relationships
     user = relationship("User", back_populates="messages")
     channel = relationship("Channel", back_populates="messages")
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from datetime import datetime
+from app.database import Base
+
+class ReadMarker(Base):
+    """How far a user has read in a channel.
+
+    ``read_count`` is the channel's ``message_count`` up to and including
+    ``last_read_message_id``, so unread = channels.message_count - read_count
+    without counting rows in messages.
+    """
+    __tablename__ = "read_markers"
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    channel_id = Column(Integer, ForeignKey('channels.id'), primary_key=True)
+    last_read_message_id = Column(Integer, nullable=False, default=0)
+    read_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
+
+MAX_RETENTION_DAYS = 36500
 
 class ChannelBase(BaseModel):
     name: str
@@ -19,3 +21,45 @@ class Channel(ChannelBase):
 
 class ChannelWithMembers(Channel):
     member_count: int
+
+class LastMessage(BaseModel):
+    id: int
+    user_id: int
+    username: Optional[str] = None
+    content: str  # truncated preview
+    created_at: datetime
+
+class ChannelSummary(ChannelWithMembers):
+    last_message: Optional[LastMessage] = None
+
+class PresenceEntry(BaseModel):
+    user_id: int
+    status: str
+
+class ChannelPresence(BaseModel):
+    channel_id: int
+    users: List[PresenceEntry]
+
+class ChannelUnread(BaseModel):
+    channel_id: int
+    unread_count: int
+    last_read_message_id: Optional[int] = None
+    last_message_id: Optional[int] = None
+
+class ReadMarkerUpdate(BaseModel):
+    message_id: Optional[int] = None  # defaults to the channel's newest message
+
+class ChannelRetentionUpdate(BaseModel):
+    # Days a message stays in the live history: None follows the server
+    # default, 0 keeps messages forever; at most about a century
+    retention_days: Optional[int] = Field(None, ge=0, le=MAX_RETENTION_DAYS)
+    # "archive" moves aged messages to archive segments, "delete" drops them
+    retention_mode: Literal["archive", "delete"] = "archive"
+
+class ChannelRetention(ChannelRetentionUpdate):
+    channel_id: int
+    # The limit in force, after applying the server default (0 = none)
+    effective_days: int
+    archived_messages: int
+    archive_segments: int
+    archive_bytes: int
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class MessageBase(BaseModel):
     content: str
@@ -18,6 +18,22 @@ class Message(MessageBase):
     class Config:
         from_attributes = True
 
+class MessagePage(BaseModel):
+    items: List[Message]
+    # Pass back in the same parameter (before/after) to continue; None at the end
+    next_cursor: Optional[str] = None
+
+class MessageSearchResult(Message):
+    rank: float
+    # Excerpt with matches wrapped in <mark></mark>; the rest is raw message
+    # text, so clients must escape it before rendering as HTML
+    snippet: str
+
+class MessageSearchPage(BaseModel):
+    items: List[MessageSearchResult]
+    # Pass back as cursor to get the next page; None at the end
+    next_cursor: Optional[str] = None
+
 class WebSocketMessage(BaseModel):
     type: str  # "message", "user_joined", "user_left"
     content: str
@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+
+class TransferError(BaseModel):
+    line: int
+    error: str
+
+class TransferStatus(BaseModel):
+    id: str
+    kind: str  # "export" or "import"
+    channel_id: int
+    format: str  # "ndjson" or "csv"
+    status: str  # "running", "completed" or "failed"
+    rows: int
+    rejected: int
+    bytes: int
+    total_rows: Optional[int] = None
+    total_bytes: Optional[int] = None
+    # 0..1, when the total size is known
+    progress: Optional[float] = None
+    rows_per_second: float
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    # The first rejected import rows
+    errors: List[TransferError] = []
@@ -0,0 +1,21 @@
+"""Run the API under uvicorn with the tuned WebSocket compression.
+
+Usage: python -m app.serve [--host 0.0.0.0] [--port 8000] [--workers 1]
+"""
+import argparse
+import uvicorn
+from app.websocket.deflate import DeflateWebSocketProtocol
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        ws=DeflateWebSocketProtocol,
+    )
@@ -0,0 +1,212 @@
+import asyncio
+import fcntl
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.models.archive_segment import ArchiveSegment
+
+# gzip level for new segments: most of level 9's ratio on chat text, much faster
+COMPRESS_LEVEL = 6
+# Manifest rows fetched at a time while looking for archived history
+SEGMENT_FETCH = 8
+LOCK_FILE = ".archiver.lock"
+
+Key = Tuple[datetime, int]
+
+class ArchivedMessage(NamedTuple):
+    """A message read back from a segment, usable wherever a history row is"""
+    id: int
+    content: str
+    user_id: int
+    username: Optional[str]
+    channel_id: int
+    created_at: datetime
+
+    @property
+    def _mapping(self) -> dict:
+        return self._asdict()
+
+def history_key(row) -> Key:
+    """Sort key of the history endpoints: (created_at, id)"""
+    return row.created_at, row.id
+
+def decode_segment(data: bytes) -> List[ArchivedMessage]:
+    messages = []
+    for line in data.splitlines():
+        record = json.loads(line)
+        messages.append(ArchivedMessage(
+            record["id"],
+            record["content"],
+            record["user_id"],
+            record["username"],
+            record["channel_id"],
+            datetime.fromisoformat(record["created_at"]),
+        ))
+    return messages
+
+class ArchiveStore:
+    """The cold tier of channel history.
+
+    Each segment is an immutable gzipped NDJSON file under ``root`` (the
+    export format, one file per archived batch) with a row in
+    archive_segments saying which messages and time range it holds.
+    Decoded segments are kept in an LRU, so paging through archived
+    history reads each file once.
+    """
+
+    def __init__(self, root: str, cache_size: int = 64):
+        self.root = root
+        self.segments_read = 0
+        self._segments = LRUCache(cache_size)
+
+    @staticmethod
+    def segment_path(channel_id: int, first_message_id: int, last_message_id: int) -> str:
+        """Where a segment goes, relative to the root"""
+        return os.path.join(str(channel_id), f"{first_message_id:012d}-{last_message_id:012d}.ndjson.gz")
+
+    def write_segment(self, path: str, data: bytes) -> int:
+        """Compress and durably write a segment; returns its size on disk. Blocking."""
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        partial = full_path + ".partial"
+        with open(partial, "wb") as f:
+            f.write(gzip.compress(data, COMPRESS_LEVEL))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        # Readers only ever see complete segments
+        os.replace(partial, full_path)
+        return size
+
+    def remove_segment(self, path: str):
+        """Delete a segment whose manifest row was never committed. Blocking."""
+        try:
+            os.remove(os.path.join(self.root, path))
+        except FileNotFoundError:
+            pass
+
+    def _load(self, path: str) -> List[ArchivedMessage]:
+        with open(os.path.join(self.root, path), "rb") as f:
+            return decode_segment(gzip.decompress(f.read()))
+
+    async def read_segment(self, path: str, cache: bool = True) -> List[ArchivedMessage]:
+        """A segment's messages in id order; decompressed on a thread"""
+        messages = self._segments.get(path)
+        if messages is None:
+            messages = await asyncio.to_thread(self._load, path)
+            self.segments_read += 1
+            if cache:
+                self._segments.set(path, messages)
+        return messages
+
+    def try_lock(self):
+        """Exclusive lock for archiving into ``root``, shared by the workers of a host; None if held"""
+        os.makedirs(self.root, exist_ok=True)
+        lock = open(os.path.join(self.root, LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    @staticmethod
+    def unlock(lock):
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+    async def read_before(
+        self, db: AsyncSession, channel_id: int, key: Optional[Key], count: int
+    ) -> List[ArchivedMessage]:
+        """Up to ``count`` archived messages before ``key`` (all, if None), newest first"""
+        query = select(ArchiveSegment.id, ArchiveSegment.path, ArchiveSegment.newest_at).where(
+            ArchiveSegment.channel_id == channel_id
+        )
+        if key is not None:
+            query = query.where(ArchiveSegment.oldest_at <= key[0])
+        query = query.order_by(ArchiveSegment.newest_at.desc(), ArchiveSegment.id.desc()).limit(SEGMENT_FETCH)
+
+        found: List[ArchivedMessage] = []
+        position = None
+        while True:
+            page = query if position is None else query.where(
+                tuple_(ArchiveSegment.newest_at, ArchiveSegment.id) < tuple_(*position)
+            )
+            segments = (await db.execute(page)).all()
+            for segment_id, path, newest_at in segments:
+                # Segments come newest first, so once one ends before the
+                # oldest message we would return, none of the rest can help
+                if len(found) >= count and newest_at < found[-1].created_at:
+                    return found
+                messages = await self.read_segment(path)
+                found.extend(m for m in messages if key is None or history_key(m) < key)
+                found.sort(key=history_key, reverse=True)
+                del found[count:]
+            if len(segments) < SEGMENT_FETCH:
+                return found
+            position = (segments[-1].newest_at, segments[-1].id)
+
+    async def read_after(
+        self, db: AsyncSession, channel_id: int, key: Key, count: int
+    ) -> List[ArchivedMessage]:
+        """Up to ``count`` archived messages after ``key``, oldest first"""
+        query = (
+            select(ArchiveSegment.id, ArchiveSegment.path, ArchiveSegment.oldest_at)
+            .where(ArchiveSegment.channel_id == channel_id, ArchiveSegment.newest_at >= key[0])
+            .order_by(ArchiveSegment.oldest_at.asc(), ArchiveSegment.id.asc())
+            .limit(SEGMENT_FETCH)
+        )
+        found: List[ArchivedMessage] = []
+        position = None
+        while True:
+            page = query if position is None else query.where(
+                tuple_(ArchiveSegment.oldest_at, ArchiveSegment.id) > tuple_(*position)
+            )
+            segments = (await db.execute(page)).all()
+            for segment_id, path, oldest_at in segments:
+                if len(found) >= count and oldest_at > found[-1].created_at:
+                    return found
+                messages = await self.read_segment(path)
+                found.extend(m for m in messages if history_key(m) > key)
+                found.sort(key=history_key)
+                del found[count:]
+            if len(segments) < SEGMENT_FETCH:
+                return found
+            position = (segments[-1].oldest_at, segments[-1].id)
+
+    async def find(self, db: AsyncSession, channel_id: int, message_id: int) -> Optional[ArchivedMessage]:
+        """An archived message by id, or None"""
+        result = await db.execute(
+            select(ArchiveSegment.path).where(
+                ArchiveSegment.channel_id == channel_id,
+                ArchiveSegment.first_message_id <= message_id,
+                ArchiveSegment.last_message_id >= message_id,
+            )
+        )
+        for path in result.scalars().all():
+            for message in await self.read_segment(path):
+                if message.id == message_id:
+                    return message
+        return None
+
+    async def iter_channel(self, db: AsyncSession, channel_id: int) -> AsyncIterator[List[ArchivedMessage]]:
+        """Every archived message of a channel, one segment at a time, oldest segment first"""
+        result = await db.execute(
+            select(ArchiveSegment.path)
+            .where(ArchiveSegment.channel_id == channel_id)
+            .order_by(ArchiveSegment.first_message_id)
+        )
+        for path in result.scalars().all():
+            # Bypass the cache: an export would only push out the hot entries
+            yield await self.read_segment(path, cache=False)
+
+    def get_stats(self) -> dict:
+        return {"segments_read": self.segments_read, "cache": self._segments.get_stats()}
+
+message_archive = ArchiveStore(settings.ARCHIVE_DIR, cache_size=settings.ARCHIVE_SEGMENT_CACHE_SIZE)
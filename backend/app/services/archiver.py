@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from app.core.config import settings
+from app.core.metrics import registry
+from app.database import AsyncSessionLocal
+from app.models.archive_segment import ArchiveSegment
+from app.models.channel import Channel
+from app.models.message import Message
+from app.services.archive_store import ArchiveStore, message_archive
+from app.services.message_service import history_query
+from app.services.transfer_service import encode_ndjson
+
+logger = logging.getLogger(__name__)
+
+MESSAGES_RETIRED = registry.counter(
+    "messages_retired_total", "Messages moved out of the messages table by retention", ("mode",)
+)
+
+# A batch smaller than the batch size is archived only once its oldest
+# message is this far past the cutoff, so quiet channels get about one
+# segment a day rather than one per run
+PARTIAL_SEGMENT_DELAY = timedelta(days=1)
+
+# SQLite's FTS5 index keeps a tombstone for every deleted message until its
+# segments are merged, which slows down every later insert; merging after
+# a run is cheap, as the index now only covers the hot messages
+SEARCH_OPTIMIZE_SQLITE = "INSERT INTO messages_fts(messages_fts) VALUES ('optimize')"
+
+def archive_session_factory():
+    """Sessions for the archiver.
+
+    On SQLite they get connections of their own, opened per batch and
+    closed after it: a connection that has deleted many indexed messages
+    keeps FTS5 state that makes its later inserts several times slower,
+    so it must not go back to the pool the message writer uses.
+    """
+    url = make_url(settings.DATABASE_URL)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return AsyncSessionLocal
+    engine = create_async_engine(settings.DATABASE_URL, echo=settings.DB_ECHO, poolclass=NullPool)
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+def policy_query(default_days: int):
+    """(channel_id, retention_days, retention_mode) of every channel with a retention limit"""
+    days = Channel.retention_days if default_days <= 0 else func.coalesce(Channel.retention_days, default_days)
+    return select(Channel.id, days, Channel.retention_mode).where(days > 0).order_by(Channel.id)
+
+class MessageArchiver:
+    """Moves aged messages out of the hot messages table, in the background.
+
+    Every ``interval_seconds`` it walks the channels that have a retention
+    policy and, ``batch_size`` messages at a time, writes the messages
+    older than the cutoff to a segment (or drops them, for channels set to
+    "delete") and deletes them from messages in the same transaction that
+    records the segment. A run stops after ``max_batches`` batches and the
+    rest waits for the next one, so archiving a large backlog never holds
+    the database for long. Only one worker per archive directory runs at a
+    time.
+    """
+
+    def __init__(
+        self,
+        store: ArchiveStore,
+        session_factory=AsyncSessionLocal,
+        interval_seconds: float = 300.0,
+        batch_size: int = 5000,
+        max_batches: int = 100,
+        default_days: int = 0,
+    ):
+        self.store = store
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.default_days = default_days
+        self.runs = 0
+        self.runs_skipped = 0
+        self.batches = 0
+        self.segments_written = 0
+        self.messages_archived = 0
+        self.messages_deleted = 0
+        self.errors = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_run_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run()
+            except Exception:
+                self.errors += 1
+                logger.exception("Archiver run failed")
+
+    async def run(self, now: Optional[datetime] = None) -> int:
+        """One pass over the channels with a retention policy; returns the messages moved"""
+        lock = self.store.try_lock()
+        if lock is None:
+            # Another worker on this host is archiving
+            self.runs_skipped += 1
+            return 0
+        started = time.perf_counter()
+        now = now or datetime.utcnow()
+        moved = 0
+        batches = 0
+        try:
+            async with self.session_factory() as db:
+                policies = (await db.execute(policy_query(self.default_days))).all()
+            for channel_id, days, mode in policies:
+                if batches >= self.max_batches:
+                    break
+                # One failing channel must not keep the rest from being archived
+                try:
+                    cutoff = now - timedelta(days=days)
+                    while batches < self.max_batches:
+                        count = await self.retire_batch(channel_id, cutoff, mode, now)
+                        if not count:
+                            break
+                        batches += 1
+                        moved += count
+                        if count < self.batch_size:
+                            break
+                except Exception:
+                    self.errors += 1
+                    logger.exception("Archiving channel %s failed", channel_id)
+            if moved:
+                await self.optimize_search()
+        finally:
+            self.store.unlock(lock)
+            self.runs += 1
+            self.last_run_at = now
+            self.last_run_seconds = round(time.perf_counter() - started, 3)
+        return moved
+
+    async def retire_batch(self, channel_id: int, cutoff: datetime, mode: str, now: datetime) -> int:
+        """Archive (or delete) the oldest batch of a channel's messages older than ``cutoff``"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                history_query()
+                .where(Message.channel_id == channel_id, Message.created_at < cutoff)
+                .order_by(Message.id)
+                .limit(self.batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                return 0
+            oldest_at = min(row.created_at for row in rows)
+            if mode == "archive" and len(rows) < self.batch_size and oldest_at > cutoff - PARTIAL_SEGMENT_DELAY:
+                return 0
+
+            # The batch is exactly the channel's aged messages up to its last id
+            statement = delete(Message).where(
+                Message.channel_id == channel_id, Message.created_at < cutoff, Message.id <= rows[-1].id
+            ).execution_options(synchronize_session=False)
+            path = None
+            if mode == "archive":
+                path = self.store.segment_path(channel_id, rows[0].id, rows[-1].id)
+                size = await asyncio.to_thread(self._write, path, rows)
+            try:
+                if path is not None:
+                    await db.execute(insert(ArchiveSegment).values(
+                        channel_id=channel_id,
+                        path=path,
+                        first_message_id=rows[0].id,
+                        last_message_id=rows[-1].id,
+                        oldest_at=oldest_at,
+                        newest_at=max(row.created_at for row in rows),
+                        message_count=len(rows),
+                        bytes=size,
+                        created_at=now,
+                    ))
+                await db.execute(statement)
+                await db.commit()
+            except Exception:
+                if path is not None:
+                    await asyncio.to_thread(self.store.remove_segment, path)
+                raise
+
+        self.batches += 1
+        MESSAGES_RETIRED.inc(len(rows), (mode,))
+        if path is not None:
+            self.segments_written += 1
+            self.messages_archived += len(rows)
+        else:
+            self.messages_deleted += len(rows)
+        return len(rows)
+
+    async def optimize_search(self):
+        async with self.session_factory() as db:
+            if db.bind.dialect.name == "sqlite":
+                await db.execute(text(SEARCH_OPTIMIZE_SQLITE))
+                await db.commit()
+
+    def _write(self, path: str, rows: List) -> int:
+        return self.store.write_segment(path, encode_ndjson(rows).encode())
+
+    def get_stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "runs_skipped": self.runs_skipped,
+            "batches": self.batches,
+            "segments_written": self.segments_written,
+            "messages_archived": self.messages_archived,
+            "messages_deleted": self.messages_deleted,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_run_seconds": self.last_run_seconds,
+            "store": self.store.get_stats(),
+        }
+
+archiver = MessageArchiver(
+    message_archive,
+    session_factory=archive_session_factory(),
+    interval_seconds=settings.ARCHIVE_INTERVAL_SECONDS,
+    batch_size=settings.ARCHIVE_BATCH_SIZE,
+    max_batches=settings.ARCHIVE_MAX_BATCHES_PER_RUN,
+    default_days=settings.RETENTION_DEFAULT_DAYS,
+)
@@ -0,0 +1,118 @@
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.database import AsyncSessionLocal
+from app.models.channel import Channel
+from app.models.user import User
+from app.schemas.channel import ChannelSummary, LastMessage
+from app.services.user_service import username_cache
+
+def summarize(channel: Channel, username: Optional[str]) -> ChannelSummary:
+    """Channel row (plus the last author's username) as its cached summary"""
+    last_message = None
+    if channel.last_message_id is not None:
+        last_message = LastMessage(
+            id=channel.last_message_id,
+            user_id=channel.last_message_user_id,
+            username=username,
+            content=channel.last_message_preview or "",
+            created_at=channel.last_message_at,
+        )
+    return ChannelSummary(
+        id=channel.id,
+        name=channel.name,
+        description=channel.description,
+        created_by=channel.created_by,
+        created_at=channel.created_at,
+        member_count=channel.member_count,
+        last_message=last_message,
+    )
+
+class ChannelCache:
+    """Channel metadata, member count and last message preview by channel id.
+
+    Misses for any number of channels are loaded with one query (joined to
+    the last author's username), so listing a user's channels never runs a
+    query per channel. Creates, joins and leaves drop the entry; the message
+    writer updates the preview in place. Entries expire after ``ttl``
+    seconds, which bounds staleness for changes made by other workers.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, maxsize: int = 10000, ttl: float = 30.0):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.loads = 0
+        self._cache = LRUCache(maxsize)
+
+    async def get(self, channel_id: int, db: Optional[AsyncSession] = None) -> Optional[ChannelSummary]:
+        summaries = await self.get_many([channel_id], db)
+        return summaries[0] if summaries else None
+
+    async def get_many(self, channel_ids: Iterable[int], db: Optional[AsyncSession] = None) -> List[ChannelSummary]:
+        """Summaries of the channels that exist, ordered by id"""
+        now = time.monotonic()
+        found = {}
+        missing = []
+        for channel_id in channel_ids:
+            entry = self._cache.get(channel_id)
+            if entry is not None and entry[0] > now:
+                found[channel_id] = entry[1]
+            else:
+                missing.append(channel_id)
+
+        if missing:
+            query = (
+                select(Channel, User.username)
+                .outerjoin(User, User.id == Channel.last_message_user_id)
+                .where(Channel.id.in_(missing))
+            )
+            if db is not None:
+                result = await db.execute(query)
+            else:
+                async with self.session_factory() as session:
+                    result = await session.execute(query)
+            self.loads += 1
+            expires = time.monotonic() + self.ttl
+            for channel, username in result:
+                summary = summarize(channel, username)
+                self._cache.set(channel.id, (expires, summary))
+                found[channel.id] = summary
+        return [found[channel_id] for channel_id in sorted(found)]
+
+    def message_saved(self, channel_id: int, message_id: int, user_id: int, preview: str, created_at: datetime):
+        """Record a channel's newest message, already committed to the database"""
+        entry = self._cache.get(channel_id)
+        if entry is None:
+            return
+        expires, summary = entry
+        if summary.last_message is not None and summary.last_message.id >= message_id:
+            return
+        username = username_cache.get(user_id)
+        if username is None:
+            # Reload with the author's name on the next read
+            self.invalidate(channel_id)
+            return
+        last_message = LastMessage(
+            id=message_id, user_id=user_id, username=username, content=preview, created_at=created_at
+        )
+        self._cache.set(channel_id, (expires, summary.model_copy(update={"last_message": last_message})))
+
+    def invalidate(self, channel_id: int):
+        self._cache.pop(channel_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def get_stats(self) -> dict:
+        stats = self._cache.get_stats()
+        stats["loads"] = self.loads
+        return stats
+
+channel_cache = ChannelCache(
+    maxsize=settings.CHANNEL_CACHE_SIZE,
+    ttl=settings.CHANNEL_CACHE_TTL_SECONDS,
+)
@@ -1,33 +1,111 @@
+from datetime import datetime
+from sqlalchemy import bindparam, case, delete, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.models.channel import Channel
-from app.models.user import User
-from app.schemas.channel import ChannelCreate
+from app.core.config import settings
+from app.models.archive_segment import ArchiveSegment
+from app.models.channel import Channel, user_channels
+from app.models.read_marker import ReadMarker
+from app.schemas.channel import ChannelCreate, ChannelRetentionUpdate, ChannelSummary
+from app.services.channel_cache import channel_cache
+from app.services.membership import membership_index
+from app.services.read_markers import caught_up_statement, read_markers
 from fastapi import HTTPException, status
 from typing import List
 
+# Characters of a channel's newest message kept as its preview
+PREVIEW_LENGTH = 140
+
+def join_statement(channel_id: int, user_id: int):
+    """INSERT ... SELECT that adds the membership row only if it is missing"""
+    already_member = (
+        select(user_channels.c.user_id)
+        .where(user_channels.c.channel_id == channel_id, user_channels.c.user_id == user_id)
+        .exists()
+    )
+    return insert(user_channels).from_select(
+        ["user_id", "channel_id"],
+        select(literal(user_id), literal(channel_id)).where(~already_member),
+    )
+
+def leave_statement(channel_id: int, user_id: int):
+    return delete(user_channels).where(
+        user_channels.c.channel_id == channel_id,
+        user_channels.c.user_id == user_id,
+    )
+
+def forget_marker_statement(channel_id: int, user_id: int):
+    return delete(ReadMarker).where(ReadMarker.channel_id == channel_id, ReadMarker.user_id == user_id)
+
+def member_count_statement(channel_id: int, delta: int):
+    """Adjust the member counter in the same transaction as the membership change"""
+    return update(Channel).where(Channel.id == channel_id).values(member_count=Channel.member_count + delta)
+
+def recount_statement():
+    """Recompute every member counter from user_channels"""
+    channels = Channel.__table__
+    members = select(func.count()).where(user_channels.c.channel_id == channels.c.id).scalar_subquery()
+    return update(channels).values(member_count=members)
+
+def last_message_statement():
+    """Executemany UPDATE counting a channel's new messages and recording the newest.
+
+    The last_message_* columns only ever move forward, so batches committed
+    out of order cannot replace a newer preview with an older one.
+    """
+    channels = Channel.__table__
+    newer = or_(channels.c.last_message_id.is_(None), channels.c.last_message_id < bindparam("b_message_id"))
+
+    def forward(column, value):
+        return case((newer, value), else_=column)
+
+    return update(channels).where(channels.c.id == bindparam("b_channel_id")).values(
+        message_count=channels.c.message_count + bindparam("b_count"),
+        last_message_id=forward(channels.c.last_message_id, bindparam("b_message_id")),
+        last_message_user_id=forward(channels.c.last_message_user_id, bindparam("b_user_id")),
+        last_message_preview=forward(channels.c.last_message_preview, bindparam("b_preview")),
+        last_message_at=forward(channels.c.last_message_at, bindparam("b_created_at")),
+    )
+
+def last_message_params(
+    message_id: int, user_id: int, channel_id: int, content: str, created_at: datetime, count: int = 1
+) -> dict:
+    """Parameters for last_message_statement: ``count`` new messages, the newest described"""
+    return {
+        "b_channel_id": channel_id,
+        "b_count": count,
+        "b_message_id": message_id,
+        "b_user_id": user_id,
+        "b_preview": content[:PREVIEW_LENGTH],
+        "b_created_at": created_at,
+    }
+
+def channel_name_taken():
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Channel name already exists"
+    )
+
 class ChannelService:
     @staticmethod
     def create_channel(db: Session, channel: ChannelCreate, user_id: int) -> Channel:
-        # Check if channel name exists
-        db_channel = db.query(Channel).filter(Channel.name == channel.name).first()
-        if db_channel:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Channel name already exists"
-            )
-        
-        # Create channel
+        # Create channel; the unique index on name rejects duplicates
         db_channel = Channel(
             name=channel.name,
             description=channel.description,
-            created_by=user_id
+            created_by=user_id,
+            member_count=1
         )
+        db.add(db_channel)
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            raise channel_name_taken()
         
         # Add creator as member
-        creator = db.query(User).filter(User.id == user_id).first()
-        db_channel.members.append(creator)
-        
-        db.add(db_channel)
+        db.execute(insert(user_channels).values(user_id=user_id, channel_id=db_channel.id))
         db.commit()
         db.refresh(db_channel)
         return db_channel
@@ -35,8 +113,9 @@ class ChannelService:
     @staticmethod
     def get_channels(db: Session, user_id: int) -> List[Channel]:
         """Get all channels where user is a member"""
-        user = db.query(User).filter(User.id == user_id).first()
-        return user.channels
+        return db.query(Channel).join(
+            user_channels, user_channels.c.channel_id == Channel.id
+        ).filter(user_channels.c.user_id == user_id).all()
     
     @staticmethod
     def get_channel(db: Session, channel_id: int) -> Channel:
@@ -52,22 +131,165 @@ class ChannelService:
     def join_channel(db: Session, channel_id: int, user_id: int):
         """Add user to channel"""
         channel = ChannelService.get_channel(db, channel_id)
-        user = db.query(User).filter(User.id == user_id).first()
-        
-        if user not in channel.members:
-            channel.members.append(user)
+        try:
+            if db.execute(join_statement(channel_id, user_id)).rowcount:
+                db.execute(member_count_statement(channel_id, 1))
+                db.execute(caught_up_statement(db.bind.dialect.name, channel_id, user_id))
             db.commit()
+        except IntegrityError:
+            # A concurrent join won the race; the user is a member either way
+            db.rollback()
         
         return channel
     
     @staticmethod
     def leave_channel(db: Session, channel_id: int, user_id: int):
         """Remove user from channel"""
-        channel = ChannelService.get_channel(db, channel_id)
-        user = db.query(User).filter(User.id == user_id).first()
+        result = db.execute(leave_statement(channel_id, user_id))
+        if result.rowcount:
+            db.execute(member_count_statement(channel_id, -1))
+            db.execute(forget_marker_statement(channel_id, user_id))
+        db.commit()
+        if not result.rowcount:
+            ChannelService.get_channel(db, channel_id)
         
-        if user in channel.members:
-            channel.members.remove(user)
-            db.commit()
+        return {"message": "Left channel successfully"}
+
+
+class AsyncChannelService:
+    """ChannelService for AsyncSession; used by the API routes.
+
+    Membership is read through the membership index and written with
+    single statements on user_channels, never through the ORM collections.
+    """
+
+    @staticmethod
+    async def create_channel(db: AsyncSession, channel: ChannelCreate, user_id: int) -> Channel:
+        # Create channel; the unique index on name rejects duplicates
+        db_channel = Channel(
+            name=channel.name,
+            description=channel.description,
+            created_by=user_id,
+            member_count=1
+        )
+        db.add(db_channel)
+        try:
+            await db.flush()
+        except IntegrityError:
+            await db.rollback()
+            raise channel_name_taken()
+        
+        # Add creator as member
+        await db.execute(insert(user_channels).values(user_id=user_id, channel_id=db_channel.id))
+        await db.commit()
+        membership_index.added(user_id, db_channel.id)
+        channel_cache.invalidate(db_channel.id)
+        return db_channel
+    
+    @staticmethod
+    async def get_channels(db: AsyncSession, user_id: int) -> List[ChannelSummary]:
+        """Get all channels where user is a member, with member counts and last messages"""
+        channel_ids = await membership_index.channel_ids(user_id, db)
+        if not channel_ids:
+            return []
+        return await channel_cache.get_many(channel_ids, db)
+    
+    @staticmethod
+    async def get_channel(db: AsyncSession, channel_id: int) -> ChannelSummary:
+        channel = await channel_cache.get(channel_id, db)
+        if not channel:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Channel not found"
+            )
+        return channel
+    
+    @staticmethod
+    async def join_channel(db: AsyncSession, channel_id: int, user_id: int):
+        """Add user to channel"""
+        await AsyncChannelService.get_channel(db, channel_id)
+        try:
+            if (await db.execute(join_statement(channel_id, user_id))).rowcount:
+                await db.execute(member_count_statement(channel_id, 1))
+                await db.execute(caught_up_statement(db.bind.dialect.name, channel_id, user_id))
+            await db.commit()
+        except IntegrityError:
+            # A concurrent join won the race; the user is a member either way
+            await db.rollback()
+        membership_index.added(user_id, channel_id)
+        channel_cache.invalidate(channel_id)
+        
+        return await AsyncChannelService.get_channel(db, channel_id)
+    
+    @staticmethod
+    async def leave_channel(db: AsyncSession, channel_id: int, user_id: int):
+        """Remove user from channel"""
+        result = await db.execute(leave_statement(channel_id, user_id))
+        if result.rowcount:
+            await db.execute(member_count_statement(channel_id, -1))
+            await db.execute(forget_marker_statement(channel_id, user_id))
+        await db.commit()
+        membership_index.removed(user_id, channel_id)
+        read_markers.forget(user_id, channel_id)
+        channel_cache.invalidate(channel_id)
+        if not result.rowcount:
+            await AsyncChannelService.get_channel(db, channel_id)
         
         return {"message": "Left channel successfully"}
+    
+    @staticmethod
+    async def get_retention(db: AsyncSession, channel_id: int) -> dict:
+        """A channel's retention policy and how much of its history is archived"""
+        result = await db.execute(
+            select(Channel.retention_days, Channel.retention_mode).where(Channel.id == channel_id)
+        )
+        policy = result.one_or_none()
+        if policy is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Channel not found"
+            )
+        result = await db.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(ArchiveSegment.message_count), 0),
+                func.coalesce(func.sum(ArchiveSegment.bytes), 0),
+            ).where(ArchiveSegment.channel_id == channel_id)
+        )
+        segments, archived, size = result.one()
+        days = policy.retention_days
+        return {
+            "channel_id": channel_id,
+            "retention_days": days,
+            "retention_mode": policy.retention_mode,
+            "effective_days": settings.RETENTION_DEFAULT_DAYS if days is None else days,
+            "archived_messages": archived,
+            "archive_segments": segments,
+            "archive_bytes": size,
+        }
+    
+    @staticmethod
+    async def set_retention(
+        db: AsyncSession, channel_id: int, user_id: int, policy: ChannelRetentionUpdate
+    ) -> dict:
+        """Change a channel's retention policy; only its creator may"""
+        channel = await AsyncChannelService.get_channel(db, channel_id)
+        if channel.created_by != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only the channel creator can change retention"
+            )
+        await db.execute(
+            update(Channel)
+            .where(Channel.id == channel_id)
+            .values(retention_days=policy.retention_days, retention_mode=policy.retention_mode)
+        )
+        await db.commit()
+        return await AsyncChannelService.get_retention(db, channel_id)
+    
+    @staticmethod
+    async def recount_members(db: AsyncSession):
+        """Rebuild member_count from user_channels, e.g. after memberships were edited by hand"""
+        await db.execute(recount_statement())
+        await db.commit()
+        channel_cache.clear()
@@ -0,0 +1,65 @@
+import time
+from typing import FrozenSet, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.database import AsyncSessionLocal
+from app.models.channel import user_channels
+
+class MembershipIndex:
+    """Cached per-user channel sets, read in front of user_channels.
+
+    Channel listing, WebSocket authorization and broadcast routing consult
+    this instead of the ORM relationships. Joins and leaves made through
+    AsyncChannelService update it in place; entries also expire after
+    ``ttl`` seconds, which bounds staleness for changes made by other
+    workers or scripts.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, maxsize: int = 10000, ttl: float = 30.0):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self._cache = LRUCache(maxsize)
+
+    async def channel_ids(self, user_id: int, db: Optional[AsyncSession] = None) -> FrozenSet[int]:
+        """Ids of the channels a user belongs to"""
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        
+        query = select(user_channels.c.channel_id).where(user_channels.c.user_id == user_id)
+        if db is not None:
+            result = await db.execute(query)
+        else:
+            async with self.session_factory() as session:
+                result = await session.execute(query)
+        channel_ids = frozenset(result.scalars())
+        self._cache.set(user_id, (time.monotonic() + self.ttl, channel_ids))
+        return channel_ids
+
+    async def is_member(self, user_id: int, channel_id: int, db: Optional[AsyncSession] = None) -> bool:
+        return channel_id in await self.channel_ids(user_id, db)
+
+    def added(self, user_id: int, channel_id: int):
+        """Record a join already committed to the database"""
+        entry = self._cache.get(user_id)
+        if entry is not None:
+            self._cache.set(user_id, (entry[0], entry[1] | {channel_id}))
+
+    def removed(self, user_id: int, channel_id: int):
+        """Record a leave already committed to the database"""
+        entry = self._cache.get(user_id)
+        if entry is not None:
+            self._cache.set(user_id, (entry[0], entry[1] - {channel_id}))
+
+    def invalidate(self, user_id: int):
+        self._cache.pop(user_id)
+
+    def get_stats(self) -> dict:
+        return self._cache.get_stats()
+
+membership_index = MembershipIndex(
+    maxsize=settings.MEMBERSHIP_CACHE_SIZE,
+    ttl=settings.MEMBERSHIP_CACHE_TTL_SECONDS,
+)
@@ -1,10 +1,46 @@
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
+from app.core.pagination import decode_cursor, encode_cursor
 from app.models.message import Message
 from app.models.user import User
 from app.schemas.message import MessageCreate
-from typing import List
+from app.services.archive_store import history_key, message_archive
+from app.services.channel_cache import channel_cache
+from app.services.channel_service import last_message_params, last_message_statement
+from typing import List, Optional, Tuple
 from fastapi import HTTPException, status
 
+# Columns served by the history endpoints: the author's username comes from
+# the same query, and rows are returned as-is without building ORM objects
+HISTORY_COLUMNS = (
+    Message.id,
+    Message.content,
+    Message.user_id,
+    User.username,
+    Message.channel_id,
+    Message.created_at,
+)
+
+def history_query():
+    return select(*HISTORY_COLUMNS).join(User, User.id == Message.user_id)
+
+def message_cursor(message: Message) -> str:
+    """Opaque history cursor pointing at a message"""
+    return encode_cursor(message.created_at, message.id)
+
+def decode_message_cursor(cursor: str) -> Tuple[datetime, int]:
+    created_at, message_id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
 class MessageService:
     @staticmethod
     def create_message(db: Session, message: MessageCreate, user_id: int) -> Message:
@@ -14,6 +50,10 @@ class MessageService:
             channel_id=message.channel_id
         )
         db.add(db_message)
+        db.flush()
+        db.execute(last_message_statement(), [last_message_params(
+            db_message.id, user_id, message.channel_id, message.content, db_message.created_at
+        )])
         db.commit()
         db.refresh(db_message)
         return db_message
@@ -34,3 +74,146 @@ class MessageService:
         
         # Reverse to get chronological order
         return list(reversed(messages))
+
+
+class AsyncMessageService:
+    """MessageService for AsyncSession; used by the API and WebSocket routes"""
+
+    @staticmethod
+    async def create_message(db: AsyncSession, message: MessageCreate, user_id: int) -> Message:
+        db_message = Message(
+            content=message.content,
+            user_id=user_id,
+            channel_id=message.channel_id
+        )
+        db.add(db_message)
+        # id and created_at are populated on flush and kept after commit,
+        # so no follow-up SELECT is needed
+        await db.flush()
+        params = last_message_params(
+            db_message.id, user_id, message.channel_id, message.content, db_message.created_at
+        )
+        await db.execute(last_message_statement(), [params])
+        await db.commit()
+        channel_cache.message_saved(
+            message.channel_id, db_message.id, user_id, params["b_preview"], db_message.created_at
+        )
+        return db_message
+    
+    @staticmethod
+    async def get_channel_messages(
+        db: AsyncSession,
+        channel_id: int,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[Row]:
+        """Get messages (with author username) for a channel with pagination.
+
+        Offsets only cover messages not yet archived; the cursor-paginated
+        history reads through the archive as well.
+        """
+        result = await db.execute(
+            history_query()
+            .where(Message.channel_id == channel_id)
+            .order_by(Message.created_at.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+        messages = result.all()
+        
+        # Reverse to get chronological order
+        return list(reversed(messages))
+    
+    @staticmethod
+    async def get_channel_messages_page(
+        db: AsyncSession,
+        channel_id: int,
+        limit: int = 50,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> Tuple[List[Row], Optional[str]]:
+        """Get a page of channel history, keyset-paginated on (created_at, id).
+
+        With no cursor this is the latest page; ``before`` walks back in
+        time and ``after`` forward. Messages are returned in chronological
+        order, with the cursor to continue in the same direction (or None).
+        Archived messages are merged in where they belong: walking back
+        reads segments once the messages table runs out, and a cursor
+        ``after`` checks the segments that follow it.
+        """
+        if before and after:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Use either before or after, not both"
+            )
+        
+        key = tuple_(Message.created_at, Message.id)
+        query = history_query().where(Message.channel_id == channel_id)
+        cursor = decode_message_cursor(after or before) if after or before else None
+        if after:
+            query = query.where(key > tuple_(*cursor))
+            query = query.order_by(Message.created_at.asc(), Message.id.asc())
+        else:
+            if before:
+                query = query.where(key < tuple_(*cursor))
+            query = query.order_by(Message.created_at.desc(), Message.id.desc())
+        
+        # One extra row tells us whether there is another page
+        result = await db.execute(query.limit(limit + 1))
+        messages = result.all()
+        if after:
+            archived = await message_archive.read_after(db, channel_id, cursor, limit + 1)
+            if archived:
+                messages = sorted(archived + messages, key=history_key)[:limit + 1]
+        elif len(messages) <= limit:
+            # Every hot message before the cursor is here; the rest of the
+            # page (and whether there is another) comes from the archive
+            archived = await message_archive.read_before(db, channel_id, cursor, limit + 1)
+            if archived:
+                messages = sorted(archived + messages, key=history_key, reverse=True)[:limit + 1]
+        next_cursor = message_cursor(messages[limit - 1]) if len(messages) > limit else None
+        messages = messages[:limit]
+        
+        if not after:
+            # Reverse to get chronological order
+            messages.reverse()
+        return messages, next_cursor
+    
+    @staticmethod
+    async def get_messages_after(
+        db: AsyncSession,
+        channel_id: int,
+        message_id: int,
+        limit: int = 100
+    ) -> List[Row]:
+        """Get the messages that follow a given message, oldest first.
+        
+        Archived messages are included, so a client that reconnects after
+        a long time still gets everything it missed.
+        """
+        result = await db.execute(
+            select(Message.created_at).where(
+                Message.id == message_id, Message.channel_id == channel_id
+            )
+        )
+        created_at = result.scalar_one_or_none()
+        if created_at is None:
+            archived = await message_archive.find(db, channel_id, message_id)
+            created_at = archived.created_at if archived is not None else None
+        
+        query = history_query().where(Message.channel_id == channel_id)
+        if created_at is not None:
+            key = tuple_(Message.created_at, Message.id)
+            query = query.where(key > tuple_(created_at, message_id))
+        else:
+            # Unknown message: fall back to id order
+            query = query.where(Message.id > message_id)
+        result = await db.execute(
+            query.order_by(Message.created_at.asc(), Message.id.asc()).limit(limit)
+        )
+        messages = result.all()
+        if created_at is not None:
+            archived = await message_archive.read_after(db, channel_id, (created_at, message_id), limit)
+            if archived:
+                messages = sorted(archived + messages, key=history_key)[:limit]
+        return messages
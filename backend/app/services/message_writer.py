@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+from sqlalchemy import insert
+from app.core.config import settings
+from app.core.metrics import COUNT_BUCKETS, registry
+from app.database import AsyncSessionLocal
+from app.models.message import Message
+from app.schemas.message import MessageCreate
+from app.services.channel_cache import channel_cache
+from app.services.channel_service import last_message_params, last_message_statement
+
+logger = logging.getLogger(__name__)
+
+MESSAGES_INGESTED = registry.counter("messages_ingested_total", "Chat messages committed to the database")
+FLUSH_SECONDS = registry.histogram("message_writer_flush_seconds", "Time to insert and commit one batch")
+BATCH_SIZE = registry.histogram(
+    "message_writer_batch_size", "Messages per committed batch", (), COUNT_BUCKETS
+)
+
+
+class SavedMessage(NamedTuple):
+    id: int
+    created_at: datetime
+
+
+class _Pending:
+    __slots__ = ("content", "user_id", "channel_id", "created_at", "future")
+
+    def __init__(self, content: str, user_id: int, channel_id: int, future: asyncio.Future):
+        self.content = content
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.created_at = datetime.utcnow()
+        self.future = future
+
+
+class MessageWriter:
+    """Write-behind pipeline that batches message inserts from all sockets.
+
+    Messages are queued and flushed with one multi-row INSERT ... RETURNING
+    every ``flush_interval_ms`` or as soon as ``max_batch_size`` are
+    waiting, whichever comes first. Each submitter gets a future resolved
+    with the row's id and timestamp once its batch has committed; if the
+    batch fails its messages are retried one by one and only those that
+    fail again fail their futures. The queue is bounded, so submitters
+    wait when the database falls behind.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        flush_interval_ms: float = 10,
+        max_batch_size: int = 500,
+        max_pending: int = 10000,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+        self.batches_flushed = 0
+        self.messages_flushed = 0
+        self.flush_errors = 0
+        self.messages_failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the pipeline"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, message: MessageCreate, user_id: int) -> asyncio.Future:
+        """Queue a message; the returned future resolves to a SavedMessage"""
+        if self._task is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        # Blocks while the queue is full: this is the backpressure point
+        await self._queue.put(_Pending(message.content, user_id, message.channel_id, future))
+        return future
+
+    async def write(self, message: MessageCreate, user_id: int) -> SavedMessage:
+        """Queue a message and wait until its batch has committed"""
+        return await (await self.submit(message, user_id))
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[_Pending]):
+        started = time.perf_counter()
+        try:
+            saved = await self._insert(batch)
+        except Exception as e:
+            self.flush_errors += 1
+            if len(batch) == 1:
+                logger.exception("Failed to write a message from user %s", batch[0].user_id)
+                self._fail(batch[0], e)
+                return
+            # Retry one at a time, so only the messages that fail again
+            # fail their senders rather than the whole batch
+            logger.exception("Failed to write a batch of %d messages, retrying one at a time", len(batch))
+            written = []
+            for item in batch:
+                try:
+                    written.append((item, (await self._insert([item]))[0]))
+                except Exception as item_error:
+                    logger.exception("Failed to write a message from user %s", item.user_id)
+                    self._fail(item, item_error)
+            batch = [item for item, _ in written]
+            saved = [row for _, row in written]
+            if not batch:
+                return
+
+        self.batches_flushed += 1
+        self.messages_flushed += len(batch)
+        FLUSH_SECONDS.observe(time.perf_counter() - started)
+        BATCH_SIZE.observe(len(batch))
+        MESSAGES_INGESTED.inc(len(batch))
+        for item, row in zip(batch, saved):
+            if not item.future.done():
+                item.future.set_result(row)
+
+    async def _insert(self, batch: List[_Pending]) -> List[SavedMessage]:
+        """Insert and commit messages with their channels' counters and previews"""
+        rows = [
+            {
+                "content": item.content,
+                "user_id": item.user_id,
+                "channel_id": item.channel_id,
+                "created_at": item.created_at,
+            }
+            for item in batch
+        ]
+        async with self.session_factory() as db:
+            result = await db.execute(
+                insert(Message).returning(
+                    Message.id, Message.created_at, sort_by_parameter_order=True
+                ),
+                rows,
+            )
+            saved = [SavedMessage(row.id, row.created_at) for row in result]
+            # One row per channel: its message count goes up by the batch's
+            # messages in it, and the newest one becomes its preview
+            latest = {}
+            for item, row in zip(batch, saved):
+                previous = latest.get(item.channel_id)
+                latest[item.channel_id] = last_message_params(
+                    row.id, item.user_id, item.channel_id, item.content, row.created_at,
+                    count=previous["b_count"] + 1 if previous else 1,
+                )
+            await db.execute(last_message_statement(), list(latest.values()))
+            await db.commit()
+
+        for params in latest.values():
+            channel_cache.message_saved(
+                params["b_channel_id"], params["b_message_id"], params["b_user_id"],
+                params["b_preview"], params["b_created_at"],
+            )
+        return saved
+
+    def _fail(self, item: _Pending, error: Exception):
+        self.messages_failed += 1
+        if not item.future.done():
+            item.future.set_exception(error)
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "batches_flushed": self.batches_flushed,
+            "messages_flushed": self.messages_flushed,
+            "flush_errors": self.flush_errors,
+            "messages_failed": self.messages_failed,
+        }
+
+
+message_writer = MessageWriter(
+    flush_interval_ms=settings.MESSAGE_BATCH_INTERVAL_MS,
+    max_batch_size=settings.MESSAGE_BATCH_SIZE,
+    max_pending=settings.MESSAGE_WRITER_MAX_PENDING,
+)
@@ -0,0 +1,290 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, bindparam, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.database import AsyncSessionLocal
+from app.models.archive_segment import ArchiveSegment
+from app.models.channel import Channel, user_channels
+from app.models.message import Message
+from app.models.read_marker import ReadMarker
+from app.services.archive_store import message_archive
+from app.services.channel_cache import channel_cache
+
+logger = logging.getLogger(__name__)
+
+def upsert(dialect_name: str):
+    """INSERT ... ON CONFLICT for the read_markers table"""
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    return dialect.insert(ReadMarker.__table__)
+
+def marker_statement(dialect_name: str):
+    """Executemany upsert moving markers forward (never back).
+
+    read_count is derived from the channel's counter minus the messages
+    after the marker, which is a short range scan on (channel_id, id) for
+    the usual marker near the end of a channel. Archived messages still
+    count toward message_count, so those after the marker are subtracted
+    too: whole segments from the manifest, plus ``b_archived_after`` for a
+    segment the marker falls inside (see archived_after_marker).
+    """
+    markers = ReadMarker.__table__
+    channels = Channel.__table__
+    messages = Message.__table__
+    segments = ArchiveSegment.__table__
+    total = select(channels.c.message_count).where(channels.c.id == bindparam("b_channel_id")).scalar_subquery()
+    after = (
+        select(func.count())
+        .select_from(messages)
+        .where(messages.c.channel_id == bindparam("b_channel_id"), messages.c.id > bindparam("b_message_id"))
+        .scalar_subquery()
+    )
+    archived_after = (
+        select(func.coalesce(func.sum(segments.c.message_count), 0))
+        .where(
+            segments.c.channel_id == bindparam("b_channel_id"),
+            segments.c.first_message_id > bindparam("b_message_id"),
+        )
+        .scalar_subquery()
+    )
+    statement = upsert(dialect_name).values(
+        user_id=bindparam("b_user_id"),
+        channel_id=bindparam("b_channel_id"),
+        last_read_message_id=bindparam("b_message_id"),
+        read_count=total - after - archived_after - bindparam("b_archived_after"),
+        updated_at=bindparam("b_updated_at"),
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[markers.c.user_id, markers.c.channel_id],
+        set_={
+            "last_read_message_id": statement.excluded.last_read_message_id,
+            "read_count": statement.excluded.read_count,
+            "updated_at": statement.excluded.updated_at,
+        },
+        where=markers.c.last_read_message_id < statement.excluded.last_read_message_id,
+    )
+
+async def archived_after_marker(db: AsyncSession, rows: List[dict]):
+    """Set each marker row's ``b_archived_after``: messages after the marker
+    in an archive segment whose id range contains it, read from the segment.
+    """
+    for row in rows:
+        row["b_archived_after"] = 0
+    if not rows:
+        return
+    result = await db.execute(
+        select(
+            ArchiveSegment.channel_id, ArchiveSegment.path,
+            ArchiveSegment.first_message_id, ArchiveSegment.last_message_id,
+        ).where(
+            ArchiveSegment.channel_id.in_({row["b_channel_id"] for row in rows}),
+            ArchiveSegment.last_message_id > min(row["b_message_id"] for row in rows),
+        )
+    )
+    segments: Dict[int, list] = {}
+    for channel_id, path, first_id, last_id in result:
+        segments.setdefault(channel_id, []).append((path, first_id, last_id))
+    for row in rows:
+        message_id = row["b_message_id"]
+        for path, first_id, last_id in segments.get(row["b_channel_id"], ()):
+            if first_id <= message_id < last_id:
+                archived = await message_archive.read_segment(path)
+                row["b_archived_after"] += sum(1 for message in archived if message.id > message_id)
+
+def caught_up_statement(dialect_name: str, channel_id: int, user_id: int):
+    """Marker at the channel's newest message, so a new member starts with nothing unread"""
+    channels = Channel.__table__
+    statement = upsert(dialect_name).from_select(
+        ["user_id", "channel_id", "last_read_message_id", "read_count", "updated_at"],
+        select(
+            literal(user_id),
+            channels.c.id,
+            func.coalesce(channels.c.last_message_id, 0),
+            channels.c.message_count,
+            literal(datetime.utcnow()),
+        ).where(channels.c.id == channel_id),
+    )
+    return statement.on_conflict_do_update(
+        index_elements=["user_id", "channel_id"],
+        set_={
+            "last_read_message_id": statement.excluded.last_read_message_id,
+            "read_count": statement.excluded.read_count,
+            "updated_at": statement.excluded.updated_at,
+        },
+    )
+
+def unread_query(user_id: int):
+    """Unread count, marker and newest message for every channel of a user, in one query"""
+    return (
+        select(
+            Channel.id,
+            Channel.message_count - func.coalesce(ReadMarker.read_count, 0),
+            ReadMarker.last_read_message_id,
+            Channel.last_message_id,
+        )
+        .select_from(user_channels)
+        .join(Channel, Channel.id == user_channels.c.channel_id)
+        .outerjoin(
+            ReadMarker,
+            and_(ReadMarker.user_id == user_channels.c.user_id, ReadMarker.channel_id == user_channels.c.channel_id),
+        )
+        .where(user_channels.c.user_id == user_id)
+        .order_by(Channel.id)
+    )
+
+class ReadMarkerService:
+    """Per-user, per-channel read positions, written in batches.
+
+    Marks (from sockets or the REST endpoint) are coalesced in memory,
+    keeping the furthest message per user and channel, and upserted with
+    one executemany statement every ``flush_seconds`` or once
+    ``max_pending`` markers are waiting. If that statement fails the
+    markers are written one at a time and the ones that still fail are
+    dropped, so a bad marker cannot hold back everyone else's.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, flush_seconds: float = 2.0, max_pending: int = 10000):
+        self.session_factory = session_factory
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.marks = 0
+        self.markers_written = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.markers_dropped = 0
+        # {(user_id, channel_id): message_id} waiting for the next flush
+        self._pending: Dict[Tuple[int, int], int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._early_flush: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the loop and write any markers still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def accepts(self, channel_id: int, message_id: int, db: Optional[AsyncSession] = None) -> bool:
+        """Whether ``message_id`` is a position in the channel: 1 up to its newest message.
+
+        The cached newest message may lag messages saved by other workers,
+        so an id past it is checked against a fresh load before refusing.
+        """
+        if message_id <= 0:
+            return False
+        channel = await channel_cache.get(channel_id, db)
+        if channel is not None and channel.last_message is not None and message_id <= channel.last_message.id:
+            return True
+        channel_cache.invalidate(channel_id)
+        channel = await channel_cache.get(channel_id, db)
+        return channel is not None and channel.last_message is not None and message_id <= channel.last_message.id
+
+    def mark(self, user_id: int, channel_id: int, message_id: int):
+        """Record that a user has read a channel up to ``message_id``"""
+        self.marks += 1
+        key = (user_id, channel_id)
+        if message_id > self._pending.get(key, 0):
+            self._pending[key] = message_id
+        if len(self._pending) >= self.max_pending and (self._early_flush is None or self._early_flush.done()):
+            self._early_flush = asyncio.create_task(self.flush())
+
+    def forget(self, user_id: int, channel_id: int):
+        """Drop a buffered marker, e.g. when the user leaves the channel"""
+        self._pending.pop((user_id, channel_id), None)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        now = datetime.utcnow()
+        rows = [
+            {"b_user_id": user_id, "b_channel_id": channel_id, "b_message_id": message_id, "b_updated_at": now}
+            for (user_id, channel_id), message_id in pending.items()
+        ]
+        try:
+            async with self.session_factory() as db:
+                await archived_after_marker(db, rows)
+                await db.execute(marker_statement(db.bind.dialect.name), rows)
+                await db.commit()
+        except Exception:
+            self.flush_errors += 1
+            logger.exception("Error writing %d read markers, retrying one at a time", len(rows))
+            written = await self._write_each(rows)
+        else:
+            written = len(rows)
+        self.flushes += 1
+        self.markers_written += written
+
+    async def _write_each(self, rows: List[dict]) -> int:
+        """Upsert markers one per transaction, dropping the ones that fail"""
+        written = 0
+        async with self.session_factory() as db:
+            statement = marker_statement(db.bind.dialect.name)
+            for row in rows:
+                try:
+                    await archived_after_marker(db, [row])
+                    await db.execute(statement, [row])
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    self.markers_dropped += 1
+                    logger.warning(
+                        "Dropped read marker for user %s in channel %s", row["b_user_id"], row["b_channel_id"]
+                    )
+                    continue
+                written += 1
+        return written
+
+    async def unread(self, db: AsyncSession, user_id: int) -> List[dict]:
+        """Unread counts for all of a user's channels.
+
+        Markers still buffered on this worker are applied on top: a channel
+        read up to its newest message reports 0 right away. Older buffered
+        markers show up in the counts after the next flush.
+        """
+        result = await db.execute(unread_query(user_id))
+        channels = []
+        for channel_id, unread, last_read_id, last_message_id in result:
+            pending = self._pending.get((user_id, channel_id))
+            if pending is not None and pending > (last_read_id or 0):
+                last_read_id = pending
+                if pending >= (last_message_id or 0):
+                    unread = 0
+            channels.append({
+                "channel_id": channel_id,
+                "unread_count": max(0, unread),
+                "last_read_message_id": last_read_id,
+                "last_message_id": last_message_id,
+            })
+        return channels
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "marks": self.marks,
+            "markers_written": self.markers_written,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "markers_dropped": self.markers_dropped,
+        }
+
+read_markers = ReadMarkerService(
+    flush_seconds=settings.READ_MARKER_FLUSH_SECONDS,
+    max_pending=settings.READ_MARKER_MAX_PENDING,
+)
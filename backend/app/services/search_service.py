@@ -0,0 +1,110 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import Float, and_, cast, column, func, literal_column, or_, select, table
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.pagination import decode_cursor, encode_cursor
+from app.models.message import Message
+from app.models.user import User
+from app.services.message_service import HISTORY_COLUMNS
+
+# Queries are reduced to plain words, all of which must match
+MAX_QUERY_TERMS = 16
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+
+# SQLite's FTS5 index (see migrations/versions/0003_message_search.py)
+messages_fts = table("messages_fts", column("rowid"))
+FTS_TABLE = literal_column("messages_fts")
+
+# PostgreSQL's generated tsvector column (see migrations/versions/0003_message_search.py)
+SEARCH_VECTOR = literal_column("messages.search_vector")
+HEADLINE_OPTIONS = (
+    f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, "
+    "MaxWords=24, MinWords=8, MaxFragments=2, FragmentDelimiter= … "
+)
+
+def search_terms(query: str) -> List[str]:
+    terms = re.findall(r"\w+", query.lower())[:MAX_QUERY_TERMS]
+    if not terms:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Search query has no words to match"
+        )
+    return terms
+
+def search_query(rank, snippet):
+    """History columns plus relevance and a highlighted snippet"""
+    return select(*HISTORY_COLUMNS, rank.label("rank"), snippet.label("snippet"))
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    rank, message_id = decode_cursor(cursor, 2)
+    try:
+        return float(rank), int(message_id)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+class AsyncSearchService:
+    """Ranked full-text search over messages.content.
+
+    Uses the tsvector/GIN index on PostgreSQL and the FTS5 index on SQLite;
+    both are maintained by the database as messages are inserted. Results
+    come best match first, with a highlighted snippet, and are paginated
+    with a (rank, id) cursor.
+    """
+
+    @staticmethod
+    async def search(
+        db: AsyncSession,
+        query: str,
+        channel_ids: Iterable[int],
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Row], Optional[str]]:
+        """Search the given channels; returns a page of rows and the next cursor"""
+        terms = search_terms(query)
+        channel_ids = list(channel_ids)
+        if not channel_ids:
+            return [], None
+
+        if db.bind.dialect.name == "postgresql":
+            tsquery = func.plainto_tsquery("english", " ".join(terms))
+            rank = cast(func.ts_rank_cd(SEARCH_VECTOR, tsquery), Float)
+            snippet = func.ts_headline("english", Message.content, tsquery, HEADLINE_OPTIONS)
+            statement = (
+                search_query(rank, snippet)
+                .join(User, User.id == Message.user_id)
+                .where(SEARCH_VECTOR.op("@@")(tsquery))
+            )
+        else:
+            # Quoted terms keep FTS5 query syntax out of user input
+            match = " ".join(f'"{term}"' for term in terms)
+            rank = -func.bm25(FTS_TABLE)
+            snippet = func.snippet(FTS_TABLE, 0, HIGHLIGHT_START, HIGHLIGHT_STOP, " … ", 16)
+            statement = (
+                search_query(rank, snippet)
+                .select_from(messages_fts)
+                .join(Message, Message.id == messages_fts.c.rowid)
+                .join(User, User.id == Message.user_id)
+                .where(FTS_TABLE.op("MATCH")(match))
+            )
+
+        statement = statement.where(Message.channel_id.in_(channel_ids))
+        if cursor:
+            last_rank, last_id = decode_search_cursor(cursor)
+            statement = statement.where(
+                or_(rank < last_rank, and_(rank == last_rank, Message.id < last_id))
+            )
+
+        # One extra row tells us whether there is another page
+        result = await db.execute(statement.order_by(rank.desc(), Message.id.desc()).limit(limit + 1))
+        rows = result.all()
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last.rank, last.id)
+        return rows[:limit], next_cursor
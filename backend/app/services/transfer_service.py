@@ -0,0 +1,429 @@
+import csv
+import io
+import json
+import logging
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.metrics import registry
+from app.database import AsyncSessionLocal
+from app.models.channel import Channel, user_channels
+from app.models.message import Message
+from app.models.user import User
+from app.services.archive_store import message_archive
+from app.services.channel_cache import channel_cache
+from app.services.channel_service import last_message_params, last_message_statement
+from app.services.message_service import history_query
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_ROWS = registry.counter(
+    "message_transfer_rows_total", "Messages exported or imported in bulk", ("direction",)
+)
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+CSV_COLUMNS = ("id", "channel_id", "user_id", "username", "created_at", "content")
+# Rejected import rows reported back in full; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+class Transfer:
+    """Progress of one export or import, as reported by GET /transfers/{id}"""
+
+    __slots__ = (
+        "id", "kind", "user_id", "channel_id", "format", "status", "rows", "rejected", "bytes",
+        "total_rows", "total_bytes", "errors", "started_at", "finished_at", "_started"
+    )
+
+    def __init__(self, kind: str, user_id: int, channel_id: int, format: str, total_bytes: Optional[int] = None):
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.format = format
+        self.status = "running"
+        self.rows = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.total_rows: Optional[int] = None
+        self.total_bytes = total_bytes
+        self.errors: List[dict] = []
+        self.started_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self._started = time.monotonic()
+
+    def reject(self, line: int, error: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def to_dict(self) -> dict:
+        progress = None
+        if self.status == "completed":
+            progress = 1.0
+        elif self.total_rows:
+            progress = min(1.0, self.rows / self.total_rows)
+        elif self.total_bytes:
+            progress = min(1.0, self.bytes / self.total_bytes)
+        elapsed = (self.finished_at - self.started_at).total_seconds() if self.finished_at else (
+            time.monotonic() - self._started
+        )
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "channel_id": self.channel_id,
+            "format": self.format,
+            "status": self.status,
+            "rows": self.rows,
+            "rejected": self.rejected,
+            "bytes": self.bytes,
+            "total_rows": self.total_rows,
+            "total_bytes": self.total_bytes,
+            "progress": progress,
+            "rows_per_second": self.rows / elapsed if elapsed > 0 else 0.0,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "errors": self.errors,
+        }
+
+class TransferRegistry:
+    """Running and recently finished transfers of this worker.
+
+    Transfers are kept in memory, so progress is only visible on the worker
+    serving the export or import; the oldest are forgotten once ``maxsize``
+    are tracked.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.started = 0
+        self.failed = 0
+        self.active = 0
+        self._transfers = LRUCache(maxsize)
+
+    def start(self, kind: str, user_id: int, channel_id: int, format: str, total_bytes: Optional[int] = None) -> Transfer:
+        transfer = Transfer(kind, user_id, channel_id, format, total_bytes)
+        self._transfers.set(transfer.id, transfer)
+        self.started += 1
+        self.active += 1
+        return transfer
+
+    def finish(self, transfer: Transfer, completed: bool):
+        transfer.status = "completed" if completed else "failed"
+        transfer.finished_at = datetime.utcnow()
+        self.active -= 1
+        if not completed:
+            self.failed += 1
+
+    def get(self, transfer_id: str, user_id: int) -> Optional[Transfer]:
+        """A transfer started by ``user_id``; None for anyone else's"""
+        transfer = self._transfers.get(transfer_id)
+        return transfer if transfer is not None and transfer.user_id == user_id else None
+
+    def for_user(self, user_id: int) -> List[Transfer]:
+        """A user's transfers, newest first"""
+        found = [t for t in self._transfers.values() if t.user_id == user_id]
+        return sorted(found, key=lambda t: t.started_at, reverse=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "tracked": len(self._transfers),
+            "active": self.active,
+            "started": self.started,
+            "failed": self.failed,
+        }
+
+transfers = TransferRegistry(maxsize=settings.TRANSFER_HISTORY_SIZE)
+
+def encode_ndjson(rows: Iterable) -> str:
+    return "".join(
+        json.dumps({
+            "id": row.id,
+            "channel_id": row.channel_id,
+            "user_id": row.user_id,
+            "username": row.username,
+            "created_at": row.created_at.isoformat(),
+            "content": row.content,
+        }, ensure_ascii=False, separators=(",", ":")) + "\n"
+        for row in rows
+    )
+
+def encode_csv(rows: Iterable) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows(
+        (row.id, row.channel_id, row.user_id, row.username, row.created_at.isoformat(), row.content)
+        for row in rows
+    )
+    return buffer.getvalue()
+
+ENCODERS = {"ndjson": encode_ndjson, "csv": encode_csv}
+
+async def read_lines(chunks: AsyncIterator[bytes], transfer: Transfer, max_bytes: int):
+    """Split a streamed body into numbered lines of at most ``max_bytes``.
+
+    Longer lines are skipped and yielded as None, so one bad row cannot
+    make the import buffer an unbounded amount of the body.
+    """
+    buffer = b""
+    line_number = 0
+    skipping = False
+    async for chunk in chunks:
+        transfer.bytes += len(chunk)
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line_number += 1
+            yield line_number, None if skipping or end - start > max_bytes else buffer[start:end]
+            skipping = False
+            start = end + 1
+        buffer = buffer[start:]
+        if len(buffer) > max_bytes:
+            # Drop the oversized line's head and keep skipping until its end
+            skipping = True
+            buffer = b""
+    if buffer or skipping:
+        yield line_number + 1, None if skipping else buffer
+
+def parse_created_at(value) -> datetime:
+    if value in (None, ""):
+        return datetime.utcnow()
+    created_at = datetime.fromisoformat(value)
+    if created_at.tzinfo is not None:
+        # Stored as naive UTC, like every other timestamp
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at
+
+def parse_record(record: dict) -> Tuple[str, datetime, Optional[str], Optional[int]]:
+    """(content, created_at, username, user_id) of one imported row; ValueError if invalid"""
+    content = record.get("content")
+    if not isinstance(content, str) or not content:
+        raise ValueError("content must be a non-empty string")
+    username = record.get("username") or None
+    user_id = record.get("user_id")
+    if username is None and user_id in (None, ""):
+        raise ValueError("username or user_id is required")
+    if username is not None and not isinstance(username, str):
+        raise ValueError("username must be a string")
+    return content, parse_created_at(record.get("created_at")), username, (
+        int(user_id) if username is None else None
+    )
+
+async def parse_ndjson(lines):
+    async for line_number, line in lines:
+        if line is None:
+            yield line_number, "line too long"
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+            yield line_number, parse_record(record)
+        except (ValueError, TypeError) as e:
+            yield line_number, str(e)
+
+async def parse_csv(lines):
+    """CSV rows with a header; quoted fields may span lines"""
+    header = None
+    pending = []
+    first_line = 0
+    async for line_number, line in lines:
+        if line is None:
+            pending = []
+            yield line_number, "line too long"
+            continue
+        if not pending:
+            first_line = line_number
+        pending.append(line.decode("utf-8", errors="replace"))
+        text = "\n".join(pending)
+        if text.count('"') % 2:
+            # Inside a quoted field: the record continues on the next line
+            if len(text) > settings.TRANSFER_MAX_LINE_BYTES:
+                pending = []
+                yield first_line, "record too long"
+            continue
+        pending = []
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            yield first_line, str(e)
+            continue
+        if header is None:
+            header = values
+            continue
+        try:
+            yield first_line, parse_record(dict(zip(header, values)))
+        except (ValueError, TypeError) as e:
+            yield first_line, str(e)
+    if pending:
+        yield first_line, "unterminated quoted field"
+
+PARSERS = {"ndjson": parse_ndjson, "csv": parse_csv}
+
+class AuthorResolver:
+    """Maps imported authors to the ids of channel members, asking the database once per batch.
+
+    Only members may be named as authors, so an import cannot put words
+    in the mouth of someone outside the channel.
+    """
+
+    def __init__(self, channel_id: int):
+        self.channel_id = channel_id
+        self.by_username: Dict[str, int] = {}
+        self.user_ids: Set[int] = set()
+        self.unknown_usernames: Set[str] = set()
+        self.unknown_user_ids: Set[int] = set()
+
+    def members(self, *columns):
+        return select(*columns).join(
+            user_channels,
+            (user_channels.c.user_id == User.id) & (user_channels.c.channel_id == self.channel_id),
+        )
+
+    async def resolve(self, db: AsyncSession, rows: List[tuple]):
+        usernames = {
+            username for _, (_, _, username, _) in rows
+            if username is not None and username not in self.by_username and username not in self.unknown_usernames
+        }
+        user_ids = {
+            user_id for _, (_, _, _, user_id) in rows
+            if user_id is not None and user_id not in self.user_ids and user_id not in self.unknown_user_ids
+        }
+        if usernames:
+            result = await db.execute(self.members(User.id, User.username).where(User.username.in_(usernames)))
+            for user_id, username in result:
+                self.by_username[username] = user_id
+            self.unknown_usernames.update(usernames.difference(self.by_username))
+        if user_ids:
+            result = await db.execute(self.members(User.id).where(User.id.in_(user_ids)))
+            found = set(result.scalars())
+            self.user_ids.update(found)
+            self.unknown_user_ids.update(user_ids - found)
+
+    def author(self, username: Optional[str], user_id: Optional[int]) -> Optional[int]:
+        if username is not None:
+            return self.by_username.get(username)
+        return user_id if user_id in self.user_ids else None
+
+async def message_batches(db: AsyncSession, channel_id: int):
+    """A channel's archived messages, then the rest from a server-side cursor, in batches"""
+    async for rows in message_archive.iter_channel(db, channel_id):
+        yield rows
+    stream = await db.stream(
+        history_query()
+        .where(Message.channel_id == channel_id)
+        .order_by(Message.id)
+        .execution_options(yield_per=settings.TRANSFER_EXPORT_BATCH_SIZE)
+    )
+    async for rows in stream.partitions():
+        yield rows
+
+class AsyncTransferService:
+    """Bulk export and import of a channel's history"""
+
+    @staticmethod
+    async def export_messages(channel_id: int, format: str, transfer: Transfer) -> AsyncIterator[bytes]:
+        """Stream a channel's messages, oldest first, in NDJSON or CSV.
+
+        Archived messages come first, a segment at a time, then rows from a
+        server-side cursor ``TRANSFER_EXPORT_BATCH_SIZE`` at a time. Each
+        batch is encoded and sent before the next is read, so memory stays
+        flat however long the channel is.
+        """
+        encode = ENCODERS[format]
+        completed = False
+        try:
+            if format == "csv":
+                header = (",".join(CSV_COLUMNS) + "\n").encode()
+                transfer.bytes += len(header)
+                yield header
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(Channel.message_count).where(Channel.id == channel_id))
+                transfer.total_rows = result.scalar_one_or_none()
+                async for rows in message_batches(db, channel_id):
+                    chunk = encode(rows).encode()
+                    transfer.rows += len(rows)
+                    transfer.bytes += len(chunk)
+                    TRANSFER_ROWS.inc(len(rows), ("export",))
+                    yield chunk
+            completed = True
+        finally:
+            transfers.finish(transfer, completed)
+
+    @staticmethod
+    async def import_messages(channel_id: int, format: str, body: AsyncIterator[bytes], transfer: Transfer) -> Transfer:
+        """Insert the messages of an NDJSON or CSV body into a channel.
+
+        Rows carry ``content``, an author (``username``, or ``user_id``) and
+        optionally ``created_at``; other fields, such as the ``id`` of an
+        export, are ignored. Every ``TRANSFER_IMPORT_BATCH_SIZE`` rows are
+        written with one multi-row INSERT and committed, together with the
+        channel's message counter and last message. Invalid rows and authors
+        who are not members of the channel are rejected and reported,
+        without stopping the import.
+        """
+        resolver = AuthorResolver(channel_id)
+        batch = []
+        completed = False
+        try:
+            async with AsyncSessionLocal() as db:
+                lines = read_lines(body, transfer, settings.TRANSFER_MAX_LINE_BYTES)
+                async for line_number, parsed in PARSERS[format](lines):
+                    if isinstance(parsed, str):
+                        transfer.reject(line_number, parsed)
+                        continue
+                    batch.append((line_number, parsed))
+                    if len(batch) >= settings.TRANSFER_IMPORT_BATCH_SIZE:
+                        await AsyncTransferService._write_batch(db, channel_id, batch, resolver, transfer)
+                        batch = []
+                if batch:
+                    await AsyncTransferService._write_batch(db, channel_id, batch, resolver, transfer)
+            completed = True
+        except Exception:
+            logger.exception("Import into channel %d failed after %d rows", channel_id, transfer.rows)
+        finally:
+            transfers.finish(transfer, completed)
+            if transfer.rows:
+                channel_cache.invalidate(channel_id)
+        return transfer
+
+    @staticmethod
+    async def _write_batch(
+        db: AsyncSession, channel_id: int, batch: List[tuple], resolver: AuthorResolver, transfer: Transfer
+    ):
+        await resolver.resolve(db, batch)
+        rows = []
+        for line_number, (content, created_at, username, user_id) in batch:
+            author = resolver.author(username, user_id)
+            if author is None:
+                transfer.reject(line_number, f"author {username or user_id} is not a member of this channel")
+                continue
+            rows.append({"content": content, "user_id": author, "channel_id": channel_id, "created_at": created_at})
+        if not rows:
+            return
+
+        # An executemany INSERT with RETURNING is sent as multi-row INSERT ...
+        # VALUES statements of up to 1000 rows, compiled once
+        messages = Message.__table__
+        result = await db.execute(
+            insert(messages).returning(messages.c.id, sort_by_parameter_order=True), rows
+        )
+        # The batch's newest message, by id, becomes the channel's preview
+        # (unless a live message is newer still)
+        newest_id, newest = max(zip(result.scalars(), rows), key=lambda pair: pair[0])
+        await db.execute(last_message_statement(), [last_message_params(
+            newest_id, newest["user_id"], channel_id, newest["content"], newest["created_at"], count=len(rows)
+        )])
+        await db.commit()
+        transfer.rows += len(rows)
+        TRANSFER_ROWS.inc(len(rows), ("import",))
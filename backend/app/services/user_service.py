@@ -1,8 +1,24 @@
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.schemas.user import UserCreate
-from app.core.security import get_password_hash, verify_password
+from app.core.auth_cache import token_cache
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.security import get_password_hash, password_hasher, verify_password
 from fastapi import HTTPException, status
+from typing import Dict, Iterable, Optional
+
+# user id -> username, shared by the history, search and WebSocket paths
+username_cache = LRUCache(settings.USERNAME_CACHE_SIZE)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_user(mapper, connection, target: User):
+    """Drop cached data for a user whenever the row changes"""
+    username_cache.pop(target.id)
+    token_cache.invalidate_user(target.id)
 
 class UserService:
     @staticmethod
@@ -47,3 +63,69 @@ class UserService:
     @staticmethod
     def get_user_by_username(db: Session, username: str) -> User:
         return db.query(User).filter(User.username == username).first()
+
+
+class AsyncUserService:
+    """UserService for AsyncSession; used by the API routes"""
+
+    @staticmethod
+    async def create_user(db: AsyncSession, user: UserCreate) -> User:
+        # Check if username exists
+        result = await db.execute(select(User.id).where(User.username == user.username))
+        if result.first():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already registered"
+            )
+        
+        # Check if email exists
+        result = await db.execute(select(User.id).where(User.email == user.email))
+        if result.first():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered"
+            )
+        
+        # Create new user; bcrypt runs on its own bounded pool, off the event loop
+        hashed_password = await password_hasher.hash(user.password)
+        db_user = User(
+            username=user.username,
+            email=user.email,
+            hashed_password=hashed_password
+        )
+        db.add(db_user)
+        await db.commit()
+        return db_user
+    
+    @staticmethod
+    async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+        user = await AsyncUserService.get_user_by_username(db, username)
+        if not user:
+            return None
+        if not await password_hasher.verify(password, user.hashed_password):
+            return None
+        return user
+    
+    @staticmethod
+    async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+        result = await db.execute(select(User).where(User.username == username))
+        return result.scalar_one_or_none()
+    
+    @staticmethod
+    async def get_usernames(db: AsyncSession, user_ids: Iterable[int]) -> Dict[int, str]:
+        """Resolve user ids to usernames, querying only for cache misses"""
+        usernames = {}
+        missing = set()
+        for user_id in user_ids:
+            username = username_cache.get(user_id)
+            if username is None:
+                missing.add(user_id)
+            else:
+                usernames[user_id] = username
+        
+        if missing:
+            result = await db.execute(select(User.id, User.username).where(User.id.in_(missing)))
+            for user_id, username in result:
+                username_cache.set(user_id, username)
+                usernames[user_id] = username
+        return usernames
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict
+from sqlalchemy import select, text
+from app.core.config import settings
+from app.database import AsyncSessionLocal, async_engine
+from app.models.channel import Channel
+from app.services.channel_cache import channel_cache
+from app.services.user_service import username_cache
+from app.websocket.wire import missing_encoders
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+# Milliseconds spent in each boot phase of this worker, see /stats
+boot_timings: Dict[str, float] = {}
+
+@contextmanager
+def phase(name: str):
+    """Time a boot phase into boot_timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        boot_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+def upgrade_schema():
+    """alembic upgrade head, for DB_MIGRATE_ON_STARTUP"""
+    # Imported here: only needed when migrating, and alembic is slow to import
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    # Keep the app's logging configuration
+    config.attributes["configure_logging"] = False
+    command.upgrade(config, "head")
+
+def check_encoders():
+    """Warn when the optional wire encoders are missing from the install"""
+    missing = missing_encoders()
+    if missing:
+        logger.warning(
+            "%s not installed: falling back to stdlib json%s",
+            ", ".join(missing),
+            " and not offering the MessagePack subprotocol" if "msgpack" in missing else "",
+        )
+
+async def run_migrations():
+    # env.py drives its own event loop, so run it on a thread
+    await asyncio.to_thread(upgrade_schema)
+
+async def warm_pool(connections: int):
+    """Open pooled connections now rather than on the first requests"""
+    connections = min(connections, settings.DB_POOL_SIZE)
+
+    async def open_connection():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # Held concurrently, so each one is a separate connection
+    await asyncio.gather(*(open_connection() for _ in range(connections)))
+
+async def warm_caches(channels: int):
+    """Load the most recently active channels (and their last authors' names)
+
+    Channels without messages sort last: PostgreSQL puts NULLs first in a
+    descending sort otherwise.
+    """
+    channels = min(channels, settings.CHANNEL_CACHE_SIZE)
+    if channels <= 0:
+        return
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Channel.id).order_by(Channel.last_message_at.desc().nulls_last()).limit(channels)
+        )
+        summaries = await channel_cache.get_many(result.scalars().all(), db)
+    for summary in summaries:
+        if summary.last_message is not None and summary.last_message.username is not None:
+            username_cache.set(summary.last_message.user_id, summary.last_message.username)
+
+async def warm_up():
+    """Pool and cache warm-up; failures are logged and never stop the worker"""
+    try:
+        with phase("warm_pool_ms"):
+            await warm_pool(settings.DB_WARMUP_CONNECTIONS)
+        with phase("warm_caches_ms"):
+            await warm_caches(settings.STARTUP_WARM_CHANNELS)
+    except Exception:
+        logger.exception("Warm-up failed; continuing with cold pool and caches")
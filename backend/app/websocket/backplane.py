@@ -0,0 +1,310 @@
+import asyncio
+import importlib
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Largest datagram sent between workers; bigger envelopes go as fragments.
+# Well under Linux's default socket send buffer (net.core.wmem_default).
+MAX_DATAGRAM = 65536
+# Incomplete fragmented envelopes kept per worker while the rest arrive
+MAX_PENDING_FRAGMENTS = 64
+# Tries, FRAGMENT_RETRY_SECONDS apart, to get a fragment into a full peer queue
+FRAGMENT_SEND_ATTEMPTS = 50
+FRAGMENT_RETRY_SECONDS = 0.002
+
+# Called with every envelope that should be fanned out to this worker's sockets
+Deliver = Callable[[dict], None]
+
+
+class LatencyStats:
+    """Running summary of cross-worker delivery latency, in milliseconds"""
+
+    __slots__ = ("count", "total_ms", "max_ms", "last_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def observe(self, sent_at: float):
+        elapsed_ms = max(0.0, (time.time() - sent_at) * 1000)
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.last_ms = elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+            "last_ms": self.last_ms,
+        }
+
+
+class Backplane(ABC):
+    """Transport that carries channel broadcasts between workers.
+
+    Implementations must hand every published envelope to ``deliver`` in
+    every worker, including the publishing one. A broker-backed backend
+    (Redis, NATS, ...) subclasses this, publishes the JSON envelope to its
+    topic in ``publish`` and calls ``self.receive`` for each envelope read
+    from its subscription; it can then be selected with
+    ``BACKPLANE_BACKEND=package.module:ClassName``.
+    """
+
+    def __init__(self, deliver: Deliver):
+        self.deliver = deliver
+        self.origin = uuid.uuid4().hex
+        self.published = 0
+        self.received = 0
+        self.latency = LatencyStats()
+
+    async def start(self):
+        """Connect the transport (called once the event loop is running)"""
+
+    async def stop(self):
+        """Release the transport"""
+
+    @abstractmethod
+    async def publish(self, channel_id: int, message: dict, exclude_user: Optional[int] = None):
+        """Send a channel broadcast to every worker"""
+
+    def envelope(self, channel_id: int, message: dict, exclude_user: Optional[int]) -> dict:
+        return {
+            "origin": self.origin,
+            "channel_id": channel_id,
+            "exclude_user": exclude_user,
+            "message": message,
+            "sent_at": time.time(),
+        }
+
+    def receive(self, envelope: dict):
+        """Deliver an envelope that arrived from another worker"""
+        if envelope.get("origin") == self.origin:
+            return
+        self.received += 1
+        self.latency.observe(envelope["sent_at"])
+        self.deliver(envelope)
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "published": self.published,
+            "received": self.received,
+            "latency": self.latency.as_dict(),
+        }
+
+
+class InProcessBackplane(Backplane):
+    """Single-worker backend: publishing is a direct local delivery"""
+
+    async def publish(self, channel_id: int, message: dict, exclude_user: Optional[int] = None):
+        self.published += 1
+        self.deliver(self.envelope(channel_id, message, exclude_user))
+
+
+class UnixSocketBackplane(Backplane):
+    """Multi-worker backend for a single host, over Unix datagram sockets.
+
+    Every worker binds a socket in a shared directory and sends each
+    envelope to all the other sockets it finds there. New workers announce
+    themselves on start; peers that have gone away are pruned on the first
+    failed send. An envelope larger than MAX_DATAGRAM is sent as numbered
+    fragments, each a JSON header line followed by a slice of the envelope,
+    and reassembled by the receiver.
+    """
+
+    def __init__(self, deliver: Deliver, socket_dir: str, refresh_interval: float = 2.0):
+        super().__init__(deliver)
+        self.socket_dir = socket_dir
+        self.refresh_interval = refresh_interval
+        self.path = os.path.join(socket_dir, f"{os.getpid()}-{self.origin[:8]}.sock")
+        self.send_errors = 0
+        self.fragmented = 0
+        self._sock: Optional[socket.socket] = None
+        # {(origin, envelope id): {fragment index: bytes}}, oldest first
+        self._fragments: "OrderedDict[tuple, Dict[int, bytes]]" = OrderedDict()
+        self._next_fragment_id = 0
+        self._peers: Dict[str, None] = {}
+        self._peers_scanned_at = 0.0
+
+    async def start(self):
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(self.path)
+        asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+        self._send_to_peers(json.dumps({"origin": self.origin, "hello": self.path}).encode())
+
+    async def stop(self):
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def publish(self, channel_id: int, message: dict, exclude_user: Optional[int] = None):
+        self.published += 1
+        envelope = self.envelope(channel_id, message, exclude_user)
+        self.deliver(envelope)
+        if self._sock is not None:
+            data = json.dumps(envelope).encode()
+            if len(data) <= MAX_DATAGRAM:
+                self._send_to_peers(data, channel_id)
+            else:
+                await self._send_fragments(data, channel_id)
+
+    async def _send_fragments(self, data: bytes, channel_id: int):
+        """Send an envelope too large for one datagram in MAX_DATAGRAM sized pieces.
+
+        A burst of fragments can fill a peer's receive queue, so a fragment
+        that does not fit is retried shortly rather than dropped.
+        """
+        self.fragmented += 1
+        self._next_fragment_id += 1
+        # Room for the header line in front of each slice
+        size = MAX_DATAGRAM - 256
+        count = -(-len(data) // size)
+        peers = self._peer_paths()
+        for index in range(count):
+            header = json.dumps({
+                "origin": self.origin, "fragment": self._next_fragment_id, "index": index, "count": count,
+            }).encode()
+            datagram = header + b"\n" + data[index * size:(index + 1) * size]
+            waiting, peers = peers, []
+            for attempt in range(FRAGMENT_SEND_ATTEMPTS):
+                if self._sock is None:
+                    return
+                wait = attempt + 1 < FRAGMENT_SEND_ATTEMPTS
+                retry = []
+                for path in waiting:
+                    sent = self._send_to(path, datagram, channel_id, len(data), wait=wait)
+                    if sent:
+                        peers.append(path)
+                    elif sent is False:
+                        retry.append(path)
+                if not retry:
+                    break
+                waiting = retry
+                await asyncio.sleep(FRAGMENT_RETRY_SECONDS)
+            # Peers that missed a fragment get none of the rest
+            if not peers:
+                return
+
+    def _peer_paths(self):
+        now = time.monotonic()
+        if now - self._peers_scanned_at >= self.refresh_interval:
+            self._peers_scanned_at = now
+            try:
+                names = os.listdir(self.socket_dir)
+            except FileNotFoundError:
+                names = []
+            self._peers = {
+                os.path.join(self.socket_dir, name): None
+                for name in names
+                if name.endswith(".sock")
+            }
+            self._peers.pop(self.path, None)
+        return list(self._peers)
+
+    def _send_to_peers(self, data: bytes, channel_id: Optional[int] = None):
+        for path in self._peer_paths():
+            self._send_to(path, data, channel_id, len(data))
+
+    def _send_to(self, path: str, data: bytes, channel_id: Optional[int], size: int, wait: bool = False):
+        """Send one datagram; True if sent, False if the peer's queue is full and ``wait``, else None"""
+        try:
+            self._sock.sendto(data, path)
+            return True
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Worker exited without cleaning up its socket
+            self._peers.pop(path, None)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        except BlockingIOError as e:
+            if wait:
+                return False
+            self._send_failed(path, channel_id, size, e)
+        except OSError as e:
+            self._send_failed(path, channel_id, size, e)
+        return None
+
+    def _send_failed(self, path: str, channel_id: Optional[int], size: int, error: OSError):
+        # That worker misses the broadcast
+        self.send_errors += 1
+        logger.warning(
+            "Backplane broadcast for channel %s (%d bytes) not sent to %s: %s", channel_id, size, path, error
+        )
+
+    def _on_readable(self):
+        while self._sock is not None:
+            try:
+                data = self._sock.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                header, _, rest = data.partition(b"\n")
+                envelope = json.loads(header)
+                if "fragment" in envelope:
+                    data = self._reassemble(envelope, rest)
+                    if data is None:
+                        continue
+                    envelope = json.loads(data)
+            except ValueError:
+                continue
+            if "hello" in envelope:
+                if envelope["hello"] != self.path:
+                    self._peers[envelope["hello"]] = None
+                continue
+            self.receive(envelope)
+
+    def _reassemble(self, header: dict, data: bytes) -> Optional[bytes]:
+        """Collect one fragment; returns the whole envelope once every fragment is in"""
+        key = (header["origin"], header["fragment"])
+        parts = self._fragments.get(key)
+        if parts is None:
+            parts = self._fragments[key] = {}
+            if len(self._fragments) > MAX_PENDING_FRAGMENTS:
+                # A fragment of this one was lost (full receive buffer): give up on it
+                self._fragments.popitem(last=False)
+        parts[header["index"]] = data
+        if len(parts) < header["count"]:
+            return None
+        del self._fragments[key]
+        return b"".join(parts[index] for index in range(header["count"]))
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats.update(peers=len(self._peers), send_errors=self.send_errors, fragmented=self.fragmented)
+        return stats
+
+
+def create_backplane(backend: str, deliver: Deliver, socket_dir: str, refresh_interval: float) -> Backplane:
+    """Build the backplane named by the BACKPLANE_BACKEND setting"""
+    if backend == "memory":
+        return InProcessBackplane(deliver)
+    if backend == "unix":
+        return UnixSocketBackplane(deliver, socket_dir, refresh_interval)
+    if ":" in backend:
+        module_name, class_name = backend.split(":", 1)
+        backplane_class = getattr(importlib.import_module(module_name), class_name)
+        return backplane_class(deliver)
+    raise ValueError(f"Unknown backplane backend: {backend}")
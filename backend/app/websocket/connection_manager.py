@@ -1,69 +1,280 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Set
 from fastapi import WebSocket
-import json
+import time
 from datetime import datetime
+from app.core.config import settings
+from app.core.metrics import COUNT_BUCKETS, registry
+from app.websocket.backplane import create_backplane
+from app.websocket.fanout import FanoutEngine
+from app.websocket.registry import ConnectionRegistry, SocketState
+from app.websocket.replay import ReplayBuffer
+from app.websocket.scheduler import SYSTEM, classify, coalesce_key
+from app.websocket.wire import DEFAULT_CODEC, Codec
+
+FANOUT_SECONDS = registry.histogram(
+    "broadcast_fanout_duration_seconds", "Time to serialize a broadcast and queue it for every local recipient"
+)
+FANOUT_RECIPIENTS = registry.histogram(
+    "broadcast_recipients", "Local sockets a broadcast was queued for", (), COUNT_BUCKETS
+)
 
 class ConnectionManager:
     def __init__(self):
-        # Structure: {channel_id: {user_id: websocket}}
-        self.active_connections: Dict[int, Dict[int, WebSocket]] = {}
+        # Every socket with its subscriptions; a user may have many sockets
+        # in the same channel (tabs, devices) and each gets every broadcast
+        self.connections = ConnectionRegistry()
+        # Seconds from handshake to ready, for connect latency
+        self.connect_count = 0
+        self.connect_seconds_total = 0.0
+        self.connect_seconds_max = 0.0
+        self.fanout = FanoutEngine(
+            max_concurrent_sends=settings.FANOUT_MAX_CONCURRENT_SENDS,
+            queue_size=settings.FANOUT_QUEUE_SIZE,
+            send_timeout=settings.FANOUT_SEND_TIMEOUT_SECONDS,
+            policy=settings.FANOUT_SLOW_CONSUMER_POLICY,
+            on_evict=self.disconnect_socket,
+            max_wait=settings.FANOUT_PRIORITY_MAX_WAIT_MS / 1000,
+        )
+        # Recent chat frames per channel for clients that reconnect
+        self.replay = ReplayBuffer(
+            channel_max_bytes=settings.REPLAY_CHANNEL_MAX_BYTES,
+            max_bytes=settings.REPLAY_MAX_BYTES,
+            max_replay_frames=settings.REPLAY_MAX_FRAMES,
+        )
+        # Carries broadcasts to the other workers (and back to this one)
+        self.backplane = create_backplane(
+            settings.BACKPLANE_BACKEND,
+            self._deliver,
+            socket_dir=settings.BACKPLANE_SOCKET_DIR,
+            refresh_interval=settings.BACKPLANE_PEER_REFRESH_SECONDS,
+        )
+    
+    async def start(self):
+        """Attach to the broadcast backplane"""
+        await self.backplane.start()
+    
+    async def stop(self):
+        """Detach from the broadcast backplane"""
+        await self.backplane.stop()
+    
+    async def accept(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        multiplexed: bool = True,
+        codec: Codec = DEFAULT_CODEC
+    ):
+        """Accept a socket that will subscribe to channels by itself"""
+        await websocket.accept(subprotocol=codec.subprotocol)
+        self.connections.add(websocket, user_id, multiplexed, codec)
+        self.fanout.register(websocket, codec.encode)
     
-    async def connect(self, websocket: WebSocket, channel_id: int, user_id: int):
-        """Connect a user to a channel"""
-        await websocket.accept()
+    async def connect(
+        self,
+        websocket: WebSocket,
+        channel_id: int,
+        user_id: int,
+        last_message_id: Optional[int] = None,
+        codec: Codec = DEFAULT_CODEC
+    ):
+        """Connect a user to a channel over a single-channel socket"""
+        await self.accept(websocket, user_id, multiplexed=False, codec=codec)
+        await self.subscribe(websocket, channel_id, last_message_id)
+    
+    async def subscribe(self, websocket: WebSocket, channel_id: int, last_message_id: Optional[int] = None):
+        """Start routing a channel to an accepted socket.
+        
+        A reconnecting client passes the last message id it saw and is
+        sent everything newer before live broadcasts start, followed by a
+        ``replay_complete`` frame.
+        """
+        missed, complete = [], True
+        if last_message_id is not None:
+            missed, complete = await self.replay.collect(channel_id, last_message_id)
         
-        if channel_id not in self.active_connections:
-            self.active_connections[channel_id] = {}
+        # No awaits from here on, so nothing is broadcast between the end
+        # of the catch-up and the socket joining the channel
+        state = self.connections.get(websocket)
+        if state is None:
+            return
+        self.connections.subscribe(state, channel_id)
         
-        self.active_connections[channel_id][user_id] = websocket
+        if last_message_id is not None:
+            marker = {"type": "replay_complete", "channel_id": channel_id, "truncated": not complete}
+            # The buffer holds default-format frames
+            frames = [state.codec.from_json(frame) for frame in missed]
+            frames.append(state.codec.encode(marker))
+            for frame in frames:
+                self.fanout.publish(frame, [websocket], force=True)
+    
+    def unsubscribe(self, websocket: WebSocket, channel_id: int):
+        """Stop routing a channel to a socket"""
+        state = self.connections.get(websocket)
+        if state is not None:
+            self.connections.unsubscribe(state, channel_id)
+    
+    def subscriptions(self, websocket: WebSocket) -> Set[int]:
+        """Channels currently routed to a socket"""
+        state = self.connections.get(websocket)
+        return set(state.channels) if state is not None else set()
+    
+    def user_channels(self, user_id: int) -> Set[int]:
+        """Channels routed to any of a user's sockets"""
+        channels = set()
+        for state in self.connections.user(user_id):
+            channels.update(state.channels)
+        return channels
+    
+    def _user_sockets_in(self, channel_id: int, user_id: int) -> List[SocketState]:
+        return [state for state in self.connections.user(user_id) if channel_id in state.channels]
     
     def disconnect(self, channel_id: int, user_id: int):
-        """Disconnect a user from a channel"""
-        if channel_id in self.active_connections:
-            if user_id in self.active_connections[channel_id]:
-                del self.active_connections[channel_id][user_id]
-            
-            # Clean up empty channels
-            if not self.active_connections[channel_id]:
-                del self.active_connections[channel_id]
+        """Disconnect all of a user's sockets from a channel"""
+        for state in self._user_sockets_in(channel_id, user_id):
+            self.connections.unsubscribe(state, channel_id)
+            if not state.multiplexed and not state.channels:
+                self.disconnect_socket(state.websocket)
+    
+    def disconnect_socket(self, websocket: WebSocket):
+        """Forget a socket entirely: every subscription and its outbound queue"""
+        if self.connections.remove(websocket) is not None:
+            self.fanout.unregister(websocket)
+    
+    async def remove_from_channel(self, channel_id: int, user_id: int):
+        """Stop routing a channel to a user who is no longer a member, on every device"""
+        for state in self._user_sockets_in(channel_id, user_id):
+            websocket = state.websocket
+            if state.multiplexed:
+                self.connections.unsubscribe(state, channel_id)
+                self.send_frame(websocket, {"type": "unsubscribed", "channel_id": channel_id})
+                continue
+            self.disconnect_socket(websocket)
+            try:
+                await websocket.close(code=1008)
+            except Exception:
+                pass
+    
+    def record_connect(self, seconds: float):
+        """Record how long a socket took from handshake to ready"""
+        self.connect_count += 1
+        self.connect_seconds_total += seconds
+        self.connect_seconds_max = max(self.connect_seconds_max, seconds)
+    
+    def send_frame(self, websocket: WebSocket, message: dict):
+        """Queue a message for one socket, behind what it is already due"""
+        state = self.connections.get(websocket)
+        if state is not None:
+            self.fanout.publish(state.codec.encode(message), [websocket])
     
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """Send a message to a specific websocket"""
         await websocket.send_text(message)
     
     async def broadcast_to_channel(self, message: dict, channel_id: int, exclude_user: int = None):
-        """Broadcast a message to all users in a channel"""
-        if channel_id not in self.active_connections:
-            return
+        """Broadcast a message to all users in a channel, in every worker"""
+        await self.backplane.publish(channel_id, message, exclude_user)
+    
+    def _deliver(self, envelope: dict):
+        """Fan a backplane envelope out to this worker's sockets.
         
-        message_json = json.dumps(message)
+        The message is serialized once per wire format in use and queued
+        for every recipient socket, including each of a user's devices; the
+        fan-out engine delivers it concurrently, so this never waits on a
+        slow client. Join/leave notices and presence go in behind chat.
+        """
+        started = time.perf_counter()
+        channel_id = envelope["channel_id"]
+        exclude_user = envelope["exclude_user"]
+        message = envelope["message"]
         
-        # Send to all connections in the channel
-        disconnected_users = []
-        for user_id, connection in self.active_connections[channel_id].items():
-            if exclude_user and user_id == exclude_user:
+        message_json = DEFAULT_CODEC.encode(message)
+        if message.get("type") == "message":
+            self.replay.append(channel_id, message["id"], message_json)
+        if not self.connections.channel_size(channel_id):
+            return
+        
+        recipients: Dict[Codec, List[WebSocket]] = {}
+        for state in self.connections.channel(channel_id):
+            if exclude_user and state.user_id == exclude_user:
                 continue
-            
-            try:
-                await connection.send_text(message_json)
-            except Exception as e:
-                print(f"Error sending to user {user_id}: {e}")
-                disconnected_users.append(user_id)
+            connections = recipients.get(state.codec)
+            if connections is None:
+                connections = recipients[state.codec] = []
+            connections.append(state.websocket)
         
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            self.disconnect(channel_id, user_id)
+        priority = classify(message)
+        key = coalesce_key(message, priority)
+        notice = message if priority == SYSTEM else None
+        count = 0
+        for codec, connections in recipients.items():
+            frame = message_json if codec is DEFAULT_CODEC else codec.encode(message)
+            count += self.fanout.publish(frame, connections, key, priority=priority, notice=notice)
+        FANOUT_SECONDS.observe(time.perf_counter() - started)
+        FANOUT_RECIPIENTS.observe(count)
     
     def get_channel_users(self, channel_id: int) -> List[int]:
         """Get list of user IDs in a channel"""
-        if channel_id not in self.active_connections:
-            return []
-        return list(self.active_connections[channel_id].keys())
+        return list(dict.fromkeys(state.user_id for state in self.connections.channel(channel_id)))
     
     def is_user_online(self, user_id: int, channel_id: int) -> bool:
-        """Check if a user is online in a specific channel"""
-        if channel_id not in self.active_connections:
-            return False
-        return user_id in self.active_connections[channel_id]
+        """Check if a user is online in a specific channel, on any device"""
+        return any(channel_id in state.channels for state in self.connections.user(user_id))
+    
+    def get_connection_stats(self) -> dict:
+        """Sockets per user, subscriptions and connect latency"""
+        sockets = len(self.connections)
+        users = self.connections.user_count()
+        per_user = {}
+        for state in self.connections.sockets():
+            per_user[state.user_id] = per_user.get(state.user_id, 0) + 1
+        return {
+            "sockets": sockets,
+            "users": users,
+            "max_sockets_per_user": max(per_user.values(), default=0),
+            "mean_sockets_per_user": sockets / users if users else 0.0,
+            "subscriptions": sum(self.connections.channel_sizes().values()),
+            "bookkeeping_bytes_per_socket": self.connections.bookkeeping_bytes() / sockets if sockets else 0.0,
+            "connect_ms_mean": self.connect_seconds_total / self.connect_count * 1000 if self.connect_count else 0.0,
+            "connect_ms_max": self.connect_seconds_max * 1000,
+        }
+    
+    def get_stats(self) -> dict:
+        """Connection, fan-out, backplane and replay buffer counters"""
+        return {
+            "connections": self.get_connection_stats(),
+            "fanout": self.fanout.get_stats(),
+            "backplane": self.backplane.get_stats(),
+            "replay": self.replay.get_stats(),
+        }
+    
+    def channel_socket_counts(self, limit: Optional[int] = None) -> Dict[int, int]:
+        """Sockets per channel on this worker, busiest first"""
+        counts = sorted(self.connections.channel_sizes().items(), key=lambda item: item[1], reverse=True)
+        return dict(counts[:limit] if limit is not None else counts)
 
 manager = ConnectionManager()
+
+registry.gauge_callback(
+    "websocket_active_sockets", "Accepted websockets on this worker", lambda: len(manager.connections)
+)
+registry.gauge_callback(
+    "websocket_channel_sockets",
+    "Sockets subscribed per channel (busiest channels only)",
+    lambda: {
+        (channel_id,): count
+        for channel_id, count in manager.channel_socket_counts(settings.METRICS_CHANNEL_SERIES_LIMIT).items()
+    },
+    ("channel_id",),
+)
+registry.counter_callback(
+    "websocket_frames_sent_total", "Frames written to sockets", lambda: manager.fanout.stats.frames_sent
+)
+registry.counter_callback(
+    "websocket_frames_dropped_total", "Frames discarded for slow consumers", lambda: manager.fanout.stats.frames_dropped
+)
+registry.gauge_callback(
+    "websocket_queued_frames",
+    "Frames waiting in outbound queues, per priority class",
+    lambda: {(name,): depth for name, depth in manager.fanout.class_depths().items()},
+    ("class",),
+)
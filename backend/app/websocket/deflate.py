@@ -0,0 +1,26 @@
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from app.core.config import settings
+
+
+def deflate_factory() -> ServerPerMessageDeflateFactory:
+    """permessage-deflate offer built from the WS_DEFLATE_* settings"""
+    return ServerPerMessageDeflateFactory(
+        server_max_window_bits=settings.WS_DEFLATE_SERVER_MAX_WINDOW_BITS,
+        client_max_window_bits=settings.WS_DEFLATE_CLIENT_MAX_WINDOW_BITS,
+        compress_settings={
+            "level": settings.WS_DEFLATE_LEVEL,
+            "memLevel": settings.WS_DEFLATE_MEM_LEVEL,
+        },
+    )
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    """uvicorn's websockets protocol with tunable permessage-deflate.
+
+    uvicorn itself can only switch compression on or off.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.available_extensions = [deflate_factory()] if settings.WS_DEFLATE else []
@@ -0,0 +1,268 @@
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Union
+from fastapi import WebSocket
+from app.core.metrics import registry
+from app.websocket.scheduler import (
+    CHAT, CLASS_NAMES, QUEUE_DELAY, Outbound, OutboundQueue, summarize
+)
+
+# Slow consumer policies, applied when a recipient's outbound queue is full
+# of frames at least as urgent as the new one (less urgent ones are shed first)
+DROP = "drop"            # discard the new frame
+COALESCE = "coalesce"    # discard the oldest queued frame so the newest one fits
+DISCONNECT = "disconnect"  # close the socket; the client reconnects and catches up
+
+SLOW_CONSUMER_POLICIES = (DROP, COALESCE, DISCONNECT)
+
+# Close code sent to consumers we give up on ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+SEND_SECONDS = registry.histogram(
+    "websocket_send_duration_seconds", "Time to write one frame to one recipient socket"
+)
+
+
+@dataclass
+class FanoutStats:
+    frames_enqueued: int = 0
+    frames_sent: int = 0
+    frames_dropped: int = 0
+    frames_coalesced: int = 0
+    frames_shed: int = 0
+    notices_merged: int = 0
+    send_timeouts: int = 0
+    send_errors: int = 0
+    slow_disconnects: int = 0
+
+
+class Recipient:
+    """Bounded outbound queue and writer task for a single websocket"""
+
+    __slots__ = ("websocket", "encode", "queue", "wakeup", "task", "closed")
+
+    def __init__(self, websocket: WebSocket, encode: Optional[Callable[[dict], Union[str, bytes]]] = None):
+        self.websocket = websocket
+        # The socket's wire format, for notices merged while queued
+        self.encode = encode
+        self.queue = OutboundQueue()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
+
+class FanoutEngine:
+    """Concurrent fan-out of pre-serialized frames to many websockets.
+
+    Every registered socket gets its own bounded queue drained by its own
+    writer task, so a stalled client only ever delays itself. The number of
+    sends in flight across all sockets is capped by a semaphore. Each queue
+    is scheduled by priority class (see scheduler.py): chat goes ahead of
+    join/leave notices and presence, and notices pile up into one summary
+    frame while a socket is behind.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_sends: int = 256,
+        queue_size: int = 64,
+        send_timeout: float = 5.0,
+        policy: str = DROP,
+        on_evict: Optional[Callable[[WebSocket], None]] = None,
+        max_wait: float = 1.0,
+    ):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.policy = policy
+        self.max_wait = max_wait
+        self.on_evict = on_evict
+        self.stats = FanoutStats()
+        self._recipients: Dict[int, Recipient] = {}
+        self._send_slots = asyncio.Semaphore(max_concurrent_sends)
+        # Close tasks of evicted sockets, referenced until done
+        self._closing = set()
+
+    def register(
+        self, websocket: WebSocket, encode: Optional[Callable[[dict], Union[str, bytes]]] = None
+    ) -> Recipient:
+        """Start a writer for a websocket (no-op if already registered).
+
+        ``encode`` turns a message into a frame for this socket; without it
+        join/leave notices are queued one by one rather than merged.
+        """
+        recipient = self._recipients.get(id(websocket))
+        if recipient is None:
+            recipient = Recipient(websocket, encode)
+            recipient.task = asyncio.create_task(self._writer(recipient))
+            self._recipients[id(websocket)] = recipient
+        return recipient
+
+    def unregister(self, websocket: WebSocket):
+        """Stop the writer for a websocket and discard its queued frames"""
+        recipient = self._recipients.pop(id(websocket), None)
+        if recipient is None:
+            return
+        recipient.closed = True
+        recipient.queue.clear()
+        if recipient.task is not None and recipient.task is not asyncio.current_task():
+            recipient.task.cancel()
+
+    def publish(
+        self,
+        frame: Union[str, bytes],
+        websockets: Iterable[WebSocket],
+        key: Hashable = None,
+        force: bool = False,
+        priority: int = CHAT,
+        notice: Optional[dict] = None,
+    ) -> int:
+        """Queue a frame for each websocket; returns how many accepted it.
+
+        Frames sharing a non-None ``key`` coalesce: a newer frame replaces
+        the older one still waiting in the queue, or, for a join/leave
+        ``notice`` (the message the frame encodes), the waiting one counts
+        it and goes out as a summary. ``force`` bypasses the queue bound,
+        for bursts that are already bounded (replays).
+        """
+        accepted = 0
+        now = time.monotonic()
+        for websocket in websockets:
+            recipient = self._recipients.get(id(websocket))
+            if recipient is None or recipient.closed:
+                continue
+            if self._enqueue(recipient, frame, key, force, priority, notice, now):
+                accepted += 1
+        return accepted
+
+    def _enqueue(
+        self,
+        recipient: Recipient,
+        frame: Union[str, bytes],
+        key: Hashable,
+        force: bool = False,
+        priority: int = CHAT,
+        notice: Optional[dict] = None,
+        now: Optional[float] = None,
+    ) -> bool:
+        queue = recipient.queue
+        if key is not None:
+            pending = queue.pending(key)
+            if pending is not None:
+                if notice is not None and recipient.encode is not None:
+                    pending.count += 1
+                    pending.notice = notice
+                    pending.frame = None
+                    self.stats.notices_merged += 1
+                else:
+                    pending.frame = frame
+                    self.stats.frames_coalesced += 1
+                return True
+
+        if len(queue) >= self.queue_size and not force:
+            # Make room by shedding a less urgent frame if there is one
+            shed = queue.shed(priority + 1)
+            if shed is not None:
+                self.stats.frames_shed += 1
+            elif self.policy == DROP:
+                self.stats.frames_dropped += 1
+                return False
+            elif self.policy == COALESCE:
+                if queue.shed(priority) is None:
+                    self.stats.frames_dropped += 1
+                    return False
+                self.stats.frames_coalesced += 1
+            else:
+                self.stats.slow_disconnects += 1
+                self._evict(recipient)
+                return False
+
+        queue.push(Outbound(frame, key, priority, time.monotonic() if now is None else now, notice))
+        recipient.wakeup.set()
+        self.stats.frames_enqueued += 1
+        return True
+
+    async def _writer(self, recipient: Recipient):
+        """Drain one recipient's queue, one send at a time"""
+        websocket = recipient.websocket
+        while not recipient.closed:
+            if not recipient.queue:
+                recipient.wakeup.clear()
+                await recipient.wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            entry = recipient.queue.pop(now, self.max_wait)
+            QUEUE_DELAY.observe(now - entry.enqueued_at, (CLASS_NAMES[entry.priority],))
+            frame = entry.frame
+            if frame is None:
+                # Notices merged while waiting, rendered for this socket
+                frame = recipient.encode(summarize(entry.notice, entry.count))
+
+            async with self._send_slots:
+                try:
+                    send = websocket.send_bytes(frame) if isinstance(frame, bytes) else websocket.send_text(frame)
+                    started = time.perf_counter()
+                    await asyncio.wait_for(send, self.send_timeout)
+                    SEND_SECONDS.observe(time.perf_counter() - started)
+                except asyncio.TimeoutError:
+                    # A timed-out send may have left a partial frame on the wire,
+                    # so the socket cannot be reused whatever the policy is
+                    self.stats.send_timeouts += 1
+                    self._evict(recipient)
+                    return
+                except Exception:
+                    self.stats.send_errors += 1
+                    self._evict(recipient)
+                    return
+            self.stats.frames_sent += 1
+
+    def _evict(self, recipient: Recipient):
+        """Give up on a recipient: drop its queue, notify the owner, close it"""
+        if recipient.closed:
+            return
+        self.stats.frames_dropped += len(recipient.queue)
+        websocket = recipient.websocket
+        self.unregister(websocket)
+        if self.on_evict is not None:
+            self.on_evict(websocket)
+        task = asyncio.create_task(self._close(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=SLOW_CONSUMER_CLOSE_CODE), self.send_timeout
+            )
+        except Exception:
+            pass
+
+    def queue_depth(self, websocket: WebSocket = None) -> int:
+        """Frames waiting to be sent, for one websocket or in total"""
+        if websocket is not None:
+            recipient = self._recipients.get(id(websocket))
+            return len(recipient.queue) if recipient else 0
+        return sum(len(r.queue) for r in self._recipients.values())
+
+    def class_depths(self) -> Dict[str, int]:
+        """Frames waiting to be sent in total, per priority class"""
+        totals = [0] * len(CLASS_NAMES)
+        for recipient in self._recipients.values():
+            for index, depth in enumerate(recipient.queue.depths()):
+                totals[index] += depth
+        return dict(zip(CLASS_NAMES, totals))
+
+    def get_stats(self) -> dict:
+        """Counters plus current queue depths"""
+        depths: List[int] = [len(r.queue) for r in self._recipients.values()]
+        stats = asdict(self.stats)
+        stats.update(
+            recipients=len(depths),
+            queue_depth=sum(depths),
+            max_queue_depth=max(depths, default=0),
+            queue_depth_by_class=self.class_depths(),
+        )
+        return stats
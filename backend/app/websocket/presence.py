@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import update
+from app.core.config import settings
+from app.database import AsyncSessionLocal
+from app.models.user import User
+from app.websocket.connection_manager import ConnectionManager, manager
+
+ONLINE = "online"
+AWAY = "away"
+OFFLINE = "offline"
+
+CLIENT_STATUSES = (ONLINE, AWAY)
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceService:
+    """Online/away/typing state per user, kept in memory.
+
+    Updates are coalesced: status changes and typing indicators are
+    collected per channel and broadcast together every
+    ``typing_interval_ms``, so a channel gets at most one ``presence`` and
+    one ``typing`` frame per interval however many events arrive.
+    ``last_seen`` timestamps are buffered and written to the database in a
+    single statement every ``flush_seconds``.
+
+    State is per worker; with several workers each one knows the users
+    connected to it.
+    """
+
+    def __init__(
+        self,
+        connections: ConnectionManager,
+        session_factory=AsyncSessionLocal,
+        typing_interval_ms: float = 500,
+        typing_ttl: float = 5.0,
+        flush_seconds: float = 30.0,
+    ):
+        self.connections = connections
+        self.session_factory = session_factory
+        self.typing_interval = typing_interval_ms / 1000
+        self.typing_ttl = typing_ttl
+        self.flush_seconds = flush_seconds
+        self.frames_sent = 0
+        self.events_coalesced = 0
+        self.last_seen_writes = 0
+        self.flush_errors = 0
+        # {user_id: number of open sockets}
+        self._sockets: Dict[int, int] = {}
+        self._status: Dict[int, str] = {}
+        self._usernames: Dict[int, str] = {}
+        # {channel_id: {user_id: monotonic expiry}}
+        self._typing: Dict[int, Dict[int, float]] = {}
+        self._typing_dirty: Set[int] = set()
+        # {channel_id: {user_id: status}} waiting for the next tick
+        self._status_changes: Dict[int, Dict[int, str]] = {}
+        # {user_id: last activity} waiting for the next database flush
+        self._last_seen: Dict[int, datetime] = {}
+        self._tick_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._tick_task is None:
+            self._tick_task = asyncio.create_task(self._tick_loop())
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the loops and write any last_seen still buffered"""
+        for task in (self._tick_task, self._flush_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._tick_task = self._flush_task = None
+        await self.flush_last_seen()
+
+    def connected(self, user_id: int, username: str):
+        """A socket of this user was accepted"""
+        self._usernames[user_id] = username
+        self._sockets[user_id] = self._sockets.get(user_id, 0) + 1
+        self.seen(user_id)
+        if self._status.get(user_id, OFFLINE) == OFFLINE:
+            self._status[user_id] = ONLINE
+
+    def disconnected(self, user_id: int, channel_ids: Iterable[int] = ()):
+        """A socket of this user went away, with the channels it had"""
+        self.seen(user_id)
+        for channel_id in channel_ids:
+            self._stop_typing(user_id, channel_id)
+        remaining = self._sockets.get(user_id, 0) - 1
+        if remaining > 0:
+            self._sockets[user_id] = remaining
+            return
+        self._sockets.pop(user_id, None)
+        self._status.pop(user_id, None)
+        self._usernames.pop(user_id, None)
+        for channel_id in channel_ids:
+            self._queue_status(channel_id, user_id, OFFLINE)
+
+    def subscribed(self, user_id: int, channel_id: int):
+        """Tell a channel a user is now here, with their current status"""
+        self._queue_status(channel_id, user_id, self.status(user_id))
+
+    def set_status(self, user_id: int, status: str, channel_ids: Iterable[int]):
+        """Client-reported status change (online / away)"""
+        if status not in CLIENT_STATUSES:
+            raise ValueError(f"Unknown status: {status}")
+        self.seen(user_id)
+        if self._sockets.get(user_id) is None or self._status.get(user_id) == status:
+            return
+        self._status[user_id] = status
+        for channel_id in channel_ids:
+            self._queue_status(channel_id, user_id, status)
+
+    def typing(self, user_id: int, channel_id: int, active: bool = True):
+        """A user started (or refreshed, or stopped) typing in a channel"""
+        if not active:
+            self._stop_typing(user_id, channel_id)
+            return
+        typists = self._typing.setdefault(channel_id, {})
+        if user_id in typists:
+            self.events_coalesced += 1
+        else:
+            self._typing_dirty.add(channel_id)
+        typists[user_id] = time.monotonic() + self.typing_ttl
+
+    def _stop_typing(self, user_id: int, channel_id: int):
+        typists = self._typing.get(channel_id)
+        if typists is not None and typists.pop(user_id, None) is not None:
+            self._typing_dirty.add(channel_id)
+
+    def _queue_status(self, channel_id: int, user_id: int, status: str):
+        changes = self._status_changes.setdefault(channel_id, {})
+        if user_id in changes:
+            self.events_coalesced += 1
+        changes[user_id] = status
+
+    def seen(self, user_id: int):
+        """Record activity; written to users.last_seen on the next flush"""
+        self._last_seen[user_id] = datetime.utcnow()
+
+    def status(self, user_id: int) -> str:
+        return self._status.get(user_id, OFFLINE)
+
+    def online_in_channels(self, channel_ids: Iterable[int]) -> Dict[int, Dict[int, str]]:
+        """{channel_id: {user_id: status}} for users connected to each channel"""
+        return {
+            channel_id: {
+                user_id: self.status(user_id)
+                for user_id in self.connections.get_channel_users(channel_id)
+            }
+            for channel_id in channel_ids
+        }
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(self.typing_interval)
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Error broadcasting presence")
+
+    async def tick(self):
+        """Broadcast the coalesced presence and typing changes"""
+        changes, self._status_changes = self._status_changes, {}
+        for channel_id, users in changes.items():
+            await self._broadcast({
+                "type": "presence",
+                "channel_id": channel_id,
+                "users": [{"user_id": user_id, "status": status} for user_id, status in users.items()],
+            }, channel_id)
+
+        now = time.monotonic()
+        for channel_id, typists in list(self._typing.items()):
+            expired = [user_id for user_id, expires_at in typists.items() if expires_at <= now]
+            for user_id in expired:
+                del typists[user_id]
+            if expired:
+                self._typing_dirty.add(channel_id)
+            if not typists:
+                del self._typing[channel_id]
+
+        dirty, self._typing_dirty = self._typing_dirty, set()
+        for channel_id in dirty:
+            typists = self._typing.get(channel_id, {})
+            await self._broadcast({
+                "type": "typing",
+                "channel_id": channel_id,
+                "users": [
+                    {"user_id": user_id, "username": self._usernames.get(user_id)}
+                    for user_id in typists
+                ],
+            }, channel_id)
+
+    async def _broadcast(self, frame: dict, channel_id: int):
+        self.frames_sent += 1
+        await self.connections.broadcast_to_channel(frame, channel_id)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush_last_seen()
+
+    async def flush_last_seen(self):
+        """Write buffered last_seen values in one executemany UPDATE"""
+        if not self._last_seen:
+            return
+        pending, self._last_seen = self._last_seen, {}
+        rows = [{"id": user_id, "last_seen": seen} for user_id, seen in pending.items()]
+        try:
+            async with self.session_factory() as db:
+                await db.execute(update(User), rows)
+                await db.commit()
+        except Exception:
+            self.flush_errors += 1
+            # Keep the values for the next flush unless newer ones arrived
+            for user_id, seen in pending.items():
+                self._last_seen.setdefault(user_id, seen)
+            logger.exception("Error writing last_seen for %d users", len(pending))
+            return
+        self.last_seen_writes += len(rows)
+
+    def get_stats(self) -> dict:
+        return {
+            "online_users": len(self._sockets),
+            "away_users": sum(1 for status in self._status.values() if status == AWAY),
+            "typing_channels": len(self._typing),
+            "frames_sent": self.frames_sent,
+            "events_coalesced": self.events_coalesced,
+            "last_seen_pending": len(self._last_seen),
+            "last_seen_writes": self.last_seen_writes,
+            "flush_errors": self.flush_errors,
+        }
+
+
+presence = PresenceService(
+    manager,
+    typing_interval_ms=settings.PRESENCE_TYPING_INTERVAL_MS,
+    typing_ttl=settings.PRESENCE_TYPING_TTL_SECONDS,
+    flush_seconds=settings.PRESENCE_LAST_SEEN_FLUSH_SECONDS,
+)
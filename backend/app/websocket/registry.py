@@ -0,0 +1,165 @@
+import sys
+from array import array
+from typing import Dict, Iterator, List, Optional
+from fastapi import WebSocket
+from app.websocket.wire import DEFAULT_CODEC, Codec
+
+NO_CONNECTION = -1
+
+class SocketState:
+    """What the registry knows about one accepted websocket.
+
+    ``channels`` maps each subscribed channel to this socket's position in
+    that channel's subscriber array. ``prev_of_user``/``next_of_user`` link
+    the sockets of one user together, so no per-user container is needed.
+    """
+
+    __slots__ = (
+        "conn_id", "websocket", "user_id", "channels", "multiplexed", "codec", "prev_of_user", "next_of_user"
+    )
+
+    def __init__(self, conn_id: int, websocket: WebSocket, user_id: int, multiplexed: bool, codec: Codec):
+        self.conn_id = conn_id
+        self.websocket = websocket
+        self.user_id = user_id
+        self.channels: Dict[int, int] = {}
+        self.multiplexed = multiplexed
+        self.codec = codec
+        self.prev_of_user = NO_CONNECTION
+        self.next_of_user = NO_CONNECTION
+
+class ConnectionRegistry:
+    """Every accepted socket and its channel subscriptions, in slots.
+
+    Each socket gets a connection id: the index of its slot, reused once
+    the socket goes away. A channel's subscribers are a dense array of
+    connection ids (4 bytes each), and every socket remembers its position
+    in each of its channels, so subscribe and unsubscribe are O(1) (append,
+    and swap-with-last removal) and a broadcast walks one contiguous array.
+    A user may hold any number of sockets in the same channel (tabs,
+    devices); they sit side by side and all receive every broadcast.
+    """
+
+    def __init__(self):
+        self._slots: List[Optional[SocketState]] = []
+        self._free: List[int] = []
+        # {id(websocket): conn_id}
+        self._by_socket: Dict[int, int] = {}
+        # {channel_id: array of conn_ids}
+        self._channels: Dict[int, array] = {}
+        # {user_id: conn_id of the first socket in the user's list}
+        self._user_heads: Dict[int, int] = {}
+
+    def add(
+        self, websocket: WebSocket, user_id: int, multiplexed: bool = True, codec: Codec = DEFAULT_CODEC
+    ) -> SocketState:
+        if self._free:
+            conn_id = self._free.pop()
+        else:
+            conn_id = len(self._slots)
+            self._slots.append(None)
+        state = SocketState(conn_id, websocket, user_id, multiplexed, codec)
+        self._slots[conn_id] = state
+        self._by_socket[id(websocket)] = conn_id
+
+        head = self._user_heads.get(user_id, NO_CONNECTION)
+        if head != NO_CONNECTION:
+            state.next_of_user = head
+            self._slots[head].prev_of_user = conn_id
+        self._user_heads[user_id] = conn_id
+        return state
+
+    def get(self, websocket: WebSocket) -> Optional[SocketState]:
+        conn_id = self._by_socket.get(id(websocket))
+        return self._slots[conn_id] if conn_id is not None else None
+
+    def remove(self, websocket: WebSocket) -> Optional[SocketState]:
+        """Forget a socket and all of its subscriptions; frees its slot"""
+        conn_id = self._by_socket.pop(id(websocket), None)
+        if conn_id is None:
+            return None
+        state = self._slots[conn_id]
+        for channel_id in list(state.channels):
+            self.unsubscribe(state, channel_id)
+
+        if state.prev_of_user != NO_CONNECTION:
+            self._slots[state.prev_of_user].next_of_user = state.next_of_user
+        elif state.next_of_user != NO_CONNECTION:
+            self._user_heads[state.user_id] = state.next_of_user
+        else:
+            del self._user_heads[state.user_id]
+        if state.next_of_user != NO_CONNECTION:
+            self._slots[state.next_of_user].prev_of_user = state.prev_of_user
+
+        self._slots[conn_id] = None
+        self._free.append(conn_id)
+        return state
+
+    def subscribe(self, state: SocketState, channel_id: int) -> bool:
+        """Add a socket to a channel; False if it was already subscribed"""
+        if channel_id in state.channels:
+            return False
+        members = self._channels.get(channel_id)
+        if members is None:
+            members = self._channels[channel_id] = array("i")
+        state.channels[channel_id] = len(members)
+        members.append(state.conn_id)
+        return True
+
+    def unsubscribe(self, state: SocketState, channel_id: int) -> bool:
+        """Remove a socket from a channel; False if it was not subscribed"""
+        position = state.channels.pop(channel_id, None)
+        if position is None:
+            return False
+        members = self._channels[channel_id]
+        last = members.pop()
+        if last != state.conn_id:
+            # Move the last subscriber into the freed position
+            members[position] = last
+            self._slots[last].channels[channel_id] = position
+        if not members:
+            del self._channels[channel_id]
+        return True
+
+    def channel(self, channel_id: int) -> Iterator[SocketState]:
+        """Sockets subscribed to a channel"""
+        slots = self._slots
+        for conn_id in self._channels.get(channel_id, ()):
+            yield slots[conn_id]
+
+    def user(self, user_id: int) -> Iterator[SocketState]:
+        """Sockets of a user"""
+        conn_id = self._user_heads.get(user_id, NO_CONNECTION)
+        while conn_id != NO_CONNECTION:
+            state = self._slots[conn_id]
+            conn_id = state.next_of_user
+            yield state
+
+    def channel_size(self, channel_id: int) -> int:
+        members = self._channels.get(channel_id)
+        return len(members) if members is not None else 0
+
+    def channel_sizes(self) -> Dict[int, int]:
+        return {channel_id: len(members) for channel_id, members in self._channels.items()}
+
+    def user_count(self) -> int:
+        return len(self._user_heads)
+
+    def sockets(self) -> Iterator[SocketState]:
+        for state in self._slots:
+            if state is not None:
+                yield state
+
+    def __len__(self) -> int:
+        return len(self._by_socket)
+
+    def __contains__(self, websocket: WebSocket) -> bool:
+        return id(websocket) in self._by_socket
+
+    def bookkeeping_bytes(self) -> int:
+        """Approximate memory held by the registry itself (not the sockets)"""
+        total = sys.getsizeof(self._slots) + sys.getsizeof(self._free)
+        total += sys.getsizeof(self._by_socket) + sys.getsizeof(self._user_heads) + sys.getsizeof(self._channels)
+        total += sum(sys.getsizeof(members) for members in self._channels.values())
+        total += sum(sys.getsizeof(state) + sys.getsizeof(state.channels) for state in self.sockets())
+        return total
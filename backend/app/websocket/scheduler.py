@@ -0,0 +1,133 @@
+from collections import deque
+from typing import Deque, Dict, Hashable, Optional, Tuple, Union
+from app.core.metrics import registry
+
+# Priority classes, most urgent first. Chat covers messages, replays and
+# replies to the client's own frames; system covers join/leave notices;
+# presence covers status and typing updates.
+CHAT = 0
+SYSTEM = 1
+PRESENCE = 2
+CLASS_NAMES = ("chat", "system", "presence")
+
+SYSTEM_TYPES = frozenset(("user_joined", "user_left"))
+PRESENCE_TYPES = frozenset(("presence", "typing"))
+
+QUEUE_DELAY = registry.histogram(
+    "websocket_queue_delay_seconds", "Time a frame waited in a socket's outbound queue", ("class",)
+)
+
+def classify(message: dict) -> int:
+    """Priority class of an outgoing message"""
+    frame_type = message.get("type")
+    if frame_type in SYSTEM_TYPES:
+        return SYSTEM
+    if frame_type in PRESENCE_TYPES:
+        return PRESENCE
+    return CHAT
+
+def coalesce_key(message: dict, priority: int) -> Hashable:
+    """Key under which a queued frame absorbs or is replaced by later ones.
+
+    Join/leave notices merge into a summary and typing frames carry the
+    full list of typists, so only the newest matters; presence frames carry
+    status changes and every one is kept.
+    """
+    frame_type = message.get("type")
+    if priority == SYSTEM or frame_type == "typing":
+        return (frame_type, message.get("channel_id"))
+    return None
+
+def summarize(notice: dict, count: int) -> dict:
+    """One notice standing for ``count`` joins (or leaves) of a channel"""
+    action = "joined" if notice["type"] == "user_joined" else "left"
+    return dict(notice, content=f"{count} users {action} the channel", count=count)
+
+class Outbound:
+    """A frame waiting in one socket's queue.
+
+    A join/leave ``notice`` still waiting when another of the same kind
+    arrives absorbs it: ``count`` goes up and the frame is rendered again,
+    as a summary, when it is finally sent.
+    """
+
+    __slots__ = ("frame", "key", "priority", "enqueued_at", "notice", "count")
+
+    def __init__(
+        self,
+        frame: Union[str, bytes, None],
+        key: Hashable,
+        priority: int,
+        enqueued_at: float,
+        notice: Optional[dict] = None,
+    ):
+        self.frame = frame
+        self.key = key
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+        self.notice = notice
+        self.count = 1
+
+class OutboundQueue:
+    """A socket's pending frames: one FIFO per priority class.
+
+    The most urgent class goes first, except that a frame of a lower class
+    that has waited ``max_wait`` seconds is sent next, so a busy chat never
+    starves notices completely. The owner bounds the total length; when it
+    is reached, the oldest frame of a less urgent class makes room.
+    """
+
+    __slots__ = ("classes", "keys")
+
+    def __init__(self):
+        self.classes: Tuple[Deque[Outbound], ...] = tuple(deque() for _ in CLASS_NAMES)
+        # Keyed entries still waiting, for coalescing
+        self.keys: Dict[Hashable, Outbound] = {}
+
+    def __len__(self) -> int:
+        return len(self.classes[CHAT]) + len(self.classes[SYSTEM]) + len(self.classes[PRESENCE])
+
+    def __bool__(self) -> bool:
+        return any(self.classes)
+
+    def push(self, entry: Outbound):
+        self.classes[entry.priority].append(entry)
+        if entry.key is not None:
+            self.keys[entry.key] = entry
+
+    def pending(self, key: Hashable) -> Optional[Outbound]:
+        return self.keys.get(key)
+
+    def pop(self, now: float, max_wait: float) -> Outbound:
+        """The next frame to send; the queue must not be empty"""
+        chosen = None
+        for queue in self.classes:
+            if not queue:
+                continue
+            if chosen is None:
+                chosen = queue
+            elif now - queue[0].enqueued_at >= max_wait:
+                chosen = queue
+                break
+        return self._forget(chosen.popleft())
+
+    def shed(self, priority: int) -> Optional[Outbound]:
+        """Drop the oldest frame of the least urgent class not more urgent
+        than ``priority``; None if every queued frame is more urgent"""
+        for queue in reversed(self.classes[priority:]):
+            if queue:
+                return self._forget(queue.popleft())
+        return None
+
+    def _forget(self, entry: Outbound) -> Outbound:
+        if entry.key is not None and self.keys.get(entry.key) is entry:
+            del self.keys[entry.key]
+        return entry
+
+    def clear(self):
+        for queue in self.classes:
+            queue.clear()
+        self.keys.clear()
+
+    def depths(self) -> Tuple[int, ...]:
+        return tuple(len(queue) for queue in self.classes)
@@ -0,0 +1,162 @@
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Union
+
+# Optional faster encoders; the stdlib json module is the fallback
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depends on the environment
+    msgpack = None
+
+Frame = Union[str, bytes]
+
+# Short field ids used by the compact encodings
+FIELD_IDS = {
+    "type": "t",
+    "id": "i",
+    "content": "c",
+    "username": "u",
+    "user_id": "a",
+    "channel_id": "ch",
+    "timestamp": "ts",
+    "users": "us",
+    "status": "s",
+    "detail": "d",
+    "truncated": "tr",
+    "last_id": "l",
+    "active": "ac",
+    "code": "co",
+    "retry_after": "ra",
+    "message_id": "mi",
+    "count": "n",
+}
+FIELD_NAMES = {short: name for name, short in FIELD_IDS.items()}
+
+
+def dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(",", ":"))
+
+
+def loads(data: Frame):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def as_frame(value) -> dict:
+    if not isinstance(value, dict):
+        raise ValueError("Frame must be an object")
+    return value
+
+
+def epoch_ms(timestamp: str) -> int:
+    """ISO timestamp (naive values are UTC) to milliseconds since the epoch"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def compact(message: dict) -> dict:
+    """Frame with short field ids and an epoch-ms timestamp"""
+    frame = {}
+    for name, value in message.items():
+        if name == "timestamp" and isinstance(value, str):
+            value = epoch_ms(value)
+        elif name == "users" and isinstance(value, list):
+            value = [compact(entry) if isinstance(entry, dict) else entry for entry in value]
+        frame[FIELD_IDS.get(name, name)] = value
+    return frame
+
+
+def expand(frame: dict) -> dict:
+    """Inbound compact frame back to full field names"""
+    return {FIELD_NAMES.get(short, short): value for short, value in frame.items()}
+
+
+class Codec(ABC):
+    """One wire format, selected per socket by WebSocket subprotocol"""
+
+    subprotocol: Optional[str] = None
+    binary = False
+
+    @abstractmethod
+    def encode(self, message: dict) -> Frame:
+        """Serialize an outbound message"""
+
+    @abstractmethod
+    def decode(self, data: Frame) -> dict:
+        """Parse an inbound frame; raises ValueError when it is malformed"""
+
+    def from_json(self, frame: str) -> Frame:
+        """Re-encode a frame cached in the default JSON format"""
+        return self.encode(json.loads(frame))
+
+
+class JsonCodec(Codec):
+    """Default: JSON with full field names and ISO timestamps"""
+
+    def encode(self, message: dict) -> Frame:
+        return dumps(message)
+
+    def decode(self, data: Frame) -> dict:
+        return as_frame(loads(data))
+
+    def from_json(self, frame: str) -> Frame:
+        return frame
+
+
+class CompactJsonCodec(Codec):
+    subprotocol = "chat.v2.json"
+
+    def encode(self, message: dict) -> Frame:
+        return dumps(compact(message))
+
+    def decode(self, data: Frame) -> dict:
+        return expand(as_frame(loads(data)))
+
+
+class MsgpackCodec(Codec):
+    subprotocol = "chat.v2.msgpack"
+    binary = True
+
+    def encode(self, message: dict) -> Frame:
+        return msgpack.packb(compact(message))
+
+    def decode(self, data: Frame) -> dict:
+        if isinstance(data, str):
+            data = data.encode()
+        try:
+            frame = msgpack.unpackb(data)
+        except Exception as e:
+            raise ValueError(f"Invalid MessagePack frame: {e}")
+        return expand(as_frame(frame))
+
+
+DEFAULT_CODEC = JsonCodec()
+
+CODECS: Dict[str, Codec] = {CompactJsonCodec.subprotocol: CompactJsonCodec()}
+if msgpack is not None:
+    CODECS[MsgpackCodec.subprotocol] = MsgpackCodec()
+
+
+def missing_encoders() -> List[str]:
+    """Optional encoder packages (see requirements.txt) that are not installed"""
+    return [name for name, module in (("orjson", orjson), ("msgpack", msgpack)) if module is None]
+
+
+def negotiate(requested: Iterable[str]) -> Codec:
+    """First subprotocol offered by the client that we support, else JSON"""
+    for subprotocol in requested:
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec
+    return DEFAULT_CODEC
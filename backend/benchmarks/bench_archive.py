@@ -0,0 +1,153 @@
+"""Measure what archiving buys: hot-table size, insert and recent-history speed.
+
+Seeds one channel with N messages spread evenly over --days days in the
+database in DATABASE_URL (a throwaway SQLite file by default), times
+inserts and latest-page history queries, then archives everything older
+than --retention-days with the background archiver and times them again.
+Also reports archiving throughput, segment compression and the latency
+of history pages served from the archive.
+
+Usage: python -m benchmarks.bench_archive [--messages 1000000] [--days 365] [--retention-days 30]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.gettempdir(), 'bench_archive.db')}",
+)
+ARCHIVE_DIR = os.environ.setdefault("ARCHIVE_DIR", os.path.join(tempfile.gettempdir(), "bench_archive"))
+
+from sqlalchemy import func, insert, select, update  # noqa: E402
+from app.core.pagination import encode_cursor  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.models import archive_segment, channel, message, read_marker, user  # noqa: E402,F401
+from app.models.archive_segment import ArchiveSegment  # noqa: E402
+from app.models.channel import Channel  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.archive_store import message_archive  # noqa: E402
+from app.services.archiver import MessageArchiver, archive_session_factory  # noqa: E402
+from app.services.message_service import AsyncMessageService  # noqa: E402
+from benchmarks.schema import reset_schema  # noqa: E402
+
+SEED_BATCH = 10000
+
+
+async def setup(messages, days):
+    await reset_schema()
+    now = datetime.utcnow()
+    step = timedelta(days=days) / messages
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(User), [
+            {"username": f"author{i}", "email": f"author{i}@example.com", "hashed_password": "x"} for i in range(100)
+        ])
+        bench_channel = Channel(name="bench", created_by=1)
+        db.add(bench_channel)
+        await db.flush()
+        for start in range(0, messages, SEED_BATCH):
+            await db.execute(insert(Message), [
+                {
+                    "content": f"message {i} " + "lorem ipsum " * 4,
+                    "user_id": 1 + i % 100,
+                    "channel_id": bench_channel.id,
+                    "created_at": now - timedelta(days=days) + step * i,
+                }
+                for i in range(start, min(start + SEED_BATCH, messages))
+            ])
+        await db.commit()
+        return bench_channel.id
+
+
+async def hot_rows():
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count()).select_from(Message))).scalar()
+
+
+async def time_recent_pages(channel_id, pages=200):
+    """Median ms for the latest page of 50"""
+    timings = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(pages):
+            started = time.perf_counter()
+            await AsyncMessageService.get_channel_messages_page(db, channel_id, 50)
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def time_inserts(channel_id, count=10000, batch=100):
+    """Messages/s for batched inserts, as the message writer does them (rolled back)"""
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        for start in range(0, count, batch):
+            await db.execute(insert(Message), [
+                {"content": f"new {i}", "user_id": 1, "channel_id": channel_id} for i in range(start, start + batch)
+            ])
+            await db.flush()
+        elapsed = time.perf_counter() - started
+        await db.rollback()
+    return count / elapsed
+
+
+async def time_archived_pages(channel_id, pages=50):
+    """Median ms for pages of 50 walking back through the archive, after the first segment read"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(func.min(Message.created_at), func.min(Message.id)).where(Message.channel_id == channel_id)
+        )
+        cursor = encode_cursor(*result.one())
+        timings = []
+        for _ in range(pages):
+            started = time.perf_counter()
+            page, cursor = await AsyncMessageService.get_channel_messages_page(db, channel_id, 50, before=cursor)
+            timings.append((time.perf_counter() - started) * 1000)
+            if cursor is None:
+                break
+    return statistics.median(timings)
+
+
+async def main(messages, days, retention_days):
+    # Keep the bulk statements out of the SQL log
+    async_engine.sync_engine.echo = False
+    shutil.rmtree(ARCHIVE_DIR, ignore_errors=True)
+    channel_id = await setup(messages, days)
+
+    before = (await hot_rows(), await time_recent_pages(channel_id), await time_inserts(channel_id))
+    print(f"before  {before[0]:>9} hot rows  latest page {before[1]:6.2f} ms  inserts {before[2]:8.0f} msg/s")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Channel).where(Channel.id == channel_id).values(retention_days=retention_days))
+        await db.commit()
+    archiver = MessageArchiver(
+        message_archive, archive_session_factory(), batch_size=5000, max_batches=10 ** 9
+    )
+    started = time.perf_counter()
+    moved = await archiver.run()
+    elapsed = time.perf_counter() - started
+    async with AsyncSessionLocal() as db:
+        segments, size = (await db.execute(
+            select(func.count(), func.sum(ArchiveSegment.bytes)).select_from(ArchiveSegment)
+        )).one()
+    raw = sum(len(f"message {i} " + "lorem ipsum " * 4) for i in range(moved))
+    print(f"archive {moved} messages in {elapsed:6.1f}s  {moved / elapsed:8.0f} msg/s  {segments} segments, "
+          f"{size / 1024 / 1024:.1f} MiB on disk ({raw / max(size, 1):.1f}x smaller than the message text)")
+
+    after = (await hot_rows(), await time_recent_pages(channel_id), await time_inserts(channel_id))
+    print(f"after   {after[0]:>9} hot rows  latest page {after[1]:6.2f} ms  inserts {after[2]:8.0f} msg/s")
+    print(f"archived history page {await time_archived_pages(channel_id):6.2f} ms (median, pages of 50)")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--retention-days", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.days, args.retention_days))
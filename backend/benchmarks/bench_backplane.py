@@ -0,0 +1,106 @@
+"""Measure cross-worker delivery latency over the Unix socket backplane.
+
+Starts one publisher and N subscriber processes, each with its own
+UnixSocketBackplane in a temporary directory, publishes a stream of
+envelopes and reports the latency percentiles seen by the subscribers.
+
+Usage: python -m benchmarks.bench_backplane [--workers 4] [--messages 5000] [--rate 2000]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import tempfile
+import time
+
+from app.websocket.backplane import UnixSocketBackplane
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def subscriber(socket_dir, expected, ready, results):
+    async def run():
+        samples = []
+        done = asyncio.Event()
+
+        def deliver(envelope):
+            samples.append((time.time() - envelope["sent_at"]) * 1000)
+            if len(samples) >= expected:
+                done.set()
+
+        backplane = UnixSocketBackplane(deliver, socket_dir, refresh_interval=0.1)
+        await backplane.start()
+        ready.set()
+        try:
+            await asyncio.wait_for(done.wait(), timeout=60)
+        except asyncio.TimeoutError:
+            pass
+        await backplane.stop()
+        results.put(samples)
+
+    asyncio.run(run())
+
+
+async def publish(socket_dir, messages, rate):
+    backplane = UnixSocketBackplane(lambda envelope: None, socket_dir, refresh_interval=0.1)
+    await backplane.start()
+    interval = 1.0 / rate if rate else 0
+    message = {"type": "message", "content": "x" * 64, "username": "bench", "channel_id": 1}
+    for _ in range(messages):
+        await backplane.publish(1, message)
+        if interval:
+            await asyncio.sleep(interval)
+    stats = backplane.get_stats()
+    await backplane.stop()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=2000, help="messages per second, 0 for unthrottled")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as socket_dir:
+        results = multiprocessing.Queue()
+        processes = []
+        for _ in range(args.workers):
+            ready = multiprocessing.Event()
+            process = multiprocessing.Process(
+                target=subscriber, args=(socket_dir, args.messages, ready, results)
+            )
+            process.start()
+            ready.wait()
+            processes.append(process)
+
+        publisher_stats = asyncio.run(publish(socket_dir, args.messages, args.rate))
+        samples = []
+        for _ in processes:
+            samples.extend(results.get())
+        for process in processes:
+            process.join()
+
+    report = {
+        "workers": args.workers,
+        "published": args.messages,
+        "delivered": len(samples),
+        "send_errors": publisher_stats["send_errors"],
+        "latency_ms": {
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+            "max": max(samples, default=0.0),
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
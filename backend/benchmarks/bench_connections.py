@@ -0,0 +1,119 @@
+"""Compare one socket per channel with one multiplexed socket per user.
+
+Connects N users to M channels through a fresh ConnectionManager using
+in-memory websockets, once with a socket per (user, channel) and once with
+a single socket per user subscribed to every channel, and reports sockets
+per user, memory per user (traced allocations, including each socket's
+writer task and queue), connect latency and the time to fan out one
+broadcast per channel. With ``--devices`` every user connects that many
+times (tabs, phones), which should grow memory per socket not at all and
+fan-out time linearly.
+
+Usage: python -m benchmarks.bench_connections [--users 500] [--channels 10] [--devices 1]
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from app.websocket.connection_manager import ConnectionManager
+
+
+class MemoryWebSocket:
+    """Just enough of a websocket to be accepted and written to"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data):
+        self.sent += 1
+
+    async def close(self, code=1000):
+        pass
+
+
+async def connect_all(manager, users, channels, multiplexed, devices):
+    sockets = []
+    timings = []
+    for user_id in [user_id for user_id in range(1, users + 1) for _ in range(devices)]:
+        if multiplexed:
+            started = time.perf_counter()
+            websocket = MemoryWebSocket()
+            await manager.accept(websocket, user_id)
+            for channel_id in range(1, channels + 1):
+                await manager.subscribe(websocket, channel_id)
+            timings.append(time.perf_counter() - started)
+            sockets.append(websocket)
+        else:
+            for channel_id in range(1, channels + 1):
+                started = time.perf_counter()
+                websocket = MemoryWebSocket()
+                await manager.connect(websocket, channel_id, user_id)
+                timings.append(time.perf_counter() - started)
+                sockets.append(websocket)
+    return sockets, timings
+
+
+async def run_mode(users, channels, multiplexed, devices=1):
+    manager = ConnectionManager()
+    await manager.start()
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    sockets, timings = await connect_all(manager, users, channels, multiplexed, devices)
+    await asyncio.sleep(0)  # let every writer task start
+    used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+    tracemalloc.stop()
+
+    message = {"type": "message", "id": 1, "content": "x" * 64, "username": "bench", "user_id": 1}
+    started = time.perf_counter()
+    for channel_id in range(1, channels + 1):
+        await manager.broadcast_to_channel(dict(message, channel_id=channel_id), channel_id)
+    # Every device is in every channel, so each broadcast reaches every device
+    while manager.fanout.stats.frames_sent < users * devices * channels:
+        await asyncio.sleep(0)
+    fanout_ms = (time.perf_counter() - started) * 1000
+
+    stats = manager.get_connection_stats()
+    for websocket in sockets:
+        manager.disconnect_socket(websocket)
+    await manager.stop()
+
+    timings.sort()
+    return {
+        "mode": "multiplexed" if multiplexed else "per-channel",
+        "sockets": len(sockets),
+        "sockets_per_user": stats["max_sockets_per_user"],
+        "kb_per_user": used / users / 1024,
+        "kb_per_socket": used / len(sockets) / 1024,
+        "connect_ms_p50": timings[len(timings) // 2] * 1000,
+        "connect_ms_max": timings[-1] * 1000,
+        "fanout_ms": fanout_ms,
+        "frames_sent": sum(websocket.sent for websocket in sockets),
+    }
+
+
+async def main(users, channels, devices):
+    print(f"{users} users x {channels} channels x {devices} devices")
+    for multiplexed in (False, True):
+        result = await run_mode(users, channels, multiplexed, devices)
+        print(
+            f"  {result['mode']:<12} sockets={result['sockets']:<6} "
+            f"sockets/user={result['sockets_per_user']:<3} "
+            f"memory/user={result['kb_per_user']:.1f} KB  "
+            f"memory/socket={result['kb_per_socket']:.1f} KB  "
+            f"connect p50={result['connect_ms_p50']:.3f} ms max={result['connect_ms_max']:.3f} ms  "
+            f"fan-out={result['fanout_ms']:.1f} ms ({result['frames_sent']} frames)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--devices", type=int, default=1, help="sockets per user (tabs, phones)")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.channels, args.devices))
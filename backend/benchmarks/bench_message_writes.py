@@ -0,0 +1,120 @@
+"""Compare message insert throughput: per-message commit vs batched writer.
+
+Runs C concurrent senders (one per simulated socket) against the database
+in DATABASE_URL, defaulting to a throwaway SQLite file, and reports
+messages per second for both persistence paths.
+
+Usage: python -m benchmarks.bench_message_writes [--messages 5000] [--senders 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.gettempdir(), 'bench_messages.db')}",
+)
+
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.models import channel, message, user  # noqa: E402,F401
+from app.models.channel import Channel  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.schemas.message import MessageCreate  # noqa: E402
+from app.services.message_service import AsyncMessageService  # noqa: E402
+from app.services.message_writer import MessageWriter  # noqa: E402
+from benchmarks.schema import reset_schema  # noqa: E402
+
+
+async def setup():
+    await reset_schema()
+    async with AsyncSessionLocal() as db:
+        bench_user = User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(bench_user)
+        await db.flush()
+        bench_channel = Channel(name="bench", created_by=bench_user.id)
+        db.add(bench_channel)
+        await db.commit()
+        return bench_user.id, bench_channel.id
+
+
+async def run_senders(senders, per_sender, send):
+    async def sender(index):
+        for i in range(per_sender):
+            await send(f"message {index}-{i}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender(index) for index in range(senders)))
+    return time.perf_counter() - started
+
+
+async def per_message_commit(senders, per_sender, user_id, channel_id):
+    # One session per sender, like the WebSocket handler holds per socket
+    sessions = [AsyncSessionLocal() for _ in range(senders)]
+
+    async def sender(index):
+        db = sessions[index]
+        for i in range(per_sender):
+            await AsyncMessageService.create_message(
+                db, MessageCreate(content=f"message {index}-{i}", channel_id=channel_id), user_id
+            )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender(index) for index in range(senders)))
+    elapsed = time.perf_counter() - started
+    for db in sessions:
+        await db.close()
+    return elapsed
+
+
+async def batched(senders, per_sender, user_id, channel_id, interval_ms, batch_size):
+    writer = MessageWriter(flush_interval_ms=interval_ms, max_batch_size=batch_size)
+    await writer.start()
+
+    async def send(content):
+        await writer.write(MessageCreate(content=content, channel_id=channel_id), user_id)
+
+    elapsed = await run_senders(senders, per_sender, send)
+    stats = writer.get_stats()
+    await writer.stop()
+    return elapsed, stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--interval-ms", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    per_sender = max(1, args.messages // args.senders)
+    total = per_sender * args.senders
+
+    user_id, channel_id = await setup()
+    per_message_elapsed = await per_message_commit(args.senders, per_sender, user_id, channel_id)
+    batched_elapsed, writer_stats = await batched(
+        args.senders, per_sender, user_id, channel_id, args.interval_ms, args.batch_size
+    )
+    await async_engine.dispose()
+
+    print(json.dumps({
+        "database": async_engine.url.render_as_string(hide_password=True),
+        "messages": total,
+        "senders": args.senders,
+        "per_message_commit": {
+            "seconds": per_message_elapsed,
+            "messages_per_second": total / per_message_elapsed,
+        },
+        "batched": {
+            "seconds": batched_elapsed,
+            "messages_per_second": total / batched_elapsed,
+            "batches": writer_stats["batches_flushed"],
+        },
+        "speedup": per_message_elapsed / batched_elapsed,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""Measure the latency the rate limiter adds to each socket send.
+
+Runs the same three checks a chat message goes through (per user, per
+channel, per IP) against the in-memory backend, over many distinct keys
+so the bucket map sees realistic churn, and reports the per-decision
+latency next to the cost of serializing one chat frame for reference.
+
+Usage: python -m benchmarks.bench_rate_limit [--decisions 200000] [--users 10000] [--channels 500]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from app.core.rate_limit import MemoryRateLimitBackend, RateLimiter, Rule
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def main(decisions, users, channels):
+    limiter = RateLimiter(
+        MemoryRateLimitBackend(max_keys=100000),
+        {
+            "message_user": Rule.parse("30/10"),
+            "message_channel": Rule.parse("300/10"),
+            "message_ip": Rule.parse("60/10"),
+        },
+    )
+    rng = random.Random(1)
+    keys = [
+        (rng.randrange(users), rng.randrange(channels), f"10.0.{rng.randrange(256)}.{rng.randrange(256)}")
+        for _ in range(decisions)
+    ]
+
+    samples = []
+    started = time.perf_counter()
+    for user_id, channel_id, ip in keys:
+        before = time.perf_counter_ns()
+        await limiter.check(("message_user", user_id), ("message_channel", channel_id), ("message_ip", ip))
+        samples.append(time.perf_counter_ns() - before)
+    elapsed = time.perf_counter() - started
+
+    frame = {
+        "type": "message", "id": 123456, "content": "hello there, how is it going?",
+        "username": "someone", "user_id": 42, "channel_id": 7, "timestamp": "2024-01-01T12:00:00.000000",
+    }
+    encode_started = time.perf_counter_ns()
+    for _ in range(10000):
+        json.dumps(frame)
+    encode_ns = (time.perf_counter_ns() - encode_started) / 10000
+
+    stats = limiter.get_stats()
+    print(f"{decisions} decisions over {users} users / {channels} channels: {decisions / elapsed:,.0f} per second")
+    print(f"  per decision (3 buckets): p50={percentile(samples, 50) / 1000:.2f} us  "
+          f"p99={percentile(samples, 99) / 1000:.2f} us  max={max(samples) / 1000:.1f} us")
+    print(f"  for reference, json.dumps of one chat frame: {encode_ns / 1000:.2f} us")
+    print(f"  allowed={stats['allowed']} limited={stats['limited']} keys={stats['keys']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--decisions", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--channels", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.decisions, args.users, args.channels))
@@ -0,0 +1,110 @@
+"""Chat latency on slow sockets during a join storm, with and without priorities.
+
+Publishes chat messages and user_joined notices to N in-memory websockets
+that take --send-ms per frame, faster than they can drain, through a
+fresh FanoutEngine: once with every frame queued in arrival order (as
+before the scheduler) and once classified, so that chat goes first and
+queued join notices merge into "N users joined" summaries. Reports chat
+delivery latency, chat frames lost to full queues, and how many frames the
+joins took.
+
+Usage: python -m benchmarks.bench_scheduler [--sockets 100] [--duration 5] [--chat-rate 20] [--join-rate 200] [--send-ms 10]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.websocket.fanout import FanoutEngine
+from app.websocket.scheduler import CHAT, classify, coalesce_key
+from app.websocket.wire import DEFAULT_CODEC, loads
+
+
+class SlowWebSocket:
+    """A websocket whose every send takes ``delay`` seconds"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.chat_latencies = []
+        self.chat_frames = 0
+        self.join_frames = 0
+        self.joins = 0
+
+    async def send_text(self, data):
+        await asyncio.sleep(self.delay)
+        frame = loads(data)
+        if frame["type"] == "message":
+            self.chat_frames += 1
+            self.chat_latencies.append(time.perf_counter() - frame["sent_at"])
+        else:
+            self.join_frames += 1
+            self.joins += frame.get("count", 1)
+
+    async def close(self, code=1000):
+        pass
+
+
+async def run_mode(prioritized, sockets, duration, chat_rate, join_rate, send_ms):
+    engine = FanoutEngine(queue_size=64)
+    websockets = [SlowWebSocket(send_ms / 1000) for _ in range(sockets)]
+    for websocket in websockets:
+        engine.register(websocket, DEFAULT_CODEC.encode)
+
+    def publish(message):
+        priority = classify(message) if prioritized else CHAT
+        key = coalesce_key(message, priority) if prioritized else None
+        notice = message if prioritized and priority != CHAT else None
+        engine.publish(DEFAULT_CODEC.encode(message), websockets, key, priority=priority, notice=notice)
+
+    tick = 0.01
+    chats = joins = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        elapsed = time.perf_counter() - started
+        while chats < elapsed * chat_rate:
+            publish({"type": "message", "id": chats, "channel_id": 1, "content": "hello", "sent_at": time.perf_counter()})
+            chats += 1
+        while joins < elapsed * join_rate:
+            publish({
+                "type": "user_joined", "content": f"user{joins} joined the channel",
+                "username": "System", "channel_id": 1,
+            })
+            joins += 1
+        await asyncio.sleep(tick)
+    while engine.queue_depth():
+        await asyncio.sleep(tick)
+    await asyncio.sleep(send_ms / 1000 * 2)
+    for websocket in websockets:
+        engine.unregister(websocket)
+
+    latencies = sorted(latency for websocket in websockets for latency in websocket.chat_latencies)
+    return {
+        "chat_p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "chat_p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+        "chat_lost": chats * sockets - sum(websocket.chat_frames for websocket in websockets),
+        "join_frames": sum(websocket.join_frames for websocket in websockets) / sockets,
+        "joins_shown": sum(websocket.joins for websocket in websockets) / sockets,
+        "joins": joins,
+    }
+
+
+async def main(sockets, duration, chat_rate, join_rate, send_ms):
+    print(f"{sockets} sockets at {send_ms} ms/frame, {chat_rate} chat/s and {join_rate} joins/s for {duration}s")
+    for prioritized in (False, True):
+        stats = await run_mode(prioritized, sockets, duration, chat_rate, join_rate, send_ms)
+        print(
+            f"{'priority' if prioritized else 'fifo':<9} chat p50 {stats['chat_p50_ms']:8.1f} ms  "
+            f"p99 {stats['chat_p99_ms']:8.1f} ms  chat lost {stats['chat_lost']:>6}  "
+            f"join frames/socket {stats['join_frames']:7.1f} for {stats['joins_shown']:.0f} of {stats['joins']} joins"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--chat-rate", type=float, default=20)
+    parser.add_argument("--join-rate", type=float, default=200)
+    parser.add_argument("--send-ms", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.sockets, args.duration, args.chat_rate, args.join_rate, args.send_ms))
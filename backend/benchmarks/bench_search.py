@@ -0,0 +1,148 @@
+"""Measure full-text search latency over a synthetic message corpus.
+
+Loads N messages spread over C channels into the database in
+DATABASE_URL (a throwaway SQLite file by default; point it at PostgreSQL
+to measure the tsvector/GIN path), with words drawn from a Zipf-like
+vocabulary, then times AsyncSearchService for common, mid-frequency, rare
+and two-word queries, first and second page, against an unindexed
+LIKE scan of the same channels.
+
+Usage: python -m benchmarks.bench_search [--messages 1000000] [--channels 50] [--repeat 20]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.gettempdir(), 'bench_search.db')}",
+)
+
+from sqlalchemy import insert, select  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.models import channel, message, user  # noqa: E402,F401
+from app.models.channel import Channel  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.search_service import AsyncSearchService  # noqa: E402
+from benchmarks.schema import reset_schema  # noqa: E402
+
+VOCABULARY_SIZE = 20000
+WORDS_PER_MESSAGE = (4, 24)
+CHUNK = 10000
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def vocabulary():
+    rng = random.Random(7)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    words = sorted(words)
+    # Zipf-like weights: the k-th word is 1/k as frequent as the first
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    return words, cum_weights
+
+
+async def load(messages, channels):
+    await reset_schema()
+
+    words, cum_weights = vocabulary()
+    rng = random.Random(42)
+    async with AsyncSessionLocal() as db:
+        bench_user = User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(bench_user)
+        await db.flush()
+        channel_rows = [Channel(name=f"bench-{i}", created_by=bench_user.id) for i in range(channels)]
+        db.add_all(channel_rows)
+        await db.flush()
+        channel_ids = [c.id for c in channel_rows]
+
+        started = time.perf_counter()
+        for offset in range(0, messages, CHUNK):
+            rows = []
+            for _ in range(min(CHUNK, messages - offset)):
+                count = rng.randint(*WORDS_PER_MESSAGE)
+                rows.append({
+                    "content": " ".join(rng.choices(words, cum_weights=cum_weights, k=count)),
+                    "user_id": bench_user.id,
+                    "channel_id": rng.choice(channel_ids),
+                })
+            await db.execute(insert(Message), rows)
+            await db.commit()
+        elapsed = time.perf_counter() - started
+    print(f"loaded {messages} messages into {channels} channels in {elapsed:.1f}s "
+          f"({messages / elapsed:.0f} msg/s including index maintenance)")
+    return channel_ids, words
+
+
+async def time_search(query, channel_ids, repeat):
+    first, second = [], []
+    async with AsyncSessionLocal() as db:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows, cursor = await AsyncSearchService.search(db, query, channel_ids, 20)
+            first.append((time.perf_counter() - started) * 1000)
+            if cursor:
+                started = time.perf_counter()
+                await AsyncSearchService.search(db, query, channel_ids, 20, cursor)
+                second.append((time.perf_counter() - started) * 1000)
+    return first, second, len(rows)
+
+
+async def time_like_scan(term, channel_ids, repeat):
+    samples = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await db.execute(
+                select(Message.id)
+                .where(Message.channel_id.in_(channel_ids), Message.content.like(f"%{term}%"))
+                .order_by(Message.id.desc())
+                .limit(20)
+            )
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+async def main(messages, channels, repeat):
+    # Keep the corpus load out of the SQL log
+    async_engine.sync_engine.echo = False
+    channel_ids, words = await load(messages, channels)
+    searched = channel_ids[: max(1, len(channel_ids) // 5)]  # a user in a fifth of the channels
+
+    queries = {
+        "common": words[0],
+        "mid": words[len(words) // 100],
+        "rare": words[-1],
+        "two words": f"{words[1]} {words[len(words) // 50]}",
+    }
+    print(f"searching {len(searched)} of {channels} channels, {repeat} runs each (ms)")
+    for label, query in queries.items():
+        first, second, hits = await time_search(query, searched, repeat)
+        line = (f"  {label:<10} page 1 p50={percentile(first, 50):7.2f} p95={percentile(first, 95):7.2f}")
+        if second:
+            line += f"  page 2 p50={percentile(second, 50):7.2f}"
+        like = await time_like_scan(query.split()[0], searched, repeat)
+        line += f"  | LIKE scan p50={percentile(like, 50):7.2f}  ({hits} hits on page 1)"
+        print(line)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.channels, args.repeat))
@@ -0,0 +1,137 @@
+"""Measure bulk import and streaming export throughput on one large channel.
+
+Imports N generated messages (NDJSON, as a client would upload them) into
+a single channel of the database in DATABASE_URL (a throwaway SQLite file
+by default), then exports the channel as NDJSON and CSV through the same
+code the endpoints use, and compares with paging the history API 100
+messages at a time. Reports rows/s for each path and the peak memory
+traced while exporting, which should not grow with N.
+
+Usage: python -m benchmarks.bench_transfer [--messages 2000000] [--authors 100] [--baseline-pages 2000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.gettempdir(), 'bench_transfer.db')}",
+)
+
+from sqlalchemy import insert  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.models import archive_segment, channel, message, read_marker, user  # noqa: E402,F401
+from app.models.channel import Channel, user_channels  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.message_service import AsyncMessageService  # noqa: E402
+from app.services.transfer_service import AsyncTransferService, encode_ndjson, transfers  # noqa: E402
+from benchmarks.schema import reset_schema  # noqa: E402
+
+CHUNK_BYTES = 64 * 1024
+
+
+async def setup(authors):
+    await reset_schema()
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(User), [
+            {"username": f"author{i}", "email": f"author{i}@example.com", "hashed_password": "x"}
+            for i in range(authors)
+        ])
+        bench_channel = Channel(name="bench", created_by=1, member_count=authors)
+        db.add(bench_channel)
+        await db.flush()
+        # Imported messages may only be attributed to members
+        await db.execute(insert(user_channels), [
+            {"user_id": user_id, "channel_id": bench_channel.id} for user_id in range(1, authors + 1)
+        ])
+        await db.commit()
+        return bench_channel.id
+
+
+async def ndjson_body(messages, authors):
+    """The upload, generated CHUNK_BYTES at a time like a streamed request body"""
+    lines = []
+    size = 0
+    for i in range(messages):
+        line = json.dumps({"username": f"author{i % authors}", "content": f"message {i} " + "lorem ipsum " * 4})
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_BYTES:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+            size = 0
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def run_import(channel_id, messages, authors):
+    transfer = transfers.start("import", 1, channel_id, "ndjson")
+    started = time.perf_counter()
+    await AsyncTransferService.import_messages(channel_id, "ndjson", ndjson_body(messages, authors), transfer)
+    elapsed = time.perf_counter() - started
+    assert transfer.status == "completed" and transfer.rows == messages, transfer.to_dict()
+    return elapsed
+
+
+async def run_export(channel_id, format, trace=False):
+    transfer = transfers.start("export", 1, channel_id, format)
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    async for chunk in AsyncTransferService.export_messages(channel_id, format, transfer):
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return transfer.rows, size, elapsed, peak
+
+
+async def run_paging(channel_id, max_pages):
+    """The old way: cursor pages of 100 through the history API (without the HTTP round trips)"""
+    rows = 0
+    cursor = None
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        for _ in range(max_pages):
+            page, cursor = await AsyncMessageService.get_channel_messages_page(db, channel_id, 100, before=cursor)
+            rows += len(page)
+            encode_ndjson(page)
+            if cursor is None:
+                break
+    return rows, time.perf_counter() - started
+
+
+async def main(messages, authors, baseline_pages):
+    # Keep the bulk statements out of the SQL log
+    async_engine.sync_engine.echo = False
+    channel_id = await setup(authors)
+
+    elapsed = await run_import(channel_id, messages, authors)
+    print(f"import  ndjson {messages} rows in {elapsed:6.1f}s  {messages / elapsed:9.0f} rows/s "
+          f"(including index maintenance)")
+    for format in ("ndjson", "csv"):
+        rows, size, elapsed, _ = await run_export(channel_id, format)
+        print(f"export  {format:<6} {rows} rows in {elapsed:6.1f}s  {rows / elapsed:9.0f} rows/s  "
+              f"{size / elapsed / 1024 / 1024:6.1f} MiB/s")
+    rows, size, elapsed, peak = await run_export(channel_id, "ndjson", trace=True)
+    print(f"export  peak traced memory {peak / 1024:.0f} KiB for {size / 1024 / 1024:.0f} MiB streamed")
+    rows, elapsed = await run_paging(channel_id, baseline_pages)
+    print(f"paging  100/page {rows} rows in {elapsed:6.1f}s  {rows / elapsed:9.0f} rows/s "
+          f"({-(-messages // 100)} requests for the whole channel)")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--authors", type=int, default=100)
+    parser.add_argument("--baseline-pages", type=int, default=2000, help="history pages to time for comparison")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.authors, args.baseline_pages))
@@ -0,0 +1,116 @@
+"""Compare WebSocket wire formats: bytes and CPU per broadcast.
+
+Encodes a stream of representative frames (chat messages, presence and
+typing updates) with the legacy stdlib-JSON encoding and every codec in
+app/websocket/wire.py, and reports per frame:
+
+  - bytes on the wire, raw and after permessage-deflate (one compressor
+    per recipient with context takeover, as the extension does);
+  - CPU to serialize once, which happens once per broadcast;
+  - CPU to compress for R recipients, which happens once per socket.
+
+Usage: python -m benchmarks.bench_wire_format [--frames 20000] [--recipients 100] [--level 6]
+"""
+import argparse
+import json
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from app.websocket.wire import CODECS, DEFAULT_CODEC, orjson
+
+
+def sample_frames(count):
+    rng = random.Random(3)
+    words = ["hello", "deploy", "lunch", "standup", "review", "merged", "ship", "thanks", "ok", "later"]
+    now = datetime(2024, 1, 1)
+    frames = []
+    for i in range(count):
+        kind = rng.random()
+        timestamp = (now + timedelta(milliseconds=i * 37)).isoformat()
+        if kind < 0.8:
+            frames.append({
+                "type": "message",
+                "id": 100000 + i,
+                "content": " ".join(rng.choices(words, k=rng.randint(2, 14))),
+                "username": f"user{rng.randint(1, 500)}",
+                "user_id": rng.randint(1, 500),
+                "channel_id": rng.randint(1, 40),
+                "timestamp": timestamp,
+            })
+        elif kind < 0.9:
+            frames.append({
+                "type": "typing",
+                "channel_id": rng.randint(1, 40),
+                "users": [{"user_id": rng.randint(1, 500), "username": "someone"}],
+            })
+        else:
+            frames.append({
+                "type": "presence",
+                "channel_id": rng.randint(1, 40),
+                "users": [{"user_id": rng.randint(1, 500), "status": "away"}],
+            })
+    return frames
+
+
+def as_bytes(frame):
+    return frame if isinstance(frame, bytes) else frame.encode()
+
+
+def deflated_size(encoded, level):
+    """Bytes after permessage-deflate with context takeover on one socket"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    total = 0
+    for data in encoded:
+        # The extension strips the trailing 00 00 ff ff of each sync flush
+        total += len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+    return total
+
+
+def compress_cpu(encoded, recipients, level):
+    compressors = [zlib.compressobj(level, zlib.DEFLATED, -15) for _ in range(recipients)]
+    started = time.process_time()
+    for data in encoded:
+        for compressor in compressors:
+            compressor.compress(data)
+            compressor.flush(zlib.Z_SYNC_FLUSH)
+    return time.process_time() - started
+
+
+def measure(name, encode, frames, recipients, level):
+    started = time.process_time()
+    encoded = [as_bytes(encode(frame)) for frame in frames]
+    encode_seconds = time.process_time() - started
+
+    raw = sum(len(data) for data in encoded)
+    deflated = deflated_size(encoded, level)
+    # Compression CPU grows with recipients; sample a slice to keep this quick
+    sample = encoded[: max(1, len(encoded) // 10)]
+    compress_seconds = compress_cpu(sample, recipients, level) * len(encoded) / len(sample)
+
+    count = len(frames)
+    print(
+        f"  {name:<18} {raw / count:7.1f} B  {deflated / count:7.1f} B deflated  "
+        f"encode {encode_seconds / count * 1e6:6.2f} us  "
+        f"deflate x{recipients} {compress_seconds / count * 1e6:8.1f} us"
+    )
+
+
+def main(frames, recipients, level):
+    frames = sample_frames(frames)
+    print(f"{len(frames)} frames, {recipients} recipients per broadcast, deflate level {level}")
+    print(f"  orjson {'available' if orjson is not None else 'not installed'}")
+    measure("json (stdlib)", json.dumps, frames, recipients, level)
+    measure("json (default)", DEFAULT_CODEC.encode, frames, recipients, level)
+    for subprotocol, codec in CODECS.items():
+        measure(subprotocol, codec.encode, frames, recipients, level)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--recipients", type=int, default=100)
+    parser.add_argument("--level", type=int, default=6)
+    args = parser.parse_args()
+    main(args.frames, args.recipients, args.level)
@@ -0,0 +1,135 @@
+"""Regression check: serving a history page costs a constant number of queries.
+
+Seeds a SQLite database with many authors, then counts the SQL statements
+issued for history pages of different sizes and author mixes, and for
+channel lists (member counts and last message previews included) of
+different lengths. Exits with status 1 if the count grows with the page
+or the list (an N+1 has crept back in).
+
+Usage: python -m benchmarks.check_history_queries
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.gettempdir(), 'check_history.db')}",
+)
+
+from sqlalchemy import event, insert  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.models import archive_segment, channel, message, user  # noqa: E402,F401
+from app.models.channel import Channel, user_channels  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.schemas.message import MessageCreate  # noqa: E402
+from app.services.channel_cache import channel_cache  # noqa: E402
+from app.services.channel_service import AsyncChannelService  # noqa: E402
+from app.services.membership import membership_index  # noqa: E402
+from app.services.message_service import AsyncMessageService  # noqa: E402
+from benchmarks.schema import reset_schema  # noqa: E402
+
+EXPECTED_QUERIES_PER_PAGE = 1
+# Cold caches: the user's memberships, then every listed channel at once
+EXPECTED_QUERIES_PER_CHANNEL_LIST = 2
+
+
+async def seed(authors: int, messages: int) -> int:
+    await reset_schema()
+    async with AsyncSessionLocal() as db:
+        users = [
+            User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="x")
+            for i in range(authors)
+        ]
+        db.add_all(users)
+        await db.flush()
+        history_channel = Channel(name="history", created_by=users[0].id)
+        db.add(history_channel)
+        await db.flush()
+        db.add_all(
+            Message(content=f"message {i}", user_id=users[i % authors].id, channel_id=history_channel.id)
+            for i in range(messages)
+        )
+        await db.commit()
+        return history_channel.id
+
+
+async def seed_channels(count: int) -> int:
+    """A user who belongs to ``count`` channels, each with a last message"""
+    async with AsyncSessionLocal() as db:
+        member = User(username=f"member{count}", email=f"member{count}@example.com", hashed_password="x")
+        db.add(member)
+        await db.flush()
+        channels = [Channel(name=f"list{count}-{i}", created_by=member.id, member_count=1) for i in range(count)]
+        db.add_all(channels)
+        await db.flush()
+        await db.execute(insert(user_channels), [{"user_id": member.id, "channel_id": c.id} for c in channels])
+        await db.commit()
+    for c in channels:
+        async with AsyncSessionLocal() as db:
+            await AsyncMessageService.create_message(
+                db, MessageCreate(content=f"latest in {c.name}", channel_id=c.id), member.id
+            )
+    return member.id
+
+
+async def cold_channel_list(db, user_id: int):
+    membership_index.invalidate(user_id)
+    channel_cache.clear()
+    channels = await AsyncChannelService.get_channels(db, user_id)
+    assert all(c.last_message is not None and c.member_count == 1 for c in channels)
+
+
+async def count_queries(fetch) -> int:
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        async with AsyncSessionLocal() as db:
+            await fetch(db)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    return len(statements)
+
+
+async def main() -> int:
+    channel_id = await seed(authors=100, messages=500)
+    failures = []
+    for limit in (1, 10, 100):
+        cases = {
+            f"offset page, limit={limit}":
+                lambda db: AsyncMessageService.get_channel_messages(db, channel_id, limit, 0),
+            f"cursor page, limit={limit}":
+                lambda db: AsyncMessageService.get_channel_messages_page(db, channel_id, limit),
+        }
+        for name, fetch in cases.items():
+            queries = await count_queries(fetch)
+            print(f"{name}: {queries} queries")
+            if queries != EXPECTED_QUERIES_PER_PAGE:
+                failures.append(name)
+    for count in (1, 10, 50):
+        user_id = await seed_channels(count)
+        name = f"channel list, {count} channels"
+        queries = await count_queries(lambda db: cold_channel_list(db, user_id))
+        print(f"{name}: {queries} queries")
+        if queries != EXPECTED_QUERIES_PER_CHANNEL_LIST:
+            failures.append(name)
+    await async_engine.dispose()
+
+    if failures:
+        print(
+            f"FAIL: expected {EXPECTED_QUERIES_PER_PAGE} query per page and "
+            f"{EXPECTED_QUERIES_PER_CHANNEL_LIST} per channel list for {', '.join(failures)}"
+        )
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
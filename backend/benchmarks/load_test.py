@@ -0,0 +1,430 @@
+"""End-to-end load test of the REST and WebSocket paths.
+
+Starts the API in a subprocess (``python -m app.serve``) against a fresh
+SQLite file, or against ``--database-url`` (e.g. a throwaway Postgres
+database), or drives an already running server with ``--url``. Then:
+
+  1. registers and logs in N users, and creates M channels that the users
+     join (``--channels-per-user`` each, spread round-robin);
+  2. connects one multiplexed socket per user and subscribes it to the
+     user's channels, sampling server memory before and after;
+  3. sends chat messages from random users at ``--rate`` per second for
+     ``--duration`` seconds and waits for every delivery;
+  4. pages through each user's channel history.
+
+Message latency is measured from the scheduled send time to receipt on
+each recipient socket (client and server share the host clock), so a
+server that falls behind cannot hide its queueing by slowing the sender.
+Results, with the commit and settings, are written as JSON; pass
+``--compare`` with an earlier result to print the differences.
+
+Usage: python -m benchmarks.load_test [--users 200] [--channels 20] [--rate 200] [--duration 10] [--output loadtest.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+import websockets
+
+API = "/api/v1"
+LOAD_PREFIX = "lt "
+
+
+def percentiles(samples, scale=1.0):
+    """p50/p95/p99/max of a list of samples, multiplied by ``scale``"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(pct):
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] * scale
+
+    return {
+        "count": len(ordered),
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": ordered[-1] * scale,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes(pid):
+    """Resident memory of a local process (Linux), or None"""
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class Server:
+    """The API running in a child process, with its own database"""
+
+    def __init__(self, database_url, bcrypt_rounds):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.workdir = tempfile.mkdtemp(prefix="chat-loadtest-")
+        self.database_url = database_url or f"sqlite+aiosqlite:///{os.path.join(self.workdir, 'loadtest.db')}"
+        self.env = dict(
+            os.environ,
+            DATABASE_URL=self.database_url,
+            BCRYPT_ROUNDS=str(bcrypt_rounds),
+            # The point is to load the chat path, not to trip the limits
+            RATE_LIMIT_ENABLED="false",
+            # A fresh database gets its schema from the migrations at boot
+            DB_MIGRATE_ON_STARTUP="true",
+        )
+        self.process = None
+
+    async def start(self):
+        log = open(os.path.join(self.workdir, "server.log"), "wb")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "app.serve", "--port", str(self.port)],
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=log,
+        )
+        async with httpx.AsyncClient(base_url=self.url) as client:
+            for _ in range(300):
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"Server exited, see {log.name}")
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+        raise RuntimeError(f"Server did not start, see {log.name}")
+
+    def rss(self):
+        return rss_bytes(self.process.pid) if self.process else None
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class LoadUser:
+    __slots__ = ("name", "token", "channels", "websocket", "reader")
+
+    def __init__(self, name):
+        self.name = name
+        self.token = None
+        self.channels = []
+        self.websocket = None
+        self.reader = None
+
+
+class LoadTest:
+    def __init__(self, args, base_url):
+        self.args = args
+        self.base_url = base_url
+        self.ws_url = base_url.replace("http", "ws", 1) + "/ws"
+        self.run_id = uuid.uuid4().hex[:8]
+        self.rng = random.Random(args.seed)
+        self.users = [LoadUser(f"lt{self.run_id}u{i}") for i in range(args.users)]
+        self.channel_ids = []
+        self.subscribers = {}
+        self.timings = {
+            "register": [], "login": [], "join": [], "history_page": [], "ws_connect": [], "message": [],
+        }
+        self.deliveries = 0
+        self.expected_deliveries = 0
+        self.last_delivery = 0.0
+        self.delivered = asyncio.Event()
+        self.limit = asyncio.Semaphore(args.concurrency)
+
+    async def timed(self, name, request):
+        async with self.limit:
+            started = time.perf_counter()
+            response = await request
+            self.timings[name].append(time.perf_counter() - started)
+        response.raise_for_status()
+        return response
+
+    async def setup_user(self, client, user):
+        password = "load-test-password"
+        await self.timed("register", client.post(
+            f"{API}/auth/register",
+            json={"username": user.name, "email": f"{user.name}@example.com", "password": password},
+        ))
+        response = await self.timed("login", client.post(
+            f"{API}/auth/login", data={"username": user.name, "password": password}
+        ))
+        user.token = response.json()["access_token"]
+
+    async def setup(self, client):
+        await asyncio.gather(*(self.setup_user(client, user) for user in self.users))
+
+        owner = self.users[0]
+        headers = {"Authorization": f"Bearer {owner.token}"}
+        for i in range(self.args.channels):
+            response = await client.post(
+                f"{API}/channels/", json={"name": f"lt{self.run_id}c{i}"}, headers=headers
+            )
+            response.raise_for_status()
+            self.channel_ids.append(response.json()["id"])
+
+        per_user = min(self.args.channels_per_user, len(self.channel_ids))
+        for index, user in enumerate(self.users):
+            user.channels = [self.channel_ids[(index + k) % len(self.channel_ids)] for k in range(per_user)]
+        await asyncio.gather(*(
+            self.timed("join", client.post(
+                f"{API}/channels/{channel_id}/join", headers={"Authorization": f"Bearer {user.token}"}
+            ))
+            for user in self.users
+            for channel_id in user.channels
+            if not (user is owner)
+        ))
+
+    async def connect_user(self, user):
+        async with self.limit:
+            started = time.perf_counter()
+            user.websocket = await websockets.connect(f"{self.ws_url}?token={user.token}", max_size=None)
+            for channel_id in user.channels:
+                await user.websocket.send(json.dumps({"type": "subscribe", "channel_id": channel_id}))
+            pending = set(user.channels)
+            while pending:
+                frame = json.loads(await user.websocket.recv())
+                if frame.get("type") == "subscribed":
+                    pending.discard(frame["channel_id"])
+            self.timings["ws_connect"].append(time.perf_counter() - started)
+        for channel_id in user.channels:
+            self.subscribers[channel_id] = self.subscribers.get(channel_id, 0) + 1
+        user.reader = asyncio.create_task(self.read(user))
+
+    async def read(self, user):
+        try:
+            async for data in user.websocket:
+                received = time.perf_counter_ns()
+                frame = json.loads(data)
+                content = frame.get("content")
+                if frame.get("type") != "message" or not content or not content.startswith(LOAD_PREFIX):
+                    continue
+                self.timings["message"].append((received - int(content.split()[1])) / 1e9)
+                self.deliveries += 1
+                self.last_delivery = time.perf_counter()
+                if self.deliveries >= self.expected_deliveries:
+                    self.delivered.set()
+        except websockets.ConnectionClosed:
+            pass
+
+    async def send_load(self):
+        """Open-loop sender: message i is due at start + i / rate"""
+        total = int(self.args.rate * self.args.duration)
+        interval_ns = int(1e9 / self.args.rate)
+        started_ns = time.perf_counter_ns()
+        late = 0
+        for i in range(total):
+            due_ns = started_ns + i * interval_ns
+            delay = (due_ns - time.perf_counter_ns()) / 1e9
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -0.01:
+                late += 1
+            user = self.rng.choice(self.users)
+            channel_id = self.rng.choice(user.channels)
+            self.expected_deliveries += self.subscribers[channel_id]
+            await user.websocket.send(json.dumps({
+                "type": "message",
+                "channel_id": channel_id,
+                "content": f"{LOAD_PREFIX}{due_ns} {user.name} message {i}",
+            }))
+        return total, late, started_ns
+
+    async def page_history(self, client, user):
+        headers = {"Authorization": f"Bearer {user.token}"}
+        channel_id = self.rng.choice(user.channels)
+        cursor = None
+        for _ in range(self.args.history_pages):
+            params = {"limit": 50}
+            if cursor:
+                params["before"] = cursor
+            response = await self.timed(
+                "history_page", client.get(f"{API}/channels/{channel_id}/messages/history", params=params, headers=headers)
+            )
+            cursor = response.json()["next_cursor"]
+            if not cursor:
+                break
+
+    async def run(self, server=None):
+        limits = httpx.Limits(max_connections=self.args.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=60, limits=limits) as client:
+            setup_started = time.perf_counter()
+            await self.setup(client)
+            setup_seconds = time.perf_counter() - setup_started
+
+            rss_before = server.rss() if server else None
+            await asyncio.gather(*(self.connect_user(user) for user in self.users))
+            # Let the join broadcasts settle before measuring
+            await asyncio.sleep(1)
+            rss_after = server.rss() if server else None
+
+            sent, late, started_ns = await self.send_load()
+            send_seconds = (time.perf_counter_ns() - started_ns) / 1e9
+            try:
+                await asyncio.wait_for(self.delivered.wait(), self.args.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+            delivery_seconds = max(self.last_delivery - started_ns / 1e9, send_seconds)
+
+            await asyncio.gather(*(self.page_history(client, user) for user in self.users))
+            server_stats = (await client.get("/stats")).json()
+
+        for user in self.users:
+            await user.websocket.close()
+            if user.reader is not None:
+                await user.reader
+
+        sockets = len(self.users)
+        return {
+            "setup_seconds": setup_seconds,
+            "rest_ms": {
+                name: percentiles(self.timings[name], 1000)
+                for name in ("register", "login", "join", "history_page")
+            },
+            "websocket": {
+                "connect_ms": percentiles(self.timings["ws_connect"], 1000),
+                "message_latency_ms": percentiles(self.timings["message"], 1000),
+                "messages_sent": sent,
+                "sends_late": late,
+                "send_rate": sent / send_seconds if send_seconds else 0.0,
+                "deliveries": self.deliveries,
+                "expected_deliveries": self.expected_deliveries,
+                "deliveries_per_second": self.deliveries / delivery_seconds if delivery_seconds else 0.0,
+            },
+            "memory": {
+                "rss_before_connect": rss_before,
+                "rss_after_connect": rss_after,
+                "bytes_per_connection": (
+                    (rss_after - rss_before) / sockets if rss_before is not None and rss_after is not None else None
+                ),
+            },
+            "server_stats": server_stats,
+        }
+
+
+COMPARED = (
+    ("websocket", "message_latency_ms", "p50"),
+    ("websocket", "message_latency_ms", "p95"),
+    ("websocket", "message_latency_ms", "p99"),
+    ("websocket", "deliveries_per_second"),
+    ("websocket", "connect_ms", "p95"),
+    ("rest_ms", "login", "p95"),
+    ("rest_ms", "history_page", "p95"),
+    ("memory", "bytes_per_connection"),
+)
+
+
+def lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+
+def compare(baseline, result):
+    print(f"compared with {baseline.get('commit')}:")
+    for path in COMPARED:
+        before, after = lookup(baseline, path), lookup(result, path)
+        if before is None or after is None:
+            continue
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"  {'.'.join(path):<40} {before:12.2f} -> {after:12.2f}  {change}")
+
+
+def summarize(result):
+    ws = result["websocket"]
+    latency = ws["message_latency_ms"]
+    print(f"{result['settings']['users']} users, {result['settings']['channels']} channels, commit {result['commit']}")
+    if latency["count"]:
+        print(f"  message latency: p50={latency['p50']:.2f} ms  p95={latency['p95']:.2f} ms  p99={latency['p99']:.2f} ms")
+    print(f"  delivered {ws['deliveries']}/{ws['expected_deliveries']} "
+          f"({ws['deliveries_per_second']:,.0f}/s) for {ws['messages_sent']} sent, {ws['sends_late']} sent late")
+    for name, stats in result["rest_ms"].items():
+        if stats["count"]:
+            print(f"  {name:<13} p50={stats['p50']:.2f} ms  p95={stats['p95']:.2f} ms  p99={stats['p99']:.2f} ms")
+    per_connection = result["memory"]["bytes_per_connection"]
+    if per_connection is not None:
+        print(f"  server memory per connection: {per_connection / 1024:.1f} KiB")
+
+
+async def main(args):
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        server = Server(args.database_url, args.bcrypt_rounds)
+        await server.start()
+        base_url = server.url
+    try:
+        measurements = await LoadTest(args, base_url).run(server)
+    finally:
+        if server is not None:
+            server.stop()
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "settings": {
+            name: getattr(args, name)
+            for name in ("users", "channels", "channels_per_user", "rate", "duration", "history_pages", "bcrypt_rounds")
+        },
+        "database": "external" if args.url else server.database_url.split("://", 1)[0],
+        **measurements,
+    }
+    with open(args.output, "w") as output:
+        json.dump(result, output, indent=2, default=str)
+    summarize(result)
+    print(f"  results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(json.load(baseline), result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--channels-per-user", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=200, help="messages per second, all users together")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of sending")
+    parser.add_argument("--history-pages", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=50, help="requests and handshakes in flight")
+    parser.add_argument("--drain-timeout", type=float, default=30)
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="for the spawned server")
+    parser.add_argument("--database-url", help="database for the spawned server (default: a new SQLite file)")
+    parser.add_argument("--url", help="test a running server instead of spawning one")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="loadtest.json")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    asyncio.run(main(parser.parse_args()))
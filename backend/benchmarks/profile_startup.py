@@ -0,0 +1,138 @@
+"""Boot-time budget check and import-time profile for an API worker.
+
+Migrates a throwaway SQLite database, then boots the app in fresh
+interpreters: each run imports app.main (under -X importtime) and runs
+the lifespan startup (pool and cache warm-up, background tasks) and
+shutdown. Reports the median import, startup and process-to-ready times
+against the budgets below, plus the slowest imports by cumulative time
+and by top-level package. Exits with status 1 if a budget is exceeded.
+
+Usage: python -m benchmarks.profile_startup [--runs 5] [--top 25] [--output benchmarks/startup_profile.txt]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Milliseconds, median over the runs. Generous for a cold laptop or CI
+# runner; importing app.main must not touch the database at all.
+IMPORT_BUDGET_MS = 2000
+STARTUP_BUDGET_MS = 500
+READY_BUDGET_MS = 3000
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT = """
+import asyncio, json, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def boot():
+    async with app.main.app.router.lifespan_context(app.main.app):
+        ready = time.perf_counter()
+    return ready
+
+ready = asyncio.run(boot())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "phases": app.main.boot_timings,
+}))
+"""
+
+
+def run(env, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", BOOT]
+    started = time.perf_counter()
+    process = subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr[-2000:])
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["process_ms"] = elapsed
+    return result, process.stderr
+
+
+def parse_importtime(stderr):
+    """[(self_us, cumulative_us, module, depth)] from -X importtime output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((int(self_us), int(cumulative_us), name.strip(), depth))
+    return modules
+
+
+def report(results, modules, top):
+    lines = []
+    medians = {key: statistics.median(r[key] for r in results) for key in ("import_ms", "startup_ms", "process_ms")}
+    budgets = {"import_ms": IMPORT_BUDGET_MS, "startup_ms": STARTUP_BUDGET_MS, "process_ms": READY_BUDGET_MS}
+    lines.append(f"Boot of one worker, median of {len(results)} runs (SQLite, python {sys.version.split()[0]})")
+    for key, label in (("import_ms", "import app.main"), ("startup_ms", "lifespan startup"),
+                       ("process_ms", "process start to shutdown")):
+        lines.append(f"  {label:<26} {medians[key]:8.1f} ms   budget {budgets[key]} ms")
+    phases = defaultdict(list)
+    for result in results:
+        for name, value in result["phases"].items():
+            phases[name].append(value)
+    for name, values in phases.items():
+        lines.append(f"    {name:<24} {statistics.median(values):8.1f} ms")
+
+    lines.append("")
+    lines.append(f"Slowest imports by cumulative time (ms), top {top}")
+    for self_us, cumulative_us, name, depth in sorted(modules, key=lambda m: -m[1])[:top]:
+        lines.append(f"  {cumulative_us / 1000:8.1f}  self {self_us / 1000:7.1f}  {'  ' * depth}{name}")
+
+    packages = defaultdict(int)
+    for self_us, _, name, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    lines.append("")
+    lines.append(f"Import time by top-level package (ms, self time summed), top {top}")
+    for package, self_us in sorted(packages.items(), key=lambda p: -p[1])[:top]:
+        lines.append(f"  {self_us / 1000:8.1f}  {package}")
+    failures = [key for key, value in medians.items() if value > budgets[key]]
+    return "\n".join(lines), failures
+
+
+def main(runs, top, output):
+    workdir = tempfile.mkdtemp(prefix="chat-startup-")
+    env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(workdir, 'startup.db')}")
+    env.setdefault("PYTHONPATH", BACKEND_DIR)
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"], cwd=BACKEND_DIR, env=env, check=True,
+        capture_output=True,
+    )
+
+    # One profiled run for the module breakdown (importtime slows it down),
+    # then the timed runs
+    _, stderr = run(env, importtime=True)
+    modules = parse_importtime(stderr)
+    results = [run(env)[0] for _ in range(runs)]
+
+    text, failures = report(results, modules, top)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    if failures:
+        print(f"FAIL: over budget: {', '.join(failures)}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args()
+    sys.exit(main(args.runs, args.top, args.output))
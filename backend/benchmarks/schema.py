@@ -0,0 +1,17 @@
+"""Fresh schema for a benchmark run, built by the migrations as in production."""
+from sqlalchemy import text
+from app.database import Base, async_engine
+from app.models import archive_segment, channel, message, read_marker, user  # noqa: F401
+from app.startup import run_migrations
+
+# Created by the migrations but not part of the model metadata
+UNMAPPED_TABLES = ["messages_fts", "alembic_version"]
+
+
+async def reset_schema():
+    """Drop everything the benchmark may have left behind, then alembic upgrade head"""
+    async with async_engine.begin() as conn:
+        for table in UNMAPPED_TABLES:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        await conn.run_sync(Base.metadata.drop_all)
+    await run_migrations()
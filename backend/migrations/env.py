@@ -0,0 +1,60 @@
+"""Run migrations with the app's async driver (asyncpg or aiosqlite)."""
+import asyncio
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import pool
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.config import settings
+from app.database import Base
+from app.models import archive_segment, channel, message, read_marker, user  # noqa: F401
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logging", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+# Full-text search objects, created by raw DDL in the migrations
+SEARCH_OBJECTS = {"search_vector", "ix_messages_search_vector"}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (name.startswith("messages_fts") or name in SEARCH_OBJECTS)
+
+
+def configure(**options):
+    context.configure(
+        target_metadata=target_metadata,
+        include_object=include_object,
+        # SQLite cannot ALTER most things; batch mode recreates the table
+        render_as_batch=True,
+        compare_type=True,
+        **options,
+    )
+
+
+def run_offline():
+    """Emit the SQL instead of running it: alembic upgrade head --sql"""
+    configure(url=settings.DATABASE_URL, literal_binds=True, dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_sync(connection):
+    configure(connection=connection)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_online():
+    engine = create_async_engine(settings.DATABASE_URL, poolclass=pool.NullPool)
+    async with engine.connect() as connection:
+        await connection.run_sync(run_sync)
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_offline()
+else:
+    asyncio.run(run_online())
@@ -0,0 +1,21 @@
+"""Index for keyset pagination of a channel's history
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 22:31:08.214973
+"""
+from alembic import op
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_messages_channel_created_id', 'messages', ['channel_id', 'created_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_messages_channel_created_id', table_name='messages')
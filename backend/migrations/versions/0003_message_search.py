@@ -0,0 +1,66 @@
+"""Full-text search index on messages
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 22:34:52.670318
+
+A generated tsvector column with a GIN index on PostgreSQL 12+, an FTS5
+table kept in sync by triggers on SQLite. Neither is part of the model
+metadata (see migrations/env.py). Existing messages are indexed too.
+"""
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+SEARCH_POSTGRESQL = [
+    "ALTER TABLE messages ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED",
+    "CREATE INDEX ix_messages_search_vector ON messages USING GIN (search_vector)",
+]
+SEARCH_SQLITE = [
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    # Index any rows already present
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+]
+DROP_POSTGRESQL = [
+    "DROP INDEX IF EXISTS ix_messages_search_vector",
+    "ALTER TABLE messages DROP COLUMN IF EXISTS search_vector",
+]
+DROP_SQLITE = [
+    "DROP TRIGGER IF EXISTS messages_fts_insert",
+    "DROP TRIGGER IF EXISTS messages_fts_delete",
+    "DROP TRIGGER IF EXISTS messages_fts_update",
+    "DROP TABLE IF EXISTS messages_fts",
+]
+
+
+def run(postgresql, sqlite):
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        statements = postgresql
+    elif dialect == 'sqlite':
+        statements = sqlite
+    else:
+        statements = []
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade():
+    run(SEARCH_POSTGRESQL, SEARCH_SQLITE)
+
+
+def downgrade():
+    run(DROP_POSTGRESQL, DROP_SQLITE)
@@ -0,0 +1,58 @@
+"""Channel counters and last-message preview columns
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 22:05:12.530417
+
+Backfills the counters and previews from the existing rows; from then on
+the app keeps them current.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+# Characters kept as a preview, as in app/services/channel_service.py
+PREVIEW_LENGTH = 140
+
+BACKFILL_COUNTS = (
+    "UPDATE channels SET "
+    "member_count = (SELECT count(*) FROM user_channels WHERE user_channels.channel_id = channels.id), "
+    "message_count = (SELECT count(*) FROM messages WHERE messages.channel_id = channels.id), "
+    "last_message_id = (SELECT max(id) FROM messages WHERE messages.channel_id = channels.id)"
+)
+BACKFILL_PREVIEWS = (
+    "UPDATE channels SET "
+    "last_message_user_id = (SELECT user_id FROM messages WHERE messages.id = channels.last_message_id), "
+    f"last_message_preview = (SELECT substr(content, 1, {PREVIEW_LENGTH}) FROM messages "
+    "WHERE messages.id = channels.last_message_id), "
+    "last_message_at = (SELECT created_at FROM messages WHERE messages.id = channels.last_message_id) "
+    "WHERE last_message_id IS NOT NULL"
+)
+
+
+def upgrade():
+    with op.batch_alter_table('channels') as batch_op:
+        batch_op.add_column(sa.Column('member_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('message_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_user_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_preview', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_at', sa.DateTime(), nullable=True))
+
+    op.execute(BACKFILL_COUNTS)
+    op.execute(BACKFILL_PREVIEWS)
+
+
+def downgrade():
+    with op.batch_alter_table('channels') as batch_op:
+        batch_op.drop_column('last_message_at')
+        batch_op.drop_column('last_message_preview')
+        batch_op.drop_column('last_message_user_id')
+        batch_op.drop_column('last_message_id')
+        batch_op.drop_column('message_count')
+        batch_op.drop_column('member_count')
@@ -0,0 +1,46 @@
+"""Read markers, and the (channel_id, id) index unread counts and replay use
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 22:11:47.906154
+
+Existing members start caught up, at their channel's newest message,
+rather than with the whole history unread.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+BACKFILL_MARKERS = (
+    "INSERT INTO read_markers (user_id, channel_id, last_read_message_id, read_count, updated_at) "
+    "SELECT user_channels.user_id, user_channels.channel_id, coalesce(channels.last_message_id, 0), "
+    "channels.message_count, CURRENT_TIMESTAMP "
+    "FROM user_channels JOIN channels ON channels.id = user_channels.channel_id"
+)
+
+
+def upgrade():
+    op.create_index('ix_messages_channel_id_id', 'messages', ['channel_id', 'id'])
+
+    op.create_table(
+        'read_markers',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('channel_id', sa.Integer(), nullable=False),
+        sa.Column('last_read_message_id', sa.Integer(), nullable=False),
+        sa.Column('read_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['channel_id'], ['channels.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id', 'channel_id'),
+    )
+    op.execute(BACKFILL_MARKERS)
+
+
+def downgrade():
+    op.drop_table('read_markers')
+    op.drop_index('ix_messages_channel_id_id', table_name='messages')
@@ -0,0 +1,48 @@
+"""Channel retention policies and the archive segment manifest
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 21:12:05.418230
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('channels') as batch_op:
+        batch_op.add_column(sa.Column('retention_days', sa.Integer(), nullable=True))
+        batch_op.add_column(
+            sa.Column('retention_mode', sa.String(), server_default='archive', nullable=False)
+        )
+
+    op.create_table(
+        'archive_segments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('channel_id', sa.Integer(), nullable=False),
+        sa.Column('path', sa.String(), nullable=False),
+        sa.Column('first_message_id', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=False),
+        sa.Column('oldest_at', sa.DateTime(), nullable=False),
+        sa.Column('newest_at', sa.DateTime(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('bytes', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['channel_id'], ['channels.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('path'),
+    )
+    op.create_index('ix_archive_segments_channel_newest', 'archive_segments', ['channel_id', 'newest_at'])
+
+
+def downgrade():
+    op.drop_index('ix_archive_segments_channel_newest', table_name='archive_segments')
+    op.drop_table('archive_segments')
+    with op.batch_alter_table('channels') as batch_op:
+        batch_op.drop_column('retention_mode')
+        batch_op.drop_column('retention_days')
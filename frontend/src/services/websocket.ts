@@ -6,6 +6,7 @@ class WebSocketService {
   private reconnectAttempts: number = 0;
   private maxReconnectAttempts: number = 5;
   private reconnectDelay: number = 3000;
+  private lastMessageId: number | null = null;
 
   connect(
     channelId: number,
@@ -15,7 +16,9 @@ class WebSocketService {
     onClose?: () => void,
     onError?: (error: Event) => void
   ) {
-    const wsUrl = `${this.url}/${channelId}?token=${token}`;
+    // On reconnect, ask the server to replay what we missed
+    const resume = this.reconnectAttempts > 0 && this.lastMessageId !== null;
+    const wsUrl = `${this.url}/${channelId}?token=${token}` + (resume ? `&last_id=${this.lastMessageId}` : '');
     this.ws = new WebSocket(wsUrl);
 
     this.ws.onopen = () => {
@@ -27,6 +30,9 @@ class WebSocketService {
     this.ws.onmessage = (event) => {
       try {
         const message: WebSocketMessage = JSON.parse(event.data);
+        if (message.type === 'message' && message.id !== undefined) {
+          this.lastMessageId = message.id;
+        }
         onMessage(message);
       } catch (error) {
         console.error('Failed to parse message:', error);
@@ -54,6 +60,7 @@ class WebSocketService {
   }
 
   disconnect() {
+    this.lastMessageId = null;
     if (this.ws) {
       this.ws.close();
       this.ws = null;
@@ -24,7 +24,7 @@ export interface Message {
 }
 
 export interface WebSocketMessage {
-  type: 'message' | 'user_joined' | 'user_left';
+  type: 'message' | 'user_joined' | 'user_left' | 'replay_complete';
   id?: number;
   content: string;
   username: string;